@@ -1,6 +1,7 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response, stream_with_context
 from flask_cors import CORS
 import subprocess
+import asyncio
 import psutil
 import os
 import json
@@ -11,20 +12,392 @@ import logging
 import signal
 import sys
 import socket
+import select
+import tempfile
+import ctypes
+import ctypes.util
 import platform
+import math
+import bisect
+import re
+import struct
+import copy
+import hashlib
+import uuid
+import zlib
+import mmap
+import queue
+from array import array
+from collections import deque
+from itertools import islice
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for frontend communication
-
-# Global storage for running processes
-running_processes = {}
+CORS(app, expose_headers=['ETag', 'X-State-Version', 'Location'])  # Enable CORS for frontend communication
 
 # Configuration file path
 CONFIG_FILE = 'apps_config.json'
+CONFIG_SAVE_DELAY = 0.5                 # saves within this window are coalesced into one write
+CONFIG_POLL_INTERVAL = 1.0              # change checks where inotify is not available
+CONFIG_RELOAD_DELAY = 0.2               # settle time after an external edit before reading it
+
+# Background sampling intervals (seconds)
+CPU_SAMPLE_INTERVAL = 1.0
+MEMORY_SAMPLE_INTERVAL = 1.0
+GPU_SAMPLE_INTERVAL = 2.0
+NVML_REINIT_INTERVAL = 30.0             # minimum time between NVML session restarts after errors
+# Without pynvml, keep long-lived nvidia-smi --loop-ms readers instead of
+# spawning nvidia-smi on every sampler tick
+NVIDIA_SMI_STREAMING = True
+DISK_SAMPLE_INTERVAL = 10.0
+PROCESS_COUNT_SAMPLE_INTERVAL = 5.0
+APP_RESOURCES_SAMPLE_INTERVAL = 2.0
+
+# In-memory metrics history: one row every HISTORY_INTERVAL seconds,
+# HISTORY_CAPACITY rows (24 h at 2 s) for at most HISTORY_MAX_SERIES series
+HISTORY_INTERVAL = 2.0
+HISTORY_CAPACITY = 43200
+HISTORY_MAX_SERIES = 256
+HISTORY_DEFAULT_POINTS = 300
+NAN = float('nan')
+
+# On-disk metrics store: (tier, resolution s, rows per segment, retention s)
+METRICS_STORE_DIR = 'metrics_store'
+STORE_TIERS = [
+    ('1s', 1, 3600, 2 * 86400),
+    ('1m', 60, 1440, 30 * 86400),
+    ('1h', 3600, 720, 365 * 86400),
+]
+STORE_FLUSH_INTERVAL = 5.0
+STORE_SWEEP_INTERVAL = 3600.0
+STORE_QUEUE_SIZE = 10000
+STORE_MAX_QUERY_ROWS = 5000
+
+# Server-sent event stream (/api/stream)
+STREAM_TOPICS = ('metrics', 'apps', 'app_state', 'operations')
+STREAM_MAX_CLIENTS = 64
+STREAM_QUEUE_SIZE = 64
+STREAM_HEARTBEAT_INTERVAL = 15.0
+
+# Number of removed documents remembered for ?since= delta responses
+VERSIONED_MAX_REMOVED = 1000
+
+# Hostname/IP lookups are cached this long (seconds)
+SERVER_INFO_TTL = 60.0
+
+# Stopping apps: SIGTERM (CTRL_BREAK on Windows) to the whole process group,
+# then SIGKILL after the grace period; shutdown stops all apps concurrently
+STOP_GRACE_PERIOD = 5.0
+STOP_KILL_TIMEOUT = 2.0
+SHUTDOWN_TIMEOUT = 10.0
+
+# Asynchronous operations such as restarts (/api/operations)
+OPERATIONS_MAX = 200
+PORT_RELEASE_TIMEOUT = 15.0
+PORT_POLL_INTERVAL = 0.05
+BATCH_DEFAULT_PARALLEL = 8              # /api/apps/batch transitions running at once
+BATCH_MAX_PARALLEL = 64
+DEPENDENCY_POLL_INTERVAL = 0.1          # readiness checks while a batch waits for dependencies
+
+# Readiness probing of app ports (config keys 'probe': http/tcp/none, 'probe_path')
+PROBE_HOST = '127.0.0.1'
+PROBE_TIMEOUT = 2.0                     # per connect and per HTTP response
+PROBE_MAX_RESPONSE = 1024 * 1024       # bytes of a probe's HTTP response that are read
+PROBE_INITIAL_DELAY = 0.1               # probes of a starting app back off from here...
+PROBE_MAX_DELAY = 5.0                   # ...up to this
+PROBE_BACKOFF_FACTOR = 1.5
+PROBE_READY_INTERVAL = 10.0             # TCP health checks once an app is ready
+PROBE_FAILURE_THRESHOLD = 3             # consecutive failures before a ready app is unhealthy
+PROBE_STARTUP_TIMEOUT = 600.0           # starting apps become unhealthy after this
+LAUNCH_HISTORY_SIZE = 20                # launches with startup timings kept per app
+DEPENDENCY_READY_TIMEOUT = PROBE_STARTUP_TIMEOUT  # how long dependents wait for a dependency
+
+# Python environments apps run in (/api/environments)
+CONDA_ROOT_NAMES = ('miniconda3', 'anaconda3', 'miniforge3', 'mambaforge', 'micromamba', 'miniconda', 'anaconda')
+CONDA_ENVIRONMENTS_TXT = os.path.join(os.path.expanduser('~'), '.conda', 'environments.txt')
+
+# Application output capture
+LOGS_DIR = 'logs'
+LOG_RING_BYTES = 1024 * 1024            # in-memory tail kept per app
+LOG_SEGMENT_BYTES = 64 * 1024 * 1024    # on-disk segments are rotated at this size
+LOG_MAX_SEGMENTS = 32                   # per app, oldest segments are deleted first
+LOG_MAX_LINE = 16384                    # longer lines (e.g. progress bars) are split
+LOG_READ_CHUNK = 65536
+LOG_QUEUE_SIZE = 20000
+LOG_FLUSH_INTERVAL = 1.0
+LOG_DEFAULT_READ_BYTES = 64 * 1024      # /api/apps/<id>/logs page size
+LOG_MAX_READ_BYTES = 1024 * 1024
+LOG_FOLLOW_MAX_CLIENTS = 32
+LOG_INDEX_BLOCK_BYTES = 16384           # lines are indexed in blocks of about this size
+LOG_INDEX_BLOOM_BITS = 8192             # per-block bloom filter of word tokens
+LOG_SEARCH_DEFAULT_LIMIT = 100
+LOG_SEARCH_MAX_LIMIT = 1000
+LOG_SEARCH_MAX_SCAN_BYTES = 256 * 1024 * 1024  # raw log bytes read per search page
+
+def atomic_write(path, text):
+    """Replace a file so readers see either the old or the new content, never a partial write"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(temp_path, os.stat(path).st_mode & 0o777)
+        except FileNotFoundError:
+            os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    if os.name != 'nt':
+        # Make the rename itself durable
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class ConfigStore:
+    """Persistence of apps_config.json.
+    
+    save() only snapshots the configuration; a writer thread writes it at
+    most once per delay, so a burst of edits becomes a single write. Writes
+    go through atomic_write(), keeping the previous content as a .backup.
+    A watcher thread follows the file with inotify where available (mtime
+    polling elsewhere) and hands edits made outside the manager to the
+    listeners; the manager's own writes are recognized by their content and
+    ignored.
+    """
+    
+    # inotify(7) event bits
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    
+    def __init__(self, path=CONFIG_FILE, delay=CONFIG_SAVE_DELAY):
+        self.path = path
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pending = None  # JSON text waiting to be written
+        self._pending_count = 0
+        self._due = None
+        self._disk_text = None  # content last read from or written to the file
+        self._valid_text = None  # last content that parsed, kept as the .backup
+        self._listeners = []
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._threads = []
+    
+    def add_listener(self, func):
+        """Call func(configs) with the new content whenever the file is edited externally"""
+        self._listeners.append(func)
+    
+    def load(self):
+        """Read and parse the file; raises OSError or ValueError"""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        configs = self._parse(text)
+        with self._lock:
+            self._disk_text = self._valid_text = text
+        return configs
+    
+    @staticmethod
+    def _parse(text):
+        configs = json.loads(text)
+        if not isinstance(configs, dict) or not all(isinstance(config, dict) for config in configs.values()):
+            raise ValueError('expected an object of app configurations')
+        return configs
+    
+    def start(self):
+        if self._threads:
+            return
+        self._stop_event.clear()
+        for target, name in ((self._write_loop, 'config-writer'), (self._watch_loop, 'config-watcher')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    def stop(self):
+        """Stop the threads and write whatever is still pending"""
+        self._stop_event.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+        self.flush()
+    
+    def save(self, configs):
+        """Snapshot configs for writing; written within delay seconds, or right away if not started"""
+        text = json.dumps(configs, indent=4)
+        with self._lock:
+            self._pending = text
+            self._pending_count = len(configs)
+            if self._due is None:
+                self._due = time.monotonic() + self.delay
+        if self._threads:
+            self._wake.set()
+        else:
+            self.flush()
+    
+    def flush(self):
+        """Write the pending snapshot now"""
+        with self._write_lock:
+            with self._lock:
+                text, self._pending, self._due = self._pending, None, None
+                count = self._pending_count
+                previous, backup = self._disk_text, self._valid_text
+                if text is None or text == previous:
+                    return
+                # Set before the rename so the watcher recognizes the write as ours
+                self._disk_text = text
+            try:
+                if backup is not None:
+                    atomic_write(f"{self.path}.backup", backup)
+                atomic_write(self.path, text)
+            except OSError as e:
+                with self._lock:
+                    self._disk_text = previous
+                logger.error(f"Failed to save app configurations: {e}")
+                return
+            with self._lock:
+                self._valid_text = text
+        
+        try:
+            hostname = socket.gethostname()
+        except Exception:
+            hostname = platform.node()
+        logger.info(f"Saved {count} app configurations to {self.path} for server: {hostname}")
+    
+    def _write_loop(self):
+        while not self._stop_event.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            with self._lock:
+                due = self._due
+            if due is None:
+                continue
+            # Let the rest of a burst of edits land in the same write
+            if self._stop_event.wait(max(due - time.monotonic(), 0)):
+                break
+            self.flush()
+    
+    # Watching for external edits
+    
+    def _open_inotify(self):
+        """inotify fd watching the config file's directory, or None where unavailable"""
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+            # Watch the directory: atomic saves (ours or an editor's) replace the file's inode
+            directory = os.path.dirname(os.path.abspath(self.path))
+            mask = self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+            if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+                error = ctypes.get_errno()
+                os.close(fd)
+                raise OSError(error, 'inotify_add_watch failed')
+            return fd
+        except (OSError, AttributeError) as e:
+            logger.info(f"inotify not available ({e}), polling {self.path} for changes")
+            return None
+    
+    def _inotify_changed(self, fd, timeout):
+        """Wait up to timeout for events concerning the config file"""
+        ready, _, _ = select.select([fd], [], [], timeout)
+        if not ready:
+            return False
+        name = os.fsencode(os.path.basename(self.path))
+        changed = False
+        try:
+            while True:
+                data = os.read(fd, 65536)
+                position = 0
+                while position + 16 <= len(data):
+                    _, _, _, length = struct.unpack_from('iIII', data, position)
+                    event_name = data[position + 16:position + 16 + length].rstrip(b'\0')
+                    changed = changed or event_name == name
+                    position += 16 + length
+        except BlockingIOError:
+            pass
+        return changed
+    
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size, st.st_ino
+        except OSError:
+            return None
+    
+    def _watch_loop(self):
+        fd = self._open_inotify()
+        signature = self._file_signature()
+        try:
+            while not self._stop_event.is_set():
+                if fd is not None:
+                    changed = self._inotify_changed(fd, CONFIG_POLL_INTERVAL)
+                else:
+                    self._stop_event.wait(CONFIG_POLL_INTERVAL)
+                    current = self._file_signature()
+                    changed, signature = current != signature, current
+                if changed and not self._stop_event.wait(CONFIG_RELOAD_DELAY):
+                    # Editors may write in several steps; read once they are done
+                    if fd is not None:
+                        self._inotify_changed(fd, 0)
+                    self._reload()
+        finally:
+            if fd is not None:
+                os.close(fd)
+    
+    def _reload(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except FileNotFoundError:
+            logger.warning(f"{self.path} was removed, keeping the current configuration")
+            return
+        except OSError as e:
+            logger.error(f"Could not read {self.path}: {e}")
+            return
+        
+        with self._lock:
+            if text == self._disk_text:
+                return  # our own write, or no actual change
+            self._disk_text = text
+        try:
+            configs = self._parse(text)
+        except ValueError as e:
+            logger.error(f"Ignoring invalid {self.path}: {e}")
+            return
+        
+        with self._lock:
+            self._valid_text = text
+            if self._pending is not None:
+                logger.warning(f"{self.path} was edited externally, discarding unsaved changes")
+            self._pending = self._due = None
+        logger.info(f"{self.path} was edited externally, applying the changes")
+        for listener in self._listeners:
+            try:
+                listener(configs)
+            except Exception as e:
+                logger.error(f"Config change listener failed: {e}")
+
+
+config_store = ConfigStore()
 
 def load_app_configs():
     """Load app configurations from file, or create default for this server"""
@@ -38,8 +411,8 @@ def load_app_configs():
     if os.path.exists(CONFIG_FILE):
         # Load existing configuration
         try:
-            with open(CONFIG_FILE, 'r') as f:
-                app_configs = json.load(f)
+            app_configs = config_store.load()
+            drop_invalid_dependencies(app_configs)
             logger.info(f"Loaded app configurations from {CONFIG_FILE}")
             logger.info(f"Found {len(app_configs)} apps configured for server: {hostname}")
         except Exception as e:
@@ -106,269 +479,715 @@ def load_app_configs():
         # Save the initial configuration
         save_app_configs()
 
+def app_dependencies(config):
+    """App ids an app depends on; 'depends_on' may be a single id or a list"""
+    depends_on = config.get('depends_on') or []
+    return [depends_on] if isinstance(depends_on, str) else list(depends_on)
+
+def dependency_error(configs):
+    """First problem with the depends_on fields of configs as (app_id, message), or None"""
+    for app_id, config in configs.items():
+        if not isinstance(config.get('depends_on') or [], (str, list)):
+            return app_id, f"depends_on of {app_id} must be an app id or a list of app ids"
+        for dependency in app_dependencies(config):
+            if not isinstance(dependency, str) or dependency not in configs:
+                return app_id, f"{app_id} depends on unknown app {dependency}"
+    
+    # Depth-first search; reaching an app that is still on the path closes a cycle
+    visited = {}  # app_id -> True while on the path, False when done
+    for root in configs:
+        if root in visited:
+            continue
+        path = [root]
+        visited[root] = True
+        pending = [iter(app_dependencies(configs[root]))]
+        while pending:
+            dependency = next(pending[-1], None)
+            if dependency is None:
+                visited[path.pop()] = False
+                pending.pop()
+            elif visited.get(dependency):
+                cycle = path[path.index(dependency):] + [dependency]
+                return dependency, f"Dependency cycle: {' -> '.join(cycle)}"
+            elif dependency not in visited:
+                visited[dependency] = True
+                path.append(dependency)
+                pending.append(iter(app_dependencies(configs[dependency])))
+    return None
+
+def drop_invalid_dependencies(configs):
+    """Remove broken depends_on fields, so a bad config file cannot block every start"""
+    error = dependency_error(configs)
+    while error is not None:
+        app_id, message = error
+        logger.error(f"{message}; ignoring depends_on of {app_id}")
+        configs[app_id].pop('depends_on', None)
+        error = dependency_error(configs)
+
+def dependency_levels(configs, app_ids=None, include_dependencies=False):
+    """Group apps into levels that only depend on apps in earlier levels.
+    
+    With include_dependencies the dependencies of app_ids (transitively)
+    are added. Raises ValueError if the apps have a dependency cycle.
+    """
+    selected = list(configs) if app_ids is None else list(app_ids)
+    if include_dependencies:
+        seen = set(selected)
+        pending = list(selected)
+        while pending:
+            for dependency in app_dependencies(configs[pending.pop()]):
+                if dependency in configs and dependency not in seen:
+                    seen.add(dependency)
+                    selected.append(dependency)
+                    pending.append(dependency)
+    
+    # Kahn's algorithm, keeping the requested order within a level
+    chosen = set(selected)
+    waiting = {app_id: set(app_dependencies(configs[app_id])) & chosen for app_id in selected}
+    levels = []
+    while waiting:
+        level = [app_id for app_id in selected if app_id in waiting and not waiting[app_id]]
+        if not level:
+            raise ValueError(f"Dependency cycle between {', '.join(sorted(waiting))}")
+        levels.append(level)
+        for app_id in level:
+            del waiting[app_id]
+        for dependencies in waiting.values():
+            dependencies.difference_update(level)
+    return levels
+
+# app_configs is read from request, sampler and supervisor threads without
+# locking, so it is never mutated in place: writers build a new dict and
+# publish it with a single assignment. The lock only serializes writers.
+app_configs_lock = threading.Lock()
+
+def update_app_configs(changes=None, removed=()):
+    """Replace app_configs by a copy with changes (app_id -> config) applied and removed apps dropped"""
+    global app_configs
+    with app_configs_lock:
+        configs = {app_id: config for app_id, config in app_configs.items() if app_id not in removed}
+        configs.update(changes or {})
+        app_configs = configs
+
 def save_app_configs():
-    """Save current app configurations to file"""
+    """Save current app configurations to file (atomically, coalesced by the config store)"""
     try:
-        # Create backup of existing config
-        if os.path.exists(CONFIG_FILE):
-            backup_file = f"{CONFIG_FILE}.backup"
-            import shutil
-            shutil.copy2(CONFIG_FILE, backup_file)
-            logger.info(f"Backed up existing config to {backup_file}")
-        
-        # Save current config
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(app_configs, f, indent=4)
-        
-        try:
-            hostname = socket.gethostname()
-        except Exception:
-            hostname = platform.node()
-            
-        logger.info(f"Saved {len(app_configs)} app configurations to {CONFIG_FILE} for server: {hostname}")
-        
+        config_store.save(app_configs)
     except Exception as e:
         logger.error(f"Failed to save app configurations: {e}")
 
 # Load configurations at startup
 load_app_configs()
 
-class SystemMonitor:
-    def __init__(self):
-        self.gpu_available = self._check_gpu_availability()
+class NvidiaSmiStream:
+    """Long-lived ``nvidia-smi --query-... --loop-ms`` reader.
     
-    def get_process_gpu_usage(self, pid):
-        """Get GPU usage for a specific process"""
+    A reader thread parses the CSV stream incrementally. Every query loop
+    is prefixed with its timestamp, which is how rows are grouped into
+    batches; the latest complete batch is kept as an in-memory table that
+    the collector reads without spawning anything.
+    """
+    
+    RESTART_BACKOFF = 10.0
+    
+    def __init__(self, query, fields, loop_ms):
+        self.args = [
+            'nvidia-smi',
+            f'--{query}=timestamp,' + ','.join(fields),
+            '--format=csv,noheader,nounits',
+            f'--loop-ms={loop_ms}'
+        ]
+        self.loop_seconds = loop_ms / 1000.0
+        self._process = None
+        self._lock = threading.Lock()
+        self._rows = None  # latest complete batch, None until the first one
+        self._pending = []
+        self._pending_stamp = None
+        self._pending_since = 0.0
+        self._started_at = 0.0
+        self._last_line_at = 0.0
+        self._restart_at = 0.0
+    
+    def is_running(self):
+        return self._process is not None and self._process.poll() is None
+    
+    def start(self):
+        """Start nvidia-smi if it is not running; returns whether it is running"""
+        if self.is_running():
+            return True
+        if time.monotonic() < self._restart_at:
+            return False
         try:
-            if not self.gpu_available:
-                return None
-                
-            # Try using pynvml first
+            self._process = subprocess.Popen(
+                self.args,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                bufsize=1
+            )
+        except OSError as e:
+            logger.warning(f"Could not start nvidia-smi stream: {e}")
+            self._restart_at = time.monotonic() + self.RESTART_BACKOFF
+            return False
+        
+        with self._lock:
+            self._rows, self._pending, self._pending_stamp = None, [], None
+            self._started_at = time.monotonic()
+            self._last_line_at = 0.0
+        reader = threading.Thread(target=self._read, args=(self._process,), name='nvidia-smi-stream')
+        reader.daemon = True
+        reader.start()
+        return True
+    
+    def stop(self):
+        process = self._process
+        self._process = None
+        if process is not None and process.poll() is None:
+            process.terminate()
             try:
-                import pynvml
-                pynvml.nvmlInit()
-                device_count = pynvml.nvmlDeviceGetCount()
-                
-                for i in range(device_count):
-                    handle = pynvml.nvmlDeviceGetHandleByIndex(i)
-                    processes = pynvml.nvmlDeviceGetGraphicsRunningProcesses(handle)
-                    
-                    for proc in processes:
-                        if proc.pid == pid:
-                            # Get memory usage for this process
-                            memory_used = proc.usedGpuMemory
-                            # Unfortunately, pynvml doesn't give us per-process GPU utilization
-                            # We can only get total GPU utilization
-                            utilization = pynvml.nvmlDeviceGetUtilizationRates(handle)
-                            return {
-                                'memory_mb': memory_used / (1024 * 1024),
-                                'utilization_percent': utilization.gpu  # This is total GPU, not per-process
-                            }
-                            
-            except ImportError:
-                # Fall back to nvidia-smi
-                try:
-                    import subprocess
-                    result = subprocess.run([
-                        'nvidia-smi', 
-                        '--query-compute-apps=pid,used_memory',
-                        '--format=csv,noheader,nounits'
-                    ], capture_output=True, text=True, check=True)
-                    
-                    for line in result.stdout.strip().split('\n'):
-                        if line.strip():
-                            parts = line.split(',')
-                            if len(parts) >= 2 and int(parts[0].strip()) == pid:
-                                memory_mb = float(parts[1].strip())
-                                return {
-                                    'memory_mb': memory_mb,
-                                    'utilization_percent': None  # Can't get per-process utilization easily
-                                }
-                except Exception:
-                    pass
-                    
-        except Exception as e:
-            logger.debug(f"Could not get GPU usage for PID {pid}: {e}")
-            
-        return None
+                process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    
+    def rows(self):
+        """Latest complete batch of CSV rows (timestamp stripped).
         
-    def _check_gpu_availability(self):
-        """Check if GPU monitoring is available"""
+        Returns None while the stream is down or its first batch is still
+        incomplete, so the caller can fall back to a one-shot query.
+        """
+        if not self.is_running():
+            return None
+        now = time.monotonic()
+        with self._lock:
+            if not self._last_line_at:
+                # An idle process query legitimately prints nothing at all
+                return [] if now - self._started_at > self.loop_seconds * 2.5 else None
+            if now - self._last_line_at > self.loop_seconds * 2.5:
+                # nvidia-smi prints nothing for a loop with no rows (e.g. no GPU processes)
+                return []
+            if self._pending and now - self._pending_since >= self.loop_seconds / 2:
+                # A loop's rows arrive together, so a quiet pending batch is complete
+                self._rows = list(self._pending)
+            return self._rows
+    
+    def _read(self, process):
+        for line in process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            stamp, _, row = line.partition(',')
+            now = time.monotonic()
+            with self._lock:
+                if stamp != self._pending_stamp:
+                    if self._pending_stamp is not None:
+                        self._rows = self._pending
+                    self._pending = []
+                    self._pending_stamp = stamp
+                    self._pending_since = now
+                if row:
+                    self._pending.append(row)
+                self._last_line_at = now
+        
+        logger.warning(f"nvidia-smi stream exited with code {process.wait()}")
+        self._restart_at = time.monotonic() + self.RESTART_BACKOFF
+
+
+class GpuCollector:
+    """Owns the GPU monitoring session.
+    
+    NVML is initialized once and device handles are cached for the lifetime of
+    the collector. Each collect() call queries every device in one batch and
+    takes a single pass over the compute and graphics process lists, publishing
+    a list of device records and a PID -> usage map, so per-app lookups are
+    plain dict reads. Without pynvml a single nvidia-smi query per tick is used
+    instead.
+    """
+    
+    SMI_GPU_FIELDS = [
+        'index', 'name', 'uuid', 'utilization.gpu', 'utilization.memory',
+        'memory.used', 'memory.total', 'temperature.gpu', 'power.draw',
+        'power.limit', 'clocks.gr', 'clocks.sm', 'clocks.mem'
+    ]
+    
+    SMI_PROCESS_FIELDS = ['pid', 'used_memory', 'gpu_uuid']
+    
+    def __init__(self, streaming=NVIDIA_SMI_STREAMING, loop_ms=int(GPU_SAMPLE_INTERVAL * 1000)):
+        self.backend = None
+        self._nvml = None
+        self._handles = []
+        self._smi_uuid_index = {}
+        self._device_stream = None
+        self._process_stream = None
+        # Per-device timestamp cursors for NVML process-utilization sampling
+        self._util_cursors = {}
+        self._util_unsupported = set()
+        self._nvml_failed_at = None  # monotonic time of the last failed device query
+        # Latest per-device records, see _device_record()
+        self.devices = []
+        # PID -> {'device': index, 'memory_mb': float, 'utilization_percent': float,
+        #         'utilization_source': 'process' | 'device', 'engines': dict | None}
+        self.process_usage = {}
+        self._streaming = streaming
+        self._loop_ms = loop_ms
+        self._init_backend()
+    
+    @property
+    def available(self):
+        return self.backend is not None
+    
+    def _init_backend(self):
         try:
             # Try importing pynvml first (most accurate)
             import pynvml
             pynvml.nvmlInit()
-            return True
+            self._nvml = pynvml
+            self._handles = [pynvml.nvmlDeviceGetHandleByIndex(i)
+                             for i in range(pynvml.nvmlDeviceGetCount())]
+            self.backend = 'pynvml'
+            return
         except ImportError:
-            # Try nvidia-smi command as fallback
+            pass
+        except Exception as e:
+            logger.debug(f"NVML initialization failed: {e}")
+            return
+        
+        # Try nvidia-smi command as fallback
+        try:
+            subprocess.run(['nvidia-smi'], capture_output=True, check=True)
+            self.backend = 'nvidia-smi'
+        except (subprocess.CalledProcessError, FileNotFoundError):
+            self.backend = None
+            return
+        
+        if self._streaming:
+            self._device_stream = NvidiaSmiStream('query-gpu', self.SMI_GPU_FIELDS, self._loop_ms)
+            self._process_stream = NvidiaSmiStream('query-compute-apps', self.SMI_PROCESS_FIELDS, self._loop_ms)
+            self._device_stream.start()
+            self._process_stream.start()
+    
+    def shutdown(self):
+        """Release the NVML session and stop nvidia-smi streams"""
+        for stream in (self._device_stream, self._process_stream):
+            if stream is not None:
+                stream.stop()
+        if self._nvml is not None:
             try:
-                subprocess.run(['nvidia-smi'], capture_output=True, check=True)
-                return True
-            except (subprocess.CalledProcessError, FileNotFoundError):
-                return False
+                self._nvml.nvmlShutdown()
+            except Exception:
+                pass
+    
+    def collect(self):
+        """Refresh device records and the PID -> GPU usage map in one pass"""
+        if self.backend == 'pynvml':
+            if self._nvml_failed_at is not None:
+                self._reinit_nvml()
+            devices = self._query_devices_pynvml()
+            usage = self._collect_processes_pynvml(devices)
+        elif self.backend == 'nvidia-smi':
+            devices = self._query_devices_nvidia_smi()
+            usage = self._collect_processes_nvidia_smi(devices)
+        else:
+            devices, usage = [], {}
+        # Swap whole structures so readers never see a partial update
+        self.devices = devices
+        self.process_usage = usage
+        return devices
+    
+    def _reinit_nvml(self):
+        """Start a fresh NVML session after query errors (e.g. a driver reload)"""
+        if time.monotonic() - self._nvml_failed_at < NVML_REINIT_INTERVAL:
+            return
+        nvml = self._nvml
+        try:
+            nvml.nvmlShutdown()
         except Exception:
-            return False
+            pass
+        try:
+            nvml.nvmlInit()
+            self._handles = [nvml.nvmlDeviceGetHandleByIndex(i)
+                             for i in range(nvml.nvmlDeviceGetCount())]
+        except Exception as e:
+            logger.debug(f"NVML reinitialization failed: {e}")
+            self._nvml_failed_at = time.monotonic()
+            return
+        self._nvml_failed_at = None
+        # Sampling cursors and capabilities belong to the old session
+        self._util_cursors = {}
+        self._util_unsupported = set()
+        logger.info(f"NVML reinitialized, {len(self._handles)} GPUs")
     
-    def _format_bytes(self, bytes_value):
-        """Convert bytes to human readable format"""
-        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-            if bytes_value < 1024.0:
-                return f"{bytes_value:.1f} {unit}"
-            bytes_value /= 1024.0
-        return f"{bytes_value:.1f} PB"
+    def get_process_usage(self, pid):
+        """Look up GPU usage for pid from the last collected map"""
+        return self.process_usage.get(pid)
+    
+    def _device_record(self, index, name, uuid, utilization, memory_utilization,
+                       memory_used, memory_total, temperature, power_draw,
+                       power_limit, clock_graphics, clock_sm, clock_memory):
+        """Raw per-device sample; memory in bytes, power in watts, clocks in MHz"""
+        return {
+            'index': index,
+            'name': name,
+            'uuid': uuid,
+            'utilization': utilization,
+            'memory_utilization': memory_utilization,
+            'memory_used': memory_used,
+            'memory_total': memory_total,
+            'memory_free': memory_total - memory_used,
+            'memory_percent': (memory_used / memory_total) * 100 if memory_total else 0.0,
+            'temperature': temperature,
+            'power_draw': power_draw,
+            'power_limit': power_limit,
+            'clock_graphics': clock_graphics,
+            'clock_sm': clock_sm,
+            'clock_memory': clock_memory
+        }
     
-    def _get_gpu_info_pynvml(self):
-        """Get GPU info using pynvml library"""
+    def _nvml_value(self, func, *args):
+        """Call an optional NVML query, returning None where unsupported"""
         try:
-            import pynvml
-            pynvml.nvmlInit()
-            device_count = pynvml.nvmlDeviceGetCount()
-            
-            if device_count == 0:
-                return None
-                
-            # Get info for first GPU
-            handle = pynvml.nvmlDeviceGetHandleByIndex(0)
-            name = pynvml.nvmlDeviceGetName(handle).decode('utf-8')
+            return func(*args)
+        except Exception:
+            return None
+    
+    def _query_devices_pynvml(self):
+        nvml = self._nvml
+        devices = []
+        for index, handle in enumerate(self._handles):
+            try:
+                name = nvml.nvmlDeviceGetName(handle)
+                if isinstance(name, bytes):
+                    name = name.decode('utf-8')
+                uuid = self._nvml_value(nvml.nvmlDeviceGetUUID, handle)
+                if isinstance(uuid, bytes):
+                    uuid = uuid.decode('utf-8')
+                utilization = nvml.nvmlDeviceGetUtilizationRates(handle)
+                memory_info = nvml.nvmlDeviceGetMemoryInfo(handle)
+            except Exception as e:
+                logger.debug(f"pynvml query for GPU {index} failed: {e}")
+                self._nvml_failed_at = time.monotonic()
+                continue
             
-            # GPU utilization
-            utilization = pynvml.nvmlDeviceGetUtilizationRates(handle)
-            gpu_util = utilization.gpu
+            power_draw = self._nvml_value(nvml.nvmlDeviceGetPowerUsage, handle)
+            power_limit = self._nvml_value(nvml.nvmlDeviceGetEnforcedPowerManagementLimit, handle)
+            devices.append(self._device_record(
+                index, name, uuid,
+                utilization.gpu, utilization.memory,
+                memory_info.used, memory_info.total,
+                self._nvml_value(nvml.nvmlDeviceGetTemperature, handle, nvml.NVML_TEMPERATURE_GPU),
+                power_draw / 1000.0 if power_draw is not None else None,  # mW -> W
+                power_limit / 1000.0 if power_limit is not None else None,
+                self._nvml_value(nvml.nvmlDeviceGetClockInfo, handle, nvml.NVML_CLOCK_GRAPHICS),
+                self._nvml_value(nvml.nvmlDeviceGetClockInfo, handle, nvml.NVML_CLOCK_SM),
+                self._nvml_value(nvml.nvmlDeviceGetClockInfo, handle, nvml.NVML_CLOCK_MEM)
+            ))
+        return devices
+    
+    def _collect_processes_pynvml(self, devices):
+        nvml = self._nvml
+        utilization_by_index = {device['index']: device['utilization'] for device in devices}
+        usage = {}
+        for index, handle in enumerate(self._handles):
+            device_processes = {}
+            for getter in (nvml.nvmlDeviceGetComputeRunningProcesses,
+                           nvml.nvmlDeviceGetGraphicsRunningProcesses):
+                try:
+                    processes = getter(handle)
+                except Exception as e:
+                    logger.debug(f"GPU {index} process query failed: {e}")
+                    continue
+                for proc in processes:
+                    # usedGpuMemory is None where the driver cannot report it (e.g. WDDM)
+                    memory = proc.usedGpuMemory or 0
+                    # A process on both lists reports the same allocation twice
+                    device_processes[proc.pid] = max(device_processes.get(proc.pid, 0), memory)
             
-            # Memory info
-            memory_info = pynvml.nvmlDeviceGetMemoryInfo(handle)
-            memory_used = memory_info.used
-            memory_total = memory_info.total
-            memory_percent = (memory_used / memory_total) * 100
+            samples = self._sample_process_utilization(index, handle)
+            if samples is None:
+                # No per-process sampling on this device; fall back to the device total
+                utilization = utilization_by_index.get(index)
+                for pid, memory in device_processes.items():
+                    self._attribute(usage, pid, index, memory / (1024 * 1024), utilization, 'device')
+                continue
             
-            # Temperature
-            try:
-                temperature = pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)
-            except:
-                temperature = None
-                
-            return {
-                'name': name,
-                'utilization': gpu_util,
-                'memory_used': memory_used,
-                'memory_total': memory_total,
-                'memory_percent': memory_percent,
-                'temperature': temperature
-            }
+            for pid in set(device_processes) | set(samples):
+                # Processes without samples in this window were idle on the GPU
+                engines = samples.get(pid, {'sm': 0.0, 'memory': 0.0, 'encoder': 0.0, 'decoder': 0.0})
+                memory = device_processes.get(pid, 0)
+                self._attribute(usage, pid, index, memory / (1024 * 1024), engines['sm'], 'process', engines)
+        return usage
+    
+    def _sample_process_utilization(self, index, handle):
+        """Per-process utilization samples taken on a device since the last tick.
+        
+        Returns {pid: {'sm', 'memory', 'encoder', 'decoder'}} averaged over the new
+        samples, or None when the driver does not support process sampling.
+        """
+        if index in self._util_unsupported:
+            return None
+        nvml = self._nvml
+        cursor = self._util_cursors.get(index, 0)
+        try:
+            samples = nvml.nvmlDeviceGetProcessUtilization(handle, cursor)
         except Exception as e:
-            logger.debug(f"pynvml GPU info failed: {e}")
+            if getattr(e, 'value', None) == getattr(nvml, 'NVML_ERROR_NOT_FOUND', None):
+                # No process was active on this device since the cursor
+                return {}
+            logger.info(f"Per-process GPU utilization not available on GPU {index}: {e}")
+            self._util_unsupported.add(index)
+            return None
+        
+        totals = {}
+        for sample in samples:
+            # Only move the cursor forward so the next tick pulls new samples only
+            cursor = max(cursor, sample.timeStamp)
+            acc = totals.setdefault(sample.pid, [0.0, 0.0, 0.0, 0.0, 0])
+            acc[0] += sample.smUtil
+            acc[1] += sample.memUtil
+            acc[2] += sample.encUtil
+            acc[3] += sample.decUtil
+            acc[4] += 1
+        self._util_cursors[index] = cursor
+        
+        return {
+            pid: {
+                'sm': acc[0] / acc[4],
+                'memory': acc[1] / acc[4],
+                'encoder': acc[2] / acc[4],
+                'decoder': acc[3] / acc[4]
+            }
+            for pid, acc in totals.items()
+        }
+    
+    def _attribute(self, usage, pid, index, memory_mb, utilization, source, engines=None):
+        entry = usage.get(pid)
+        if entry is None:
+            usage[pid] = {
+                'device': index,
+                'memory_mb': memory_mb,
+                'utilization_percent': utilization,
+                'utilization_source': source,
+                'engines': engines
+            }
+            return
+        # Process spans several devices; attribute to the one it uses most
+        if memory_mb > entry['memory_mb']:
+            entry['device'] = index
+            entry['utilization_percent'] = utilization
+            entry['utilization_source'] = source
+            entry['engines'] = engines
+        entry['memory_mb'] += memory_mb
+    
+    def _parse_smi_number(self, value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            # '[Not Supported]', '[N/A]' and similar
             return None
     
-    def _get_gpu_info_nvidia_smi(self):
-        """Get GPU info using nvidia-smi command"""
+    def _parse_smi_gpu_line(self, line):
+        """Parse one --query-gpu CSV line (SMI_GPU_FIELDS order) into a device record"""
+        parts = [p.strip() for p in line.split(',')]
+        if len(parts) < len(self.SMI_GPU_FIELDS):
+            return None
+        num = self._parse_smi_number
+        try:
+            index = int(parts[0])
+        except ValueError:
+            return None
+        memory_used = (num(parts[5]) or 0.0) * 1024 * 1024  # Convert MB to bytes
+        memory_total = (num(parts[6]) or 0.0) * 1024 * 1024  # Convert MB to bytes
+        self._smi_uuid_index[parts[2]] = index
+        return self._device_record(
+            index, parts[1], parts[2], num(parts[3]) or 0.0, num(parts[4]),
+            memory_used, memory_total, num(parts[7]), num(parts[8]),
+            num(parts[9]), num(parts[10]), num(parts[11]), num(parts[12])
+        )
+    
+    def _smi_rows(self, stream, query, fields):
+        """CSV rows from the live stream, or from a one-shot query while it is down"""
+        if stream is not None:
+            stream.start()
+            rows = stream.rows()
+            if rows is not None:
+                return rows
         try:
             result = subprocess.run([
-                'nvidia-smi', 
-                '--query-gpu=name,utilization.gpu,memory.used,memory.total,temperature.gpu',
+                'nvidia-smi',
+                f'--{query}=' + ','.join(fields),
                 '--format=csv,noheader,nounits'
             ], capture_output=True, text=True, check=True)
-            
-            line = result.stdout.strip().split('\n')[0]
-            parts = [p.strip() for p in line.split(',')]
-            
-            if len(parts) >= 5:
-                name = parts[0]
-                gpu_util = float(parts[1])
-                memory_used = float(parts[2]) * 1024 * 1024  # Convert MB to bytes
-                memory_total = float(parts[3]) * 1024 * 1024  # Convert MB to bytes
-                memory_percent = (memory_used / memory_total) * 100
-                temperature = float(parts[4]) if parts[4] != '[Not Supported]' else None
-                
-                return {
-                    'name': name,
-                    'utilization': gpu_util,
-                    'memory_used': memory_used,
-                    'memory_total': memory_total,
-                    'memory_percent': memory_percent,
-                    'temperature': temperature
-                }
         except Exception as e:
-            logger.debug(f"nvidia-smi GPU info failed: {e}")
+            logger.debug(f"nvidia-smi {query} failed: {e}")
+            return []
+        return result.stdout.strip().split('\n')
+    
+    def _query_devices_nvidia_smi(self):
+        devices = []
+        for line in self._smi_rows(self._device_stream, 'query-gpu', self.SMI_GPU_FIELDS):
+            device = self._parse_smi_gpu_line(line)
+            if device:
+                devices.append(device)
+        return devices
+    
+    def _parse_smi_process_line(self, line):
+        """Parse one 'pid,used_memory,gpu_uuid' CSV line into (pid, memory_mb, index)"""
+        parts = [p.strip() for p in line.split(',')]
+        if len(parts) < 2:
+            return None
+        try:
+            pid = int(parts[0])
+            memory_mb = float(parts[1])
+        except ValueError:
+            return None
+        index = self._smi_uuid_index.get(parts[2]) if len(parts) > 2 else None
+        return pid, memory_mb, index
+    
+    def _collect_processes_nvidia_smi(self, devices):
+        usage = {}
+        utilization_by_index = {device['index']: device['utilization'] for device in devices}
+        for line in self._smi_rows(self._process_stream, 'query-compute-apps', self.SMI_PROCESS_FIELDS):
+            parsed = self._parse_smi_process_line(line)
+            if parsed:
+                pid, memory_mb, index = parsed
+                self._attribute(usage, pid, index, memory_mb, utilization_by_index.get(index), 'device')
+        return usage
+
+class SystemMonitor:
+    def __init__(self):
+        self.gpu_collector = GpuCollector()
+        self.gpu_available = self.gpu_collector.available
+    
+    def get_process_gpu_usage(self, pid):
+        """Get GPU usage for a specific process from the collector's last pass"""
+        if not self.gpu_available:
             return None
+        return self.gpu_collector.get_process_usage(pid)
         
-        return None
+    def _format_bytes(self, bytes_value):
+        """Convert bytes to human readable format"""
+        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+            if bytes_value < 1024.0:
+                return f"{bytes_value:.1f} {unit}"
+            bytes_value /= 1024.0
+        return f"{bytes_value:.1f} PB"
     
-    def get_system_metrics(self):
-        """Get comprehensive system metrics"""
-        try:
-            # CPU metrics
-            cpu_percent = psutil.cpu_percent(interval=0.1)
-            cpu_count = psutil.cpu_count()
-            
-            # Memory metrics
-            memory = psutil.virtual_memory()
-            
-            # Disk metrics (using the main drive)
-            disk_path = '/' if os.name != 'nt' else 'C:\\'
-            disk = psutil.disk_usage(disk_path)
-            
-            # Process count
-            process_count = len(psutil.pids())
-            
-            # GPU metrics
-            gpu_info = None
-            if self.gpu_available:
-                # Try pynvml first, fallback to nvidia-smi
-                gpu_info = self._get_gpu_info_pynvml()
-                if gpu_info is None:
-                    gpu_info = self._get_gpu_info_nvidia_smi()
-            
-            metrics = {
-                'cpu': {
-                    'percent': round(cpu_percent, 1),
-                    'cores': cpu_count,
-                    'color': self._get_usage_color(cpu_percent)
-                },
-                'memory': {
-                    'used': memory.used,
-                    'total': memory.total,
-                    'percent': round(memory.percent, 1),
-                    'used_formatted': self._format_bytes(memory.used),
-                    'total_formatted': self._format_bytes(memory.total),
-                    'color': self._get_usage_color(memory.percent)
-                },
-                'disk': {
-                    'used': disk.used,
-                    'total': disk.total,
-                    'percent': round((disk.used / disk.total) * 100, 1),
-                    'used_formatted': self._format_bytes(disk.used),
-                    'total_formatted': self._format_bytes(disk.total),
-                    'color': self._get_usage_color((disk.used / disk.total) * 100)
-                },
-                'processes': {
-                    'total': process_count
-                },
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            # Add GPU metrics if available
-            if gpu_info:
-                metrics['gpu'] = {
-                    'name': gpu_info['name'],
-                    'utilization': round(gpu_info['utilization'], 1),
-                    'memory_used': gpu_info['memory_used'],
-                    'memory_total': gpu_info['memory_total'],
-                    'memory_percent': round(gpu_info['memory_percent'], 1),
-                    'memory_used_formatted': self._format_bytes(gpu_info['memory_used']),
-                    'memory_total_formatted': self._format_bytes(gpu_info['memory_total']),
-                    'temperature': gpu_info['temperature'],
-                    'utilization_color': self._get_usage_color(gpu_info['utilization']),
-                    'memory_color': self._get_usage_color(gpu_info['memory_percent'])
-                }
-            
-            return metrics
-            
-        except Exception as e:
-            logger.error(f"Failed to get system metrics: {e}")
-            return {
-                'error': str(e),
-                'timestamp': datetime.now().isoformat()
-            }
+    def sample_cpu(self, interval=None):
+        """Sample CPU usage (non-blocking when interval is None)"""
+        return {
+            'percent': psutil.cpu_percent(interval=interval),
+            'cores': psutil.cpu_count()
+        }
+    
+    def sample_memory(self):
+        """Sample virtual memory usage"""
+        return psutil.virtual_memory()
+    
+    def sample_disk(self):
+        """Sample disk usage of the main drive"""
+        disk_path = '/' if os.name != 'nt' else 'C:\\'
+        return psutil.disk_usage(disk_path)
+    
+    def sample_process_count(self):
+        """Count processes running on the host"""
+        return len(psutil.pids())
+    
+    def sample_gpu(self):
+        """Sample all GPUs and per-process GPU usage in one batched collector pass"""
+        if not self.gpu_available:
+            return None
+        return self.gpu_collector.collect()
+    
+    def _format_gpu(self, device):
+        """Format a raw device record for the API"""
+        return {
+            'index': device['index'],
+            'name': device['name'],
+            'uuid': device['uuid'],
+            'utilization': round(device['utilization'], 1),
+            'memory_utilization': device['memory_utilization'],
+            'memory_used': device['memory_used'],
+            'memory_total': device['memory_total'],
+            'memory_free': device['memory_free'],
+            'memory_percent': round(device['memory_percent'], 1),
+            'memory_used_formatted': self._format_bytes(device['memory_used']),
+            'memory_total_formatted': self._format_bytes(device['memory_total']),
+            'temperature': device['temperature'],
+            'power_draw': device['power_draw'],
+            'power_limit': device['power_limit'],
+            'clocks': {
+                'graphics': device['clock_graphics'],
+                'sm': device['clock_sm'],
+                'memory': device['clock_memory']
+            },
+            'utilization_color': self._get_usage_color(device['utilization']),
+            'memory_color': self._get_usage_color(device['memory_percent'])
+        }
+    
+    def _summarize_gpus(self, devices):
+        """Aggregate figures across all GPUs so clients don't have to"""
+        temperatures = [d['temperature'] for d in devices if d['temperature'] is not None]
+        power = [d['power_draw'] for d in devices if d['power_draw'] is not None]
+        memory_total = sum(d['memory_total'] for d in devices)
+        memory_used = sum(d['memory_used'] for d in devices)
+        busiest = max(devices, key=lambda d: d['utilization'])
+        return {
+            'count': len(devices),
+            'memory_total': memory_total,
+            'memory_used': memory_used,
+            'memory_free': memory_total - memory_used,
+            'memory_free_formatted': self._format_bytes(memory_total - memory_used),
+            'memory_total_formatted': self._format_bytes(memory_total),
+            'memory_percent': round((memory_used / memory_total) * 100, 1) if memory_total else 0.0,
+            'max_temperature': max(temperatures) if temperatures else None,
+            'max_utilization': round(busiest['utilization'], 1),
+            'avg_utilization': round(sum(d['utilization'] for d in devices) / len(devices), 1),
+            'busiest_index': busiest['index'],
+            'power_draw': round(sum(power), 1) if power else None
+        }
+    
+    def build_metrics(self, samples, timestamp=None):
+        """Build the metrics document from previously collected samples"""
+        cpu = samples['cpu']
+        memory = samples['memory']
+        disk = samples['disk']
+        gpu_devices = samples.get('gpu')
+        
+        metrics = {
+            'cpu': {
+                'percent': round(cpu['percent'], 1),
+                'cores': cpu['cores'],
+                'color': self._get_usage_color(cpu['percent'])
+            },
+            'memory': {
+                'used': memory.used,
+                'total': memory.total,
+                'percent': round(memory.percent, 1),
+                'used_formatted': self._format_bytes(memory.used),
+                'total_formatted': self._format_bytes(memory.total),
+                'color': self._get_usage_color(memory.percent)
+            },
+            'disk': {
+                'used': disk.used,
+                'total': disk.total,
+                'percent': round((disk.used / disk.total) * 100, 1),
+                'used_formatted': self._format_bytes(disk.used),
+                'total_formatted': self._format_bytes(disk.total),
+                'color': self._get_usage_color((disk.used / disk.total) * 100)
+            },
+            'processes': {
+                'total': samples['processes']
+            },
+            'timestamp': (timestamp or datetime.now()).isoformat()
+        }
+        
+        # Add GPU metrics if available
+        if gpu_devices:
+            metrics['gpus'] = [self._format_gpu(device) for device in gpu_devices]
+            metrics['gpu_summary'] = self._summarize_gpus(gpu_devices)
+            # Single-GPU view kept for older clients
+            metrics['gpu'] = metrics['gpus'][0]
+        
+        return metrics
     
     def _get_usage_color(self, percent):
         """Get color based on usage percentage"""
@@ -379,309 +1198,3265 @@ class SystemMonitor:
         else:
             return 'red'
 
-class AppManager:
+class ProcessTreeTracker:
+    """Tracks the whole process tree of every managed app.
+    
+    Apps launched through wrappers (``conda run``, ``cmd.exe /c``) do their
+    real work in descendants of the PID we started. The tracker caches a
+    long-lived psutil.Process per member so CPU% can be computed from deltas
+    between ticks, discovers new children from a single parent map built once
+    per refresh, and reaps members that have exited. Members stay tracked even
+    if their parent dies and they get reparented.
+    """
+    
     def __init__(self):
-        self.processes = {}
-        self.app_status = {}
-        self.start_times = {}
+        # app_id -> {pid: psutil.Process}
+        self._trees = {}
+    
+    def _new_handle(self, pid):
+        proc = psutil.Process(pid)
+        # First call only primes the CPU counters and always returns 0.0
+        proc.cpu_percent(interval=None)
+        return proc
+    
+    def refresh(self, roots):
+        """Refresh the trees for {app_id: root_pid}; returns {app_id: {pid: Process}}"""
+        children = {}
+        for proc in psutil.process_iter(['ppid']):
+            ppid = proc.info['ppid']
+            if ppid is not None:
+                children.setdefault(ppid, []).append(proc.pid)
         
-    def start_app(self, app_id):
-        """Start a Python application in its conda environment or as executable"""
-        if app_id not in app_configs:
-            return {'success': False, 'error': 'App not found'}
+        trees = {}
+        for app_id, root_pid in roots.items():
+            previous = self._trees.get(app_id, {})
+            members = {}
             
-        if app_id in self.processes and self.is_process_running(app_id):
-            return {'success': False, 'error': 'App is already running'}
+            # Keep live members (is_running() also guards against PID reuse)
+            for pid, proc in previous.items():
+                if proc.is_running():
+                    members[pid] = proc
             
-        config = app_configs[app_id]
-        
-        try:
-            # Set working directory
-            working_dir = config.get('working_dir', os.path.dirname(config['path']))
+            # Discover new descendants of the root and of every known member
+            stack = [root_pid] + list(members)
+            seen = set()
+            while stack:
+                pid = stack.pop()
+                if pid in seen:
+                    continue
+                seen.add(pid)
+                if pid not in members:
+                    try:
+                        members[pid] = self._new_handle(pid)
+                    except (psutil.NoSuchProcess, psutil.AccessDenied):
+                        continue
+                stack.extend(children.get(pid, ()))
             
-            # Build command based on app type
-            if config.get('type') == 'executable':
-                # For ComfyUI - use embedded python directly
-                # Build absolute path for the executable
-                if os.path.isabs(config['path']):
-                    executable_path = config['path']
-                else:
-                    executable_path = os.path.join(working_dir, config['path'])
-                
-                # Convert to Windows-style path and ensure it exists
-                executable_path = os.path.normpath(executable_path)
-                
-                if not os.path.exists(executable_path):
-                    raise FileNotFoundError(f"Executable not found: {executable_path}")
-                
-                cmd = [executable_path] + config.get('args', [])
-                logger.info(f"Starting {config['name']} with executable: {executable_path}")
-                
-            elif config.get('type') == 'batch':
-                # For SwarmUI - use batch file
-                if os.path.isabs(config['path']):
-                    batch_path = config['path']
-                else:
-                    batch_path = os.path.join(working_dir, config['path'])
-                
-                batch_path = os.path.normpath(batch_path)
-                
-                if not os.path.exists(batch_path):
-                    raise FileNotFoundError(f"Batch file not found: {batch_path}")
-                
-                # Use cmd.exe to run the batch file
-                cmd = ['cmd.exe', '/c', batch_path] + config.get('args', [])
-                logger.info(f"Starting {config['name']} with batch file: {batch_path}")
-                
-            elif config.get('type') == 'conda' or config.get('environment'):
-                # For conda environments
-                if os.name == 'nt':  # Windows
-                    conda_cmd = 'conda.exe'
-                    python_cmd = 'python.exe'
-                else:  # Unix-like systems
-                    conda_cmd = 'conda'
-                    python_cmd = 'python'
+            trees[app_id] = members
+        
+        self._trees = trees
+        return trees
+    
+    def members(self, app_id):
+        """Currently known processes of an app's tree"""
+        return dict(self._trees.get(app_id, {}))
+
+
+LOG_TOKEN_PATTERN = re.compile(rb'[a-z0-9_]{2,}')
+LOG_LEVEL_PATTERN = re.compile(
+    rb'\b(critical|fatal|error|exception|traceback|warning|warn|info|debug)\b|[a-z]error\b', re.IGNORECASE)
+LOG_LEVEL_WORDS = {
+    b'critical': 50, b'fatal': 50, b'error': 40, b'exception': 40, b'traceback': 40,
+    b'warning': 30, b'warn': 30, b'info': 20, b'debug': 10
+}
+LOG_LEVEL_NAMES = {10: 'debug', 20: 'info', 30: 'warning', 40: 'error', 50: 'critical'}
+
+def log_tokens(data):
+    """Lower-cased word tokens of a log line, as stored in the index"""
+    return set(LOG_TOKEN_PATTERN.findall(data.lower()))
+
+def detect_log_level(data):
+    """Severity of a log line from its first level keyword (0 if unknown)"""
+    match = LOG_LEVEL_PATTERN.search(data, 0, 512)
+    if match is None:
+        return 0
+    return LOG_LEVEL_WORDS.get((match.group(1) or b'error').lower(), 40)
+
+def bloom_positions(token):
+    first = zlib.crc32(token)
+    second = zlib.adler32(token) | 1
+    return [(first + i * second) % LOG_INDEX_BLOOM_BITS for i in range(3)]
+
+def regex_required_tokens(pattern):
+    """Whole words that every match of a regex must contain.
+    
+    Used to prune index blocks for regex searches. Only literal words that
+    are delimited by an explicit boundary (\\b, ^, $ or a literal non-word
+    character) qualify; patterns with alternation or groups yield nothing.
+    """
+    if '|' in pattern or '(' in pattern:
+        return set()
+    elements = []  # word characters, 'b' for a definite boundary, None for anything else
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        i += 1
+        if c == '\\' and i < len(pattern):
+            escaped = pattern[i]
+            i += 1
+            if escaped == 'b':
+                elements.append('b')
+            elif escaped == '_':
+                elements.append(('w', '_'))  # a literal word character, like in LOG_TOKEN_PATTERN
+            elif escaped.isascii() and escaped.isalnum():
+                elements.append(None)  # \d, \w, \s, \x.. and friends
+            else:
+                elements.append('b')  # escaped punctuation is a literal non-word character
+        elif c == '[':
+            end = pattern.find(']', i + 1)
+            i = end + 1 if end > 0 else len(pattern)
+            elements.append(None)
+        elif c in '*?+{':
+            if c == '{':
+                end = pattern.find('}', i)
+                i = end + 1 if end > 0 else len(pattern)
+            # A quantified word character or optional boundary is not a fixed literal
+            if elements and not (c == '+' and elements[-1] == 'b'):
+                elements[-1] = None
+        elif c in '^$':
+            elements.append('b')
+        elif c == '.':
+            elements.append(None)
+        elif c.isascii() and (c.isalnum() or c == '_'):
+            elements.append(('w', c.lower()))
+        else:
+            elements.append('b')
+    
+    tokens = set()
+    word = []
+    bounded = False
+    for element in elements + [None]:
+        if isinstance(element, tuple):
+            word.append(element[1])
+            continue
+        if word and bounded and element == 'b' and len(word) >= 2:
+            tokens.add(''.join(word).encode())
+        word = []
+        bounded = element == 'b'
+    return tokens
+
+def compile_log_query(query, use_regex=False):
+    """(matches, tokens) for a log search: a line predicate and the word
+    tokens it requires, for pruning index blocks. Raises ValueError."""
+    if use_regex:
+        try:
+            pattern = re.compile(query.encode(), re.IGNORECASE)
+        except re.error as e:
+            raise ValueError(f'Invalid regex: {e}')
+        return (lambda data: pattern.search(data) is not None), regex_required_tokens(query)
+    tokens = log_tokens(query.encode())
+    if tokens:
+        return (lambda data: tokens <= log_tokens(data)), tokens
+    needle = query.strip().lower().encode()
+    if not needle:
+        raise ValueError('q must not be empty')
+    # Nothing indexable (a single character, C++, non-ASCII words): match
+    # the text as a substring and scan every block
+    return (lambda data: needle in data.lower()), set()
+
+
+class LogSegmentIndex:
+    """Sidecar index of one log segment, maintained by the log writer.
+    
+    Lines are grouped into blocks of about LOG_INDEX_BLOCK_BYTES.
+    <segment>.blocks holds one fixed-size record per block with its line and
+    byte range, time range, highest severity and a bloom filter of the word
+    tokens in it; <segment>.lines holds one record per line with its offset in
+    the block, timestamp, severity and stream. The open block's record is
+    rewritten in place on every flush, so the index always covers what has
+    been flushed to the segment.
+    """
+    
+    BLOCK = struct.Struct('<IIIIddB')  # first line, line count, start, end, min/max timestamp, max level
+    LINE = struct.Struct('<HfB')       # offset in block, seconds since block start, level | stderr flag
+    BLOOM_BYTES = LOG_INDEX_BLOOM_BITS // 8
+    RECORD_SIZE = BLOCK.size + BLOOM_BYTES
+    STDERR = 0x80
+    
+    def __init__(self, segment_path):
+        base = segment_path[:-len('.log')]
+        self.lines_file = open(base + '.lines', 'ab')
+        line_bytes = self.lines_file.tell()
+        if line_bytes % self.LINE.size:
+            # Drop a partial record left by an unclean shutdown
+            line_bytes -= line_bytes % self.LINE.size
+            self.lines_file.truncate(line_bytes)
+        self.line_count = line_bytes // self.LINE.size
+        blocks_path = base + '.blocks'
+        self.blocks_file = open(blocks_path, 'r+b' if os.path.exists(blocks_path) else 'w+b')
+        self.block_count = os.path.getsize(blocks_path) // self.RECORD_SIZE
+        self.block = None  # [first_line, line_count, start, end, ts_min, ts_max, level_max, bloom]
+    
+    def add(self, offset, timestamp, stream, data):
+        """Index a line written at offset (relative to the segment start)"""
+        block = self.block
+        if block is None or block[3] != offset or block[3] - block[2] >= LOG_INDEX_BLOCK_BYTES:
+            self._close_block()
+            block = self.block = [self.line_count, 0, offset, offset, timestamp, timestamp, 0,
+                                  bytearray(self.BLOOM_BYTES)]
+        level = detect_log_level(data)
+        self.lines_file.write(self.LINE.pack(
+            offset - block[2], timestamp - block[4], level | (self.STDERR if stream == 'stderr' else 0)))
+        self.line_count += 1
+        block[1] += 1
+        block[3] = offset + len(data) + 1
+        block[5] = max(block[5], timestamp)
+        block[6] = max(block[6], level)
+        bloom = block[7]
+        for token in log_tokens(data):
+            for position in bloom_positions(token):
+                bloom[position >> 3] |= 1 << (position & 7)
+    
+    def _write_block(self):
+        self.blocks_file.seek(self.block_count * self.RECORD_SIZE)
+        self.blocks_file.write(self.BLOCK.pack(*self.block[:7]) + bytes(self.block[7]))
+    
+    def _close_block(self):
+        if self.block is not None:
+            self._write_block()
+            self.block_count += 1
+            self.block = None
+    
+    def flush(self):
+        self.lines_file.flush()
+        if self.block is not None:
+            self._write_block()
+        self.blocks_file.flush()
+    
+    def close(self):
+        self._close_block()
+        self.lines_file.close()
+        self.blocks_file.close()
+
+
+class AppLog:
+    """Bounded in-memory tail of one app's output.
+    
+    Every line gets a logical byte offset when it is read. Offsets keep
+    counting across restarts and match the names of the on-disk segments,
+    so a reader can resume from any position it has seen.
+    """
+    
+    def __init__(self, next_offset=0, max_bytes=LOG_RING_BYTES):
+        self.lines = deque()  # (offset, stream, timestamp, data)
+        self.size = 0
+        self.max_bytes = max_bytes
+        self.next_offset = next_offset
+        self.dropped = 0  # lines that could not be queued for disk
+        self.lock = threading.Lock()
+        # Notified on every appended line, used by log followers
+        self.changed = threading.Condition(self.lock)
+    
+    def append(self, stream, data):
+        with self.lock:
+            entry = (self.next_offset, stream, time.time(), data)
+            self.next_offset += len(data) + 1
+            self.lines.append(entry)
+            self.size += len(data) + 1
+            while self.size > self.max_bytes and len(self.lines) > 1:
+                self.size -= len(self.lines.popleft()[3]) + 1
+            self.changed.notify_all()
+        return entry
+    
+    def wait(self, offset, timeout):
+        """Block until lines past offset exist or timeout expires"""
+        with self.lock:
+            if self.next_offset <= offset:
+                self.changed.wait(timeout)
+            return self.next_offset > offset
+    
+    def oldest_offset(self):
+        with self.lock:
+            return self.lines[0][0] if self.lines else self.next_offset
+    
+    def read(self, offset, limit):
+        """Lines starting at or after offset, up to about limit bytes.
+        
+        Returns None if offset is older than the buffered lines.
+        """
+        with self.lock:
+            oldest = self.lines[0][0] if self.lines else self.next_offset
+            if offset < oldest:
+                return None
+            newer = []
+            for entry in reversed(self.lines):
+                if entry[0] < offset:
+                    break
+                newer.append(entry)
+        
+        lines = []
+        size = 0
+        for entry in reversed(newer):
+            if lines and size + len(entry[3]) + 1 > limit:
+                break
+            lines.append(entry)
+            size += len(entry[3]) + 1
+        return lines
+    
+    def tail_bytes(self, limit):
+        """The last lines fitting into limit bytes (at least one), oldest first"""
+        lines = []
+        size = 0
+        with self.lock:
+            for entry in reversed(self.lines):
+                if lines and size + len(entry[3]) + 1 > limit:
+                    break
+                lines.append(entry)
+                size += len(entry[3]) + 1
+        return lines[::-1]
+    
+    def tail(self, count, stream=None):
+        """Last count lines (of one stream, if given), oldest first"""
+        with self.lock:
+            lines = reversed(self.lines)
+            if stream is not None:
+                lines = (entry for entry in lines if entry[1] == stream)
+            return list(islice(lines, count))[::-1]
+
+
+def safe_filename(name):
+    """Map an app id or series name to a filesystem-safe file name"""
+    return ''.join(c if c.isalnum() or c in '._-' else '_' for c in name)
+
+
+class QueuedWriter:
+    """Base for stores that persist records from a single writer thread.
+    
+    Producers enqueue without blocking (records are counted in `dropped`
+    when the queue is full); the writer thread drains the queue in batches
+    every flush interval and hands them to _write_batch. On stop, whatever
+    is still queued is written with final=True before _close is called.
+    """
+    
+    thread_name = 'writer'
+    description = 'records'
+    
+    def __init__(self, directory, queue_size, flush_interval):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop_event = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=self.thread_name)
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def stop(self):
+        """Stop the writer after flushing queued records"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+    
+    def _enqueue(self, item):
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            # Never let a slow disk back up into the producer
+            self.dropped += 1
+            return False
+    
+    # Writer thread
+    
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._drain(time.monotonic() + self.flush_interval)
+            if batch:
+                self._safe_write(batch)
+            self._idle()
+        
+        self._safe_write(self._drain(0), final=True)
+        self._close()
+    
+    def _drain(self, deadline):
+        batch = []
+        while True:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout <= 0 or self._stop_event.is_set():
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                return batch
+    
+    def _safe_write(self, batch, final=False):
+        try:
+            self._write_batch(batch, final)
+        except Exception as e:
+            logger.error(f"Failed to write {self.description} to {self.directory}: {e}")
+    
+    def _write_batch(self, batch, final=False):
+        raise NotImplementedError
+    
+    def _idle(self):
+        """Periodic housekeeping on the writer thread, between batches"""
+    
+    def _close(self):
+        """Release writer-thread resources after the final flush"""
+
+
+class LogStore(QueuedWriter):
+    """Captures app stdout/stderr without ever blocking the apps.
+    
+    The process supervisor drains every pipe as fast as output is produced
+    and feeds it here; lines go to the app's AppLog ring buffer and are
+    also queued for a single writer thread that appends them to size-rotated
+    segment files logs/<app>/<offset>.log, named after the logical offset of
+    their first byte. If the disk cannot keep up, lines are dropped from the
+    disk queue (the next segment starts at the next surviving offset) rather
+    than slowing down the supervisor.
+    """
+    
+    thread_name = 'log-writer'
+    description = 'app logs'
+    
+    def __init__(self, directory=LOGS_DIR, segment_bytes=LOG_SEGMENT_BYTES, max_segments=LOG_MAX_SEGMENTS):
+        super().__init__(directory, LOG_QUEUE_SIZE, LOG_FLUSH_INTERVAL)
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self._logs = {}
+        self._logs_lock = threading.Lock()
+        self._files = {}  # app_id -> [file, segment_start, next_offset] (writer thread only)
+        self._followers = 0
+    
+    def get(self, app_id):
+        """The AppLog of an app, continuing the offsets found on disk"""
+        with self._logs_lock:
+            log = self._logs.get(app_id)
+            if log is None:
+                next_offset = 0
+                segments = self.segments(app_id)
+                if segments:
+                    try:
+                        next_offset = segments[-1] + os.path.getsize(self._segment_path(app_id, segments[-1]))
+                    except OSError:
+                        pass
+                log = self._logs[app_id] = AppLog(next_offset)
+            return log
+    
+    def _app_dir(self, app_id):
+        # App ids come from user config, keep them filesystem-safe
+        return os.path.join(self.directory, safe_filename(app_id))
+    
+    def _segment_path(self, app_id, start):
+        return os.path.join(self._app_dir(app_id), f"{start:020d}.log")
+    
+    def segments(self, app_id):
+        """Sorted start offsets of the app's on-disk segments"""
+        try:
+            names = os.listdir(self._app_dir(app_id))
+        except FileNotFoundError:
+            return []
+        starts = []
+        for name in names:
+            if name.endswith('.log'):
+                try:
+                    starts.append(int(name[:-4]))
+                except ValueError:
+                    continue
+        return sorted(starts)
+    
+    # Random access
+    
+    def read(self, app_id, offset=None, limit=LOG_DEFAULT_READ_BYTES):
+        """Read whole lines starting at a logical byte offset.
+        
+        Recent lines come from the ring buffer, older ones from the segment
+        files with a seek and a bounded read, so the size of the log does not
+        matter. Without an offset the last limit bytes are returned. Ranges
+        that were rotated away or dropped are skipped forward.
+        """
+        log = self.get(app_id)
+        segments = self.segments(app_id)
+        end = log.next_offset
+        oldest = log.oldest_offset()
+        lines = None
+        if offset is None:
+            offset = max(end - limit, 0)
+            if offset >= oldest:
+                lines = log.tail_bytes(limit)
+                offset = lines[0][0] if lines else end
+        offset = min(max(offset, 0), end)
+        
+        if lines is None:
+            lines = log.read(offset, limit)
+        position = offset
+        if lines is None:
+            lines, position = self._read_segments(app_id, segments, offset, limit, oldest)
+            if lines is None:
+                # Caught up with the ring buffer while skipping gaps
+                lines = log.read(position, limit) or []
+        
+        next_offset = lines[-1][0] + len(lines[-1][3]) + 1 if lines else position
+        return {
+            'offset': lines[0][0] if lines else position,
+            'next_offset': next_offset,
+            'skipped': (lines[0][0] if lines else position) - offset,
+            'start_offset': min(segments[0], oldest) if segments else oldest,
+            'end_offset': end,
+            'lines': lines
+        }
+    
+    def _read_segments(self, app_id, segments, offset, limit, ring_oldest):
+        """(lines, position) read from disk; lines is None once offset reaches the ring"""
+        while offset < ring_oldest:
+            index = len(segments) - 1
+            while index >= 0 and segments[index] > offset:
+                index -= 1
+            if index < 0:
+                # Older than anything kept on disk
+                offset = segments[0] if segments else ring_oldest
+                continue
+            
+            start = segments[index]
+            path = self._segment_path(app_id, start)
+            try:
+                lines, offset = self._read_segment(path, start, offset, limit)
+            except OSError:
+                # Rotated away while reading
+                lines = []
+            if lines:
+                return lines, offset
+            following = segments[index + 1] if index + 1 < len(segments) else ring_oldest
+            offset = max(offset, min(following, ring_oldest))
+        return None, offset
+    
+    def _read_segment(self, path, start, offset, limit):
+        with open(path, 'rb') as f:
+            remaining = os.fstat(f.fileno()).st_size - (offset - start)
+            if remaining <= 0:
+                return [], offset
+            aligned = True
+            if offset > start:
+                f.seek(offset - start - 1)
+                aligned = f.read(1) == b'\n'
+            else:
+                f.seek(0)
+            data = f.read(min(limit, remaining))
+            if data.count(b'\n') < (1 if aligned else 2) and len(data) < remaining:
+                # Lines are at most LOG_MAX_LINE bytes, so this always completes one
+                data += f.read(min(remaining - len(data), 2 * LOG_MAX_LINE + 2))
+        
+        if not aligned:
+            # Started in the middle of a line, resume at the next one
+            cut = data.find(b'\n') + 1
+            if cut == 0:
+                return [], offset + len(data)
+            data = data[cut:]
+            offset += cut
+        complete = data.rfind(b'\n') + 1
+        lines = []
+        for line in data[:complete].split(b'\n')[:-1]:
+            lines.append((offset, None, None, line))
+            offset += len(line) + 1
+        return lines, offset
+    
+    # Search
+    
+    def search(self, app_id, matches, tokens=(), since=None, until=None, min_level=0, offset=0, stats=None):
+        """Search an app's on-disk log from offset on.
+        
+        Yields (position, hit) pairs: hit is (offset, stream, timestamp, level,
+        data) for a line accepted by matches, or None for a progress marker;
+        position is where a later search can resume. Index blocks whose time
+        range, severity or bloom filter (for the required word tokens) rule
+        them out are skipped without reading the segment. Unindexed ranges are
+        scanned, but only when no time or level filter is given.
+        """
+        stats = stats if stats is not None else {}
+        for key in ('blocks_scanned', 'blocks_skipped', 'bytes_scanned'):
+            stats.setdefault(key, 0)
+        segments = self.segments(app_id)
+        for i, start in enumerate(segments):
+            if i + 1 < len(segments) and segments[i + 1] <= offset:
+                continue
+            path = self._segment_path(app_id, start)
+            try:
+                with open(path, 'rb') as f:
+                    hits = self._search_segment(
+                        f, path, start, matches, tokens, since, until, min_level, max(offset - start, 0), stats)
+                    for position, hit in hits:
+                        yield position, hit
+            except OSError as e:
+                # Rotated away during the search
+                logger.debug(f"Skipped log segment {start} of {app_id}: {e}")
+    
+    def _search_segment(self, f, path, start, matches, tokens, since, until, min_level, position, stats):
+        size = os.fstat(f.fileno()).st_size
+        filtered = since is not None or until is not None or min_level > 0
+        base = path[:-len('.log')]
+        blocks = None
+        try:
+            with open(base + '.blocks', 'rb') as index:
+                blocks = index.read()
+        except OSError:
+            pass
+        
+        record_size = LogSegmentIndex.RECORD_SIZE
+        covered = 0
+        for record in range(len(blocks) // record_size if blocks else 0):
+            first_line, line_count, block_start, block_end, ts_min, ts_max, level_max = \
+                LogSegmentIndex.BLOCK.unpack_from(blocks, record * record_size)
+            block_end = min(block_end, size)
+            if line_count == 0 or block_end <= block_start:
+                continue
+            if block_start > covered:
+                for item in self._scan_unindexed(f, start, max(covered, position), block_start, matches, filtered, stats):
+                    yield item
+            covered = max(covered, block_end)
+            if block_end <= position:
+                continue
+            
+            bloom = record * record_size + LogSegmentIndex.BLOCK.size
+            if ((since is not None and ts_max < since) or (until is not None and ts_min > until)
+                    or level_max < min_level or not self._bloom_contains(blocks, bloom, tokens)):
+                stats['blocks_skipped'] += 1
+                yield start + block_end, None
+                continue
+            
+            stats['blocks_scanned'] += 1
+            with open(base + '.lines', 'rb') as lines_file:
+                lines_file.seek(first_line * LogSegmentIndex.LINE.size)
+                records = lines_file.read(line_count * LogSegmentIndex.LINE.size)
+            meta = {}
+            for delta, seconds, flags in LogSegmentIndex.LINE.iter_unpack(
+                    records[:len(records) - len(records) % LogSegmentIndex.LINE.size]):
+                meta[block_start + delta] = (
+                    ts_min + seconds, flags & ~LogSegmentIndex.STDERR,
+                    'stderr' if flags & LogSegmentIndex.STDERR else 'stdout')
+            
+            for line_offset, data in self._iter_lines(f, max(block_start, position), block_end, stats):
+                info = meta.get(line_offset)
+                if info is None:
+                    if filtered:
+                        continue
+                    info = (None, detect_log_level(data), None)
+                timestamp, level, stream = info
+                if (since is not None and timestamp < since) or (until is not None and timestamp > until) \
+                        or level < min_level or not matches(data):
+                    continue
+                yield start + line_offset + len(data) + 1, (start + line_offset, stream, timestamp, level, data)
+            yield start + block_end, None
+        
+        if covered < size:
+            for item in self._scan_unindexed(f, start, max(covered, position), size, matches, filtered, stats):
+                yield item
+    
+    def _scan_unindexed(self, f, start, begin, end, matches, filtered, stats):
+        if begin >= end:
+            return
+        if not filtered:
+            for line_offset, data in self._iter_lines(f, begin, end, stats):
+                if matches(data):
+                    yield (start + line_offset + len(data) + 1,
+                           (start + line_offset, None, None, detect_log_level(data), data))
+        yield start + end, None
+    
+    def _bloom_contains(self, blocks, bloom, tokens):
+        for token in tokens:
+            for position in bloom_positions(token):
+                if not blocks[bloom + (position >> 3)] & (1 << (position & 7)):
+                    return False
+        return True
+    
+    def _iter_lines(self, f, begin, end, stats):
+        """(offset, data) of the complete lines in [begin, end) of a segment"""
+        position = begin
+        while position < end:
+            f.seek(position)
+            chunk = f.read(min(LOG_READ_CHUNK * 16, end - position))
+            complete = chunk.rfind(b'\n') + 1
+            if complete == 0:
+                return
+            stats['bytes_scanned'] += complete
+            for line in chunk[:complete].split(b'\n')[:-1]:
+                yield position, line
+                position += len(line) + 1
+    
+    def acquire_follower(self):
+        with self._logs_lock:
+            if self._followers >= LOG_FOLLOW_MAX_CLIENTS:
+                return False
+            self._followers += 1
+            return True
+    
+    def release_follower(self):
+        with self._logs_lock:
+            self._followers -= 1
+    
+    # Output capture
+    
+    def feed(self, app_id, stream, pending, chunk):
+        """Split a chunk of raw output into lines, returns the trailing partial line"""
+        log = self.get(app_id)
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            self._emit(app_id, log, stream, line)
+        # Carriage-return progress output may never end a line
+        while len(pending) >= LOG_MAX_LINE:
+            self._emit(app_id, log, stream, pending[:LOG_MAX_LINE])
+            pending = pending[LOG_MAX_LINE:]
+        return pending
+    
+    def finish(self, app_id, stream, pending):
+        """Flush the partial line left when a stream closes"""
+        if pending:
+            self._emit(app_id, self.get(app_id), stream, pending)
+    
+    def _emit(self, app_id, log, stream, line):
+        if line.endswith(b'\r'):
+            line = line[:-1]
+        for start in range(0, max(len(line), 1), LOG_MAX_LINE):
+            entry = log.append(stream, line[start:start + LOG_MAX_LINE])
+            # Never let a slow disk back up into the child's pipe
+            if not self._enqueue((app_id, entry)):
+                log.dropped += 1
+    
+    # Writer thread
+    
+    def _close(self):
+        for state in self._files.values():
+            state[0].close()
+            state[3].close()
+        self._files = {}
+    
+    def _write_batch(self, batch, final=False):
+        touched = set()
+        for app_id, (offset, stream, timestamp, data) in batch:
+            state = self._files.get(app_id)
+            if state is None or state[2] != offset or state[2] - state[1] >= self.segment_bytes:
+                state = self._open_segment(app_id, offset, state)
+            state[0].write(data + b'\n')
+            state[3].add(offset - state[1], timestamp, stream, data)
+            state[2] = offset + len(data) + 1
+            touched.add(app_id)
+        for app_id in touched:
+            # Data first, so the index never points past the end of the segment
+            self._files[app_id][0].flush()
+            self._files[app_id][3].flush()
+    
+    def _open_segment(self, app_id, offset, state):
+        if state is not None:
+            state[0].close()
+            state[3].close()
+        os.makedirs(self._app_dir(app_id), exist_ok=True)
+        start = offset
+        segments = self.segments(app_id)
+        if state is None and segments:
+            # Continue the last segment left by a previous run if it ends here
+            path = self._segment_path(app_id, segments[-1])
+            size = os.path.getsize(path)
+            if segments[-1] + size == offset and size < self.segment_bytes:
+                start = segments[-1]
+        path = self._segment_path(app_id, start)
+        state = self._files[app_id] = [open(path, 'ab'), start, offset, LogSegmentIndex(path)]
+        
+        for old in self.segments(app_id)[:-self.max_segments]:
+            base = self._segment_path(app_id, old)[:-len('.log')]
+            for extension in ('.log', '.lines', '.blocks'):
+                try:
+                    os.remove(base + extension)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"Could not remove old log segment of {app_id}: {e}")
+        return state
+
+
+class EnvironmentResolver:
+    """Finds conda and venv/uv environments and the python inside them.
+    
+    Conda environments are discovered from the usual install locations,
+    CONDA_ENVS_PATH and ~/.conda/environments.txt without running conda at
+    all. The list is cached until the mtime of one of the scanned
+    directories changes, so creating or removing an environment is picked
+    up on the next lookup. Apps in a resolved environment can then run its
+    interpreter directly with the variables activation would set, instead of
+    paying for a 'conda run' wrapper on every start.
+    """
+    
+    def __init__(self, roots=None):
+        self._roots = list(roots) if roots is not None else self._candidate_roots()
+        self._lock = threading.Lock()
+        self._signature = None
+        self._conda = []
+        self._venvs = {}  # prefix -> (pyvenv.cfg mtime, environment)
+    
+    @staticmethod
+    def _candidate_roots():
+        """Directories that may hold a conda installation, most specific first"""
+        roots = []
+        conda_exe = os.environ.get('CONDA_EXE')
+        if conda_exe:
+            # <root>/bin/conda, <root>\Scripts\conda.exe or <root>\condabin\conda.bat
+            roots.append(os.path.dirname(os.path.dirname(conda_exe)))
+        prefix = os.environ.get('CONDA_PREFIX')
+        if prefix:
+            parent = os.path.dirname(prefix)
+            roots.append(os.path.dirname(parent) if os.path.basename(parent) == 'envs' else prefix)
+        for var in ('CONDA_ROOT', 'MAMBA_ROOT_PREFIX'):
+            if os.environ.get(var):
+                roots.append(os.environ[var])
+        
+        bases = [os.path.expanduser('~')]
+        if os.name == 'nt':
+            bases += [os.environ.get('ProgramData', r'C:\ProgramData'), os.environ.get('LOCALAPPDATA', '')]
+        else:
+            bases += ['/opt']
+        for base in filter(None, bases):
+            for name in CONDA_ROOT_NAMES:
+                roots.append(os.path.join(base, name))
+        
+        unique = []
+        for root in roots:
+            root = os.path.normpath(root)
+            if root not in unique:
+                unique.append(root)
+        return unique
+    
+    def _envs_dirs(self):
+        dirs = [os.path.join(root, 'envs') for root in self._roots]
+        dirs += [d for d in os.environ.get('CONDA_ENVS_PATH', '').split(os.pathsep) if d]
+        dirs.append(os.path.join(os.path.expanduser('~'), '.conda', 'envs'))
+        return dirs
+    
+    def _watched_paths(self):
+        return self._roots + self._envs_dirs() + [CONDA_ENVIRONMENTS_TXT]
+    
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+    
+    @staticmethod
+    def _python_path(prefix, kind):
+        if os.name == 'nt':
+            return os.path.join(prefix, 'python.exe' if kind == 'conda' else os.path.join('Scripts', 'python.exe'))
+        return os.path.join(prefix, 'bin', 'python')
+    
+    def _conda_env(self, prefix, name=None):
+        """Environment record of a conda prefix, or None if it isn't one"""
+        python = self._python_path(prefix, 'conda')
+        if not os.path.isdir(os.path.join(prefix, 'conda-meta')) or not os.path.isfile(python):
+            return None
+        activate_dir = os.path.join(prefix, 'etc', 'conda', 'activate.d')
+        try:
+            activate_scripts = bool(os.listdir(activate_dir))
+        except OSError:
+            activate_scripts = False
+        return {
+            'name': name or os.path.basename(prefix),
+            'kind': 'conda',
+            'prefix': prefix,
+            'python': python,
+            # Packages such as cudatoolkit set variables in activate.d scripts,
+            # which only a real activation (conda run) executes
+            'activate_scripts': activate_scripts
+        }
+    
+    def _scan_conda(self):
+        found = {}
+        
+        def add(prefix, name=None):
+            prefix = os.path.normpath(prefix)
+            if prefix not in found:
+                env = self._conda_env(prefix, name)
+                if env is not None:
+                    found[prefix] = env
+        
+        for root in self._roots:
+            add(root, 'base')
+        for envs_dir in self._envs_dirs():
+            try:
+                entries = sorted(os.listdir(envs_dir))
+            except OSError:
+                continue
+            for entry in entries:
+                add(os.path.join(envs_dir, entry))
+        try:
+            with open(CONDA_ENVIRONMENTS_TXT, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        add(line.strip())
+        except OSError:
+            pass
+        return list(found.values())
+    
+    def conda_environments(self):
+        """All conda environments, rescanned only when a scanned directory has changed"""
+        signature = tuple(self._mtime(path) for path in self._watched_paths())
+        with self._lock:
+            if signature != self._signature:
+                self._conda = self._scan_conda()
+                self._signature = signature
+            return list(self._conda)
+    
+    def venv(self, prefix):
+        """Environment record of a venv (e.g. a uv project's .venv), or None"""
+        prefix = os.path.normpath(prefix)
+        mtime = self._mtime(os.path.join(prefix, 'pyvenv.cfg'))
+        with self._lock:
+            cached = self._venvs.get(prefix)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+        env = None
+        python = self._python_path(prefix, 'venv')
+        if mtime is not None and os.path.isfile(python):
+            env = {
+                'name': os.path.basename(prefix),
+                'kind': 'venv',
+                'prefix': prefix,
+                'python': python,
+                'activate_scripts': False
+            }
+        with self._lock:
+            self._venvs[prefix] = (mtime, env)
+        return env
+    
+    def resolve(self, environment, working_dir=None):
+        """Environment an app config refers to, or None if it cannot be found.
+        
+        environment is a conda environment name ('base' included) or the path
+        of a conda or venv prefix, relative paths being taken from working_dir.
+        Without one, a .venv or venv directory in working_dir (as created by
+        uv or python -m venv) is used.
+        """
+        if environment and (os.path.isabs(environment) or '/' in environment or os.sep in environment):
+            prefix = os.path.normpath(os.path.join(working_dir or '', environment))
+            for env in self.conda_environments():
+                if env['prefix'] == prefix:
+                    return env
+            return self._conda_env(prefix) or self.venv(prefix)
+        if environment:
+            for env in self.conda_environments():
+                if env['name'] == environment:
+                    return env
+            return None
+        if working_dir:
+            for name in ('.venv', 'venv'):
+                env = self.venv(os.path.join(working_dir, name))
+                if env is not None:
+                    return env
+        return None
+    
+    @staticmethod
+    def activation_env(env, base=None):
+        """Process environment with env activated on top of base (default os.environ)"""
+        result = dict(os.environ if base is None else base)
+        prefix = env['prefix']
+        result.pop('PYTHONHOME', None)
+        if env['kind'] == 'conda':
+            if os.name == 'nt':
+                paths = [prefix] + [os.path.join(prefix, *part.split('/')) for part in
+                                    ('Library/mingw-w64/bin', 'Library/usr/bin', 'Library/bin', 'Scripts', 'bin')]
+            else:
+                paths = [os.path.join(prefix, 'bin')]
+            result.pop('VIRTUAL_ENV', None)
+            result.update({
+                'CONDA_PREFIX': prefix,
+                'CONDA_DEFAULT_ENV': env['name'],
+                'CONDA_SHLVL': '1',
+                'CONDA_PROMPT_MODIFIER': f"({env['name']}) "
+            })
+        else:
+            paths = [os.path.join(prefix, 'Scripts' if os.name == 'nt' else 'bin')]
+            for name in ('CONDA_PREFIX', 'CONDA_DEFAULT_ENV', 'CONDA_SHLVL', 'CONDA_PROMPT_MODIFIER'):
+                result.pop(name, None)
+            result['VIRTUAL_ENV'] = prefix
+        path_key = next((key for key in result if key.upper() == 'PATH'), 'PATH')
+        result[path_key] = os.pathsep.join(paths + ([result[path_key]] if result.get(path_key) else []))
+        return result
+
+
+class AppLaunch:
+    """Startup timings of one launch of an app, in seconds since the launch"""
+    
+    TIMINGS = ('time_to_first_output', 'time_to_port_open', 'time_to_http_ok', 'time_to_ready')
+    
+    def __init__(self, pid):
+        self.pid = pid
+        self.started_at = datetime.now()
+        self.timings = dict.fromkeys(self.TIMINGS)
+        self.exit_code = None
+        self.exited_at = None
+        self._start = time.monotonic()
+    
+    def elapsed(self):
+        return time.monotonic() - self._start
+    
+    def mark(self, name):
+        """Record a timing the first time it is reached; True if it was new"""
+        if self.timings[name] is not None:
+            return False
+        self.timings[name] = round(self.elapsed(), 3)
+        return True
+    
+    def finish(self, exit_code):
+        self.exit_code = exit_code
+        self.exited_at = datetime.now()
+    
+    def to_dict(self):
+        return dict(
+            self.timings,
+            pid=self.pid,
+            started_at=self.started_at.isoformat(),
+            exit_code=self.exit_code,
+            exited_at=self.exited_at.isoformat() if self.exited_at else None
+        )
+
+
+class ProcessSupervisor:
+    """Single asyncio event loop thread that owns all managed child processes.
+    
+    Children run as asyncio subprocesses: their output is read by stream
+    tasks and their exit is detected by awaiting them (through pidfds where
+    the platform has them), so the number of threads does not grow with the
+    number of apps. Other threads hand coroutines to the loop with call() or
+    submit(); since every lifecycle transition runs on the loop, transitions
+    never race with each other.
+    """
+    
+    def __init__(self):
+        self.loop = None
+        self._thread = None
+        self._ready = threading.Event()
+    
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._run, name='process-supervisor')
+        self._thread.daemon = True
+        self._thread.start()
+        self._ready.wait()
+    
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._install_child_watcher()
+        self.loop.call_soon(self._ready.set)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+    
+    def _install_child_watcher(self):
+        # Before 3.12 asyncio watches each child from a thread of its own
+        # unless a pidfd based watcher is installed
+        if os.name == 'nt' or sys.version_info >= (3, 12) or not hasattr(asyncio, 'PidfdChildWatcher'):
+            return
+        try:
+            os.close(os.pidfd_open(os.getpid()))
+            watcher = asyncio.PidfdChildWatcher()
+            watcher.attach_loop(self.loop)
+            asyncio.set_child_watcher(watcher)
+        except (AttributeError, OSError) as e:
+            logger.info(f"pidfd not available, using the default child watcher: {e}")
+    
+    def in_loop(self):
+        return threading.current_thread() is self._thread
+    
+    def submit(self, coro):
+        """Schedule a coroutine on the loop, returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+    
+    def call(self, coro, timeout=None):
+        """Run a coroutine on the loop and wait for its result (not from the loop)"""
+        if self.in_loop():
+            coro.close()
+            raise RuntimeError('ProcessSupervisor.call() would deadlock on the supervisor loop')
+        return self.submit(coro).result(timeout)
+    
+    def stop(self):
+        if self.loop is not None and self._thread and self._thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=5)
+
+
+class AppManager:
+    def __init__(self, log_store=None, supervisor=None, environments=None):
+        self.processes = {}
+        self.app_status = {}
+        self.start_times = {}
+        # Long-lived psutil handles for every process in each app's tree so
+        # CPU% can be computed from deltas between sampler ticks
+        self.process_trees = ProcessTreeTracker()
+        # Latest per-app resource sample, filled by sample_resources()
+        self.resource_cache = {}
+        # Lifecycle state index, updated on start/stop/exit events so counts
+        # and running sets can be read without touching psutil or NVML
+        self._state_lock = threading.Lock()
+        self._running = set()
+        # Bumped on every lifecycle transition and resource sample so
+        # consumers can tell when app status has changed
+        self.version = 0
+        self._state_listeners = []
+        # Captured stdout/stderr of the apps
+        self.log_store = log_store or LogStore()
+        # All process handles are created, awaited and cleared on the
+        # supervisor loop; processes/start_times are only mutated there
+        self.supervisor = supervisor or ProcessSupervisor()
+        self.environments = environments or EnvironmentResolver()
+        self._transition_locks = {}
+        self._tasks = set()
+        self._stopping = set()  # processes stopped by stop_app_async, until _supervise has seen them exit
+        self._shutting_down = False  # set by stop_all_async, refuses further starts
+        # Readiness of running apps as seen by the port probes
+        # ('starting', 'ready' or 'unhealthy'; None for apps that are not probed)
+        self.readiness = {}
+        self.launches = {}  # app_id -> deque of AppLaunch, most recent last
+        self._readiness_listeners = []
+        
+    def start_app(self, app_id):
+        """Start a Python application in its conda environment or as executable"""
+        return self.supervisor.call(self.start_app_async(app_id))
+    
+    def stop_app(self, app_id):
+        """Stop a running Python application"""
+        return self.supervisor.call(self.stop_app_async(app_id))
+    
+    def _transition_lock(self, app_id):
+        """Per-app lock serializing start/stop of one app on the supervisor loop"""
+        lock = self._transition_locks.get(app_id)
+        if lock is None:
+            lock = self._transition_locks[app_id] = asyncio.Lock()
+        return lock
+    
+    def _build_command(self, config):
+        """Command line, working directory and environment variables (None: inherit) of an app"""
+        # Set working directory
+        working_dir = config.get('working_dir', os.path.dirname(config['path']))
+        env = None
+        
+        # Build command based on app type
+        if config.get('type') == 'executable':
+            # For ComfyUI - use embedded python directly
+            # Build absolute path for the executable
+            if os.path.isabs(config['path']):
+                executable_path = config['path']
+            else:
+                executable_path = os.path.join(working_dir, config['path'])
+            
+            # Convert to Windows-style path and ensure it exists
+            executable_path = os.path.normpath(executable_path)
+            
+            if not os.path.exists(executable_path):
+                raise FileNotFoundError(f"Executable not found: {executable_path}")
+            
+            cmd = [executable_path] + config.get('args', [])
+            logger.info(f"Starting {config['name']} with executable: {executable_path}")
+            
+        elif config.get('type') == 'batch':
+            # For SwarmUI - use batch file
+            if os.path.isabs(config['path']):
+                batch_path = config['path']
+            else:
+                batch_path = os.path.join(working_dir, config['path'])
+            
+            batch_path = os.path.normpath(batch_path)
+            
+            if not os.path.exists(batch_path):
+                raise FileNotFoundError(f"Batch file not found: {batch_path}")
+            
+            # Use cmd.exe to run the batch file
+            cmd = ['cmd.exe', '/c', batch_path] + config.get('args', [])
+            logger.info(f"Starting {config['name']} with batch file: {batch_path}")
+            
+        elif config.get('type') in ('conda', 'venv') or config.get('environment'):
+            # For conda environments and venvs
+            cmd, env = self._python_command(config, working_dir)
                 
-                if config['environment'] and config['environment'] != 'base':
-                    # For non-base environments, use conda run
-                    cmd = [
-                        conda_cmd, 'run', '-n', config['environment'],
-                        python_cmd, config['path']
-                    ]
+        else:
+            # Default: direct python execution, in the project's venv if it has one
+            venv = self.environments.resolve(None, working_dir)
+            if venv is not None:
+                cmd, env = [venv['python'], config['path']], self.environments.activation_env(venv)
+            else:
+                cmd = ['python', config['path']]
+        
+        return cmd, working_dir, env
+    
+    def _python_command(self, config, working_dir):
+        """Command line and environment variables running a script in its conda env or venv.
+        
+        A resolved environment's python is executed directly with the
+        activation variables set; 'conda run' is only used for environments
+        that cannot be found or whose activate.d scripts have to run.
+        """
+        if os.name == 'nt':  # Windows
+            conda_cmd = 'conda.exe'
+            python_cmd = 'python.exe'
+        else:  # Unix-like systems
+            conda_cmd = 'conda'
+            python_cmd = 'python'
+        
+        environment = config.get('environment')
+        env = self.environments.resolve(environment, working_dir)
+        if env is not None and not env['activate_scripts']:
+            return [env['python'], config['path']], self.environments.activation_env(env)
+        
+        if env is not None:
+            return [conda_cmd, 'run', '-p', env['prefix'], python_cmd, config['path']], None
+        if environment and environment != 'base':
+            logger.warning(f"Environment {environment} not found, falling back to conda run")
+            return [conda_cmd, 'run', '-n', environment, python_cmd, config['path']], None
+        # For base environment, just use python directly
+        return [python_cmd, config['path']], None
+    
+    async def start_app_async(self, app_id):
+        """Start an app (runs on the supervisor loop)"""
+        if app_id not in app_configs:
+            return {'success': False, 'error': 'App not found'}
+        
+        async with self._transition_lock(app_id):
+            return await self._start_locked(app_id)
+    
+    async def _start_locked(self, app_id):
+        if self._shutting_down:
+            return {'success': False, 'error': 'Server is shutting down'}
+        if self.is_process_running(app_id):
+            return {'success': False, 'error': 'App is already running'}
+        
+        config = app_configs.get(app_id)
+        if config is None:
+            return {'success': False, 'error': 'App not found'}
+        try:
+            cmd, working_dir, env = self._build_command(config)
+            logger.info(f"Starting {config['name']} in directory: {working_dir}")
+            logger.info(f"Command: {' '.join(cmd)}")
+            
+            # Own session / process group, so the whole tree (e.g. the
+            # children of 'conda run') can be signalled at once
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                cwd=working_dir,
+                env=env,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == 'nt' else 0,
+                start_new_session=os.name != 'nt'
+            )
+            
+            launch = AppLaunch(process.pid)
+            probed = bool(config.get('port')) and config.get('probe', 'http') != 'none'
+            with self._state_lock:
+                self.processes[app_id] = process
+                self.start_times[app_id] = launch.started_at
+                self.readiness[app_id] = 'starting' if probed else None
+                self.launches.setdefault(app_id, deque(maxlen=LAUNCH_HISTORY_SIZE)).append(launch)
+            self._set_state(app_id, 'running')
+            
+            logger.info(f"Started {config['name']} (PID: {process.pid})")
+            
+            # Drain output and wait for the exit on the loop, no thread per app
+            task = asyncio.ensure_future(self._supervise(app_id, process, launch, probed))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            
+            return {
+                'success': True,
+                'pid': process.pid,
+                'started_at': self.start_times[app_id].isoformat(),
+                'command': ' '.join(cmd)
+            }
+        
+        except Exception as e:
+            logger.error(f"Failed to start {config['name']}: {str(e)}")
+            return {'success': False, 'error': str(e)}
+    
+    async def stop_app_async(self, app_id, grace=STOP_GRACE_PERIOD):
+        """Stop an app and all its descendants (runs on the supervisor loop)"""
+        async with self._transition_lock(app_id):
+            return await self._stop_locked(app_id, grace)
+    
+    async def _stop_locked(self, app_id, grace=STOP_GRACE_PERIOD):
+        process = self.processes.get(app_id)
+        if process is None:
+            return {'success': False, 'error': 'App is not running'}
+        
+        self._stopping.add(process)
+        try:
+            await self._terminate_tree(app_id, process, grace)
+            
+            # Clean up
+            self._clear_process(app_id, process)
+            
+            config = app_configs.get(app_id, {})
+            logger.info(f"Stopped {config.get('name', app_id)}")
+            
+            return {'success': True}
+        
+        except Exception as e:
+            logger.error(f"Failed to stop {app_id}: {str(e)}")
+            return {'success': False, 'error': str(e)}
+    
+    async def restart_app_async(self, app_id, report=None):
+        """Stop an app, wait until its tree has exited and its port is free, start it again.
+        
+        report(step) is called as the restart moves through its steps.
+        """
+        report = report or (lambda step: None)
+        if app_id not in app_configs:
+            return {'success': False, 'error': 'App not found'}
+        
+        async with self._transition_lock(app_id):
+            if self.processes.get(app_id) is not None:
+                report('stopping')
+                result = await self._stop_locked(app_id)
+                if not result['success']:
+                    return result
+            
+            port = app_configs.get(app_id, {}).get('port')
+            if port:
+                report('waiting_for_port')
+                if not await self._wait_port_free(int(port), PORT_RELEASE_TIMEOUT):
+                    return {'success': False, 'error': f'Port {port} is still in use'}
+            
+            report('starting')
+            return await self._start_locked(app_id)
+    
+    @staticmethod
+    def port_in_use(port):
+        """True if a TCP port cannot be bound, e.g. because something still listens on it"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            if os.name != 'nt':
+                # Like the servers we start, ignore connections left in TIME_WAIT
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(('', port))
+            return False
+        except OSError:
+            return True
+        finally:
+            sock.close()
+    
+    async def _wait_port_free(self, port, timeout):
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        while self.port_in_use(port):
+            if loop.time() >= deadline:
+                return False
+            await asyncio.sleep(PORT_POLL_INTERVAL)
+        return True
+    
+    def stop_all(self, timeout=SHUTDOWN_TIMEOUT):
+        """Stop every running app concurrently within timeout seconds"""
+        return self.supervisor.call(self.stop_all_async(timeout), timeout + STOP_KILL_TIMEOUT + 1)
+    
+    async def stop_all_async(self, timeout=SHUTDOWN_TIMEOUT):
+        # Leave room for the kill phase inside the global deadline
+        grace = max(min(STOP_GRACE_PERIOD, timeout - STOP_KILL_TIMEOUT), 0.0)
+        # Don't queue behind transition locks: a restart may hold one while
+        # it waits up to PORT_RELEASE_TIMEOUT for the port. Pending starts
+        # see _shutting_down and give up; stopping a process twice is harmless.
+        self._shutting_down = True
+        results = {}
+        while True:
+            # A start that was already spawning may register one more process
+            app_ids = [app_id for app_id in self.processes if app_id not in results]
+            if not app_ids:
+                return results
+            stopped = await asyncio.gather(*[self._stop_locked(app_id, grace) for app_id in app_ids])
+            results.update(zip(app_ids, stopped))
+    
+    async def batch_async(self, action, app_ids, max_parallel, on_result):
+        """Start, stop or restart many apps, at most max_parallel at a time.
+        
+        on_result(result) is called with each app's result as soon as it is
+        done. Starting a running app or stopping a stopped one counts as a
+        skipped success, so a batch can simply name the desired state.
+        
+        Apps are handled in dependency order, one level at a time: a start
+        also starts the dependencies of app_ids, and the next level only
+        begins once the apps it depends on are ready (as reported by the port
+        probes), so dependents of an app that fails are not started at all.
+        Stops go the other way round, dependents first.
+        """
+        handlers = {
+            'start': self.start_app_async,
+            'stop': self.stop_app_async,
+            'restart': self.restart_app_async
+        }
+        semaphore = asyncio.Semaphore(max_parallel)
+        
+        async def run(app_id):
+            async with semaphore:
+                started = time.monotonic()
+                try:
+                    result = await handlers[action](app_id)
+                except Exception as e:
+                    logger.error(f"Batch {action} of {app_id} failed: {e}")
+                    result = {'success': False, 'error': str(e)}
+                if (not result['success'] and action != 'restart' and app_id in app_configs
+                        and self.is_process_running(app_id) == (action == 'start')):
+                    result = {'success': True, 'skipped': True}
+                on_result(dict(result, app_id=app_id, action=action,
+                               elapsed=round(time.monotonic() - started, 3)))
+                return result['success']
+        
+        levels = dependency_levels(app_configs, app_ids, include_dependencies=action == 'start')
+        if action == 'stop':
+            levels.reverse()
+        failed = set()
+        for index, level in enumerate(levels):
+            runnable = []
+            for app_id in level:
+                blocked = [dependency for dependency in app_dependencies(app_configs.get(app_id, {}))
+                           if dependency in failed]
+                if blocked and action != 'stop':
+                    failed.add(app_id)
+                    on_result({'success': False, 'error': f"Dependencies not ready: {', '.join(blocked)}",
+                               'app_id': app_id, 'action': action, 'elapsed': 0.0})
+                else:
+                    runnable.append(app_id)
+            
+            outcomes = await asyncio.gather(*[run(app_id) for app_id in runnable])
+            failed.update(app_id for app_id, ok in zip(runnable, outcomes) if not ok)
+            if action == 'stop' or index == len(levels) - 1:
+                continue
+            
+            # Gate the next level on the readiness of what it depends on, not on a fixed sleep
+            needed = {dependency for later in levels[index + 1:] for app_id in later
+                      for dependency in app_dependencies(app_configs.get(app_id, {}))}
+            gated = [app_id for app_id, ok in zip(runnable, outcomes) if ok and app_id in needed]
+            ready = await asyncio.gather(*[self._wait_ready(app_id, DEPENDENCY_READY_TIMEOUT) for app_id in gated])
+            for app_id, ok in zip(gated, ready):
+                if not ok:
+                    logger.warning(f"{app_id} did not become ready, not starting the apps depending on it")
+                    failed.add(app_id)
+    
+    async def _wait_ready(self, app_id, timeout):
+        """Wait until a started app is ready (or has no probe); False if it exits, turns unhealthy or times out"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.is_process_running(app_id):
+                return False
+            readiness = self.readiness.get(app_id)
+            if readiness != 'starting':
+                return readiness != 'unhealthy'
+            await asyncio.sleep(DEPENDENCY_POLL_INTERVAL)
+        return False
+    
+    def _descendants(self, app_id, process):
+        """psutil handles of all known descendants of an app's root process"""
+        found = {pid: proc for pid, proc in self.process_trees.members(app_id).items() if pid != process.pid}
+        try:
+            for child in psutil.Process(process.pid).children(recursive=True):
+                found.setdefault(child.pid, child)
+        except psutil.Error:
+            pass
+        return list(found.values())
+    
+    def _signal_tree(self, process, descendants, sig):
+        """Signal the app's process group plus descendants that left it"""
+        try:
+            os.killpg(process.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+        for proc in descendants:
+            try:
+                proc.send_signal(sig)  # psutil guards against PID reuse
+            except psutil.Error:
+                pass
+    
+    async def _terminate_tree(self, app_id, process, grace):
+        """Graceful term, wait up to grace seconds, then kill the whole tree"""
+        descendants = self._descendants(app_id, process)
+        if os.name == 'nt':
+            try:
+                # Reaches every process of the console process group
+                os.kill(process.pid, signal.CTRL_BREAK_EVENT)
+            except OSError:
+                pass
+        else:
+            self._signal_tree(process, descendants, signal.SIGTERM)
+        
+        if await self._wait_tree(process, descendants, grace):
+            return
+        logger.warning(f"{app_id} did not stop within {grace:.1f}s, killing its process tree")
+        if os.name == 'nt':
+            killer = await asyncio.create_subprocess_exec(
+                'taskkill', '/F', '/T', '/PID', str(process.pid),
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+            await killer.wait()
+            for proc in descendants:
+                try:
+                    proc.kill()
+                except psutil.Error:
+                    pass
+        else:
+            self._signal_tree(process, descendants, signal.SIGKILL)
+        if not await self._wait_tree(process, descendants, STOP_KILL_TIMEOUT):
+            logger.error(f"Processes of {app_id} are still alive after SIGKILL")
+    
+    async def _wait_tree(self, process, descendants, timeout):
+        """Wait until the root has exited and no descendant is alive"""
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        while True:
+            if process.returncode is not None and not any(self._alive(proc) for proc in descendants):
+                return True
+            if loop.time() >= deadline:
+                return False
+            await asyncio.sleep(0.1)
+    
+    @staticmethod
+    def _alive(proc):
+        try:
+            return proc.status() != psutil.STATUS_ZOMBIE
+        except psutil.Error:
+            return False
+    
+    def get_app_status(self, app_id, fields=None, resources=True, is_running=None):
+        """Get the current status of an application
+        
+        fields is an optional parse_fields() tree; fields outside it are not
+        computed at all. resources=False skips resource data entirely.
+        """
+        if app_id not in app_configs:
+            return {'error': 'App not found'}
+            
+        config = app_configs[app_id]
+        if is_running is None:
+            is_running = self.is_process_running(app_id)
+        
+        status = {
+            'id': app_id,
+            'name': config['name'],
+            'status': 'running' if is_running else 'stopped',
+            'environment': config['environment'],
+            'path': config['path'],
+            'port': config['port'],
+            'depends_on': app_dependencies(config),
+            'description': config['description'],
+            'output_folder': config.get('output_folder')  # Add output folder if present
+        }
+        
+        # Read these under the lock so a concurrent exit cannot split them
+        with self._state_lock:
+            process = self.processes.get(app_id)
+            started = self.start_times.get(app_id)
+            readiness = self.readiness.get(app_id)
+            launches = self.launches.get(app_id)
+            launch = launches[-1] if launches else None
+        if is_running and process is not None and started is not None:
+            wanted = lambda name: fields is None or name in fields
+            if wanted('readiness'):
+                status['readiness'] = readiness
+            if wanted('launch') and launch is not None:
+                status['launch'] = launch.to_dict()
+            if wanted('uptime'):
+                uptime = (datetime.now() - started).total_seconds()
+                status['uptime'] = int(uptime)
+            if wanted('started_at'):
+                status['started_at'] = started.isoformat()
+            if wanted('pid'):
+                status['pid'] = process.pid
+            
+            if resources and wanted('resources'):
+                # Resource usage comes from the background sampler
+                cached = self.resource_cache.get(app_id)
+                status['resources'] = dict(cached) if cached else self._empty_resources()
+        
+        if fields is not None:
+            # The id is always kept so clients can match entries
+            status = project(status, dict(fields, id=None))
+            
+        return status
+    
+    def add_state_listener(self, func):
+        """Call func(app_id, state) after every lifecycle transition"""
+        self._state_listeners.append(func)
+    
+    def add_readiness_listener(self, func):
+        """Call func(app_id, readiness, launch) whenever a probe changes an app's readiness"""
+        self._readiness_listeners.append(func)
+    
+    def _set_readiness(self, app_id, process, readiness, launch):
+        """Record a readiness change of a process that is still the app's current one"""
+        with self._state_lock:
+            if self.processes.get(app_id) is not process:
+                return
+            self.readiness[app_id] = readiness
+            self.version += 1
+        
+        for listener in self._readiness_listeners:
+            try:
+                listener(app_id, readiness, launch.to_dict())
+            except Exception as e:
+                logger.warning(f"App readiness listener failed for {app_id}: {e}")
+    
+    def launch_history(self, app_id):
+        """Startup timings of the most recent launches of an app, oldest first"""
+        with self._state_lock:
+            launches = list(self.launches.get(app_id, ()))
+        return [launch.to_dict() for launch in launches]
+    
+    def launch_timings(self):
+        """Startup timings of the current launch of every running app, for the metrics history"""
+        with self._state_lock:
+            current = {app_id: self.launches[app_id][-1] for app_id in self._running if self.launches.get(app_id)}
+        return {app_id: launch.timings for app_id, launch in current.items()}
+    
+    def _set_state(self, app_id, state):
+        """Record a lifecycle transition in the state index"""
+        with self._state_lock:
+            self.app_status[app_id] = state
+            if state == 'running':
+                self._running.add(app_id)
+            else:
+                self._running.discard(app_id)
+            self.version += 1
+        
+        for listener in self._state_listeners:
+            try:
+                listener(app_id, state)
+            except Exception as e:
+                logger.warning(f"App state listener failed for {app_id}: {e}")
+    
+    def _clear_process(self, app_id, process):
+        """Forget a process once it has been stopped or has exited.
+        
+        Only clears the entry if it still refers to the given process, so a
+        late exit event of an old instance cannot clobber a restarted one.
+        """
+        with self._state_lock:
+            if self.processes.get(app_id) is not process:
+                return
+            del self.processes[app_id]
+            self.start_times.pop(app_id, None)
+            self.readiness.pop(app_id, None)
+        self._set_state(app_id, 'stopped')
+    
+    def running_count(self):
+        """Number of running apps, read from the state index in O(1)"""
+        return len(self._running)
+    
+    def forget_app(self, app_id):
+        """Drop all state kept for an app whose configuration was removed"""
+        with self._state_lock:
+            self.app_status.pop(app_id, None)
+            self._running.discard(app_id)
+            self.launches.pop(app_id, None)
+    
+    def get_all_apps_status(self, fields=None, status=None, resources=True):
+        """Get status of all configured applications
+        
+        status ('running' or 'stopped') filters apps before anything else is
+        computed; fields and resources are passed on to get_app_status().
+        """
+        apps_status = []
+        for app_id in list(app_configs.keys()):
+            is_running = self.is_process_running(app_id)
+            if status is not None and status != ('running' if is_running else 'stopped'):
+                continue
+            apps_status.append(self.get_app_status(app_id, fields, resources, is_running))
+        return apps_status
+    
+    def _empty_resources(self):
+        """Placeholder resources for apps that have not been sampled yet"""
+        return {
+            'cpu_percent': 0,
+            'memory_mb': 0,
+            'memory_percent': 0,
+            'gpu_percent': None,
+            'gpu_memory_mb': None
+        }
+    
+    def _sample_member(self, proc):
+        """Resource usage of a single tree member"""
+        with proc.oneshot():
+            memory_info = proc.memory_info()
+            sample = {
+                'pid': proc.pid,
+                'name': proc.name(),
+                # Non-blocking: percentage since the previous sampler tick
+                'cpu_percent': proc.cpu_percent(interval=None),
+                'rss': memory_info.rss,
+                'memory_percent': proc.memory_percent(),
+                'threads': proc.num_threads()
+            }
+        try:
+            sample['uss'] = proc.memory_full_info().uss
+        except (psutil.AccessDenied, AttributeError):
+            sample['uss'] = None
+        return sample
+    
+    def sample_resources(self):
+        """Sample resource usage of all running apps (called by the metrics sampler)"""
+        roots = {}
+        for app_id, process in list(self.processes.items()):
+            if process.returncode is None:
+                roots[app_id] = process.pid
+        
+        trees = self.process_trees.refresh(roots)
+        mb = 1024 * 1024
+        
+        for app_id, members in trees.items():
+            samples = []
+            for proc in members.values():
+                try:
+                    samples.append(self._sample_member(proc))
+                except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                    continue
+                except psutil.AccessDenied as e:
+                    logger.debug(f"Could not sample PID {proc.pid} of {app_id}: {e}")
+            
+            if not samples:
+                logger.warning(f"Could not get resource usage for {app_id}")
+                self.resource_cache[app_id] = self._empty_resources()
+                continue
+            
+            gpu_memory = 0.0
+            gpu_percent = None
+            gpu_sources = set()
+            engines = {}
+            devices = set()
+            for sample in samples:
+                # Try to get GPU usage if process is using GPU
+                gpu_usage = system_monitor.get_process_gpu_usage(sample['pid'])
+                sample['gpu_memory_mb'] = round(gpu_usage['memory_mb'], 1) if gpu_usage else None
+                if not gpu_usage:
+                    continue
+                gpu_memory += gpu_usage['memory_mb']
+                devices.add(gpu_usage['device'])
+                gpu_sources.add(gpu_usage['utilization_source'])
+                utilization = gpu_usage['utilization_percent']
+                if utilization is not None:
+                    if gpu_usage['utilization_source'] == 'process':
+                        # Per-process samples add up across the tree
+                        gpu_percent = (gpu_percent or 0.0) + utilization
+                    else:
+                        # Device totals would be double counted; keep the highest
+                        gpu_percent = max(gpu_percent or 0.0, utilization)
+                for name, value in (gpu_usage['engines'] or {}).items():
+                    engines[name] = engines.get(name, 0.0) + value
+            
+            uss_values = [sample['uss'] for sample in samples if sample['uss'] is not None]
+            resources = {
+                'cpu_percent': round(sum(sample['cpu_percent'] for sample in samples), 1),
+                'memory_mb': round(sum(sample['rss'] for sample in samples) / mb, 1),
+                'memory_uss_mb': round(sum(uss_values) / mb, 1) if uss_values else None,
+                'memory_percent': round(sum(sample['memory_percent'] for sample in samples), 1),
+                'threads': sum(sample['threads'] for sample in samples),
+                'process_count': len(samples),
+                'gpu_memory_mb': round(gpu_memory, 1) if devices else None,
+                'gpu_percent': round(gpu_percent, 1) if gpu_percent is not None else None,
+                'processes': [
+                    {
+                        'pid': sample['pid'],
+                        'name': sample['name'],
+                        'cpu_percent': round(sample['cpu_percent'], 1),
+                        'memory_mb': round(sample['rss'] / mb, 1),
+                        'memory_uss_mb': round(sample['uss'] / mb, 1) if sample['uss'] is not None else None,
+                        'threads': sample['threads'],
+                        'gpu_memory_mb': sample['gpu_memory_mb']
+                    }
+                    for sample in sorted(samples, key=lambda sample: sample['pid'])
+                ]
+            }
+            if devices:
+                resources['gpu_devices'] = sorted(d for d in devices if d is not None)
+                # 'process' when NVML sampled the PIDs, 'device' when it is the whole GPU's load
+                resources['gpu_percent_source'] = 'process' if gpu_sources == {'process'} else 'device'
+                if engines:
+                    resources['gpu_engines'] = {name: round(value, 1) for name, value in engines.items()}
+            
+            self.resource_cache[app_id] = resources
+        
+        for app_id in list(self.resource_cache):
+            if app_id not in trees:
+                del self.resource_cache[app_id]
+        
+        with self._state_lock:
+            self.version += 1
+    
+    def is_process_running(self, app_id):
+        """Check if a process is still running"""
+        process = self.processes.get(app_id)
+        return process is not None and process.returncode is None
+    
+    async def _supervise(self, app_id, process, launch, probed):
+        """Drain a child's output, probe its port and clean up when it exits"""
+        name = app_configs.get(app_id, {}).get('name', app_id)
+        readers = [
+            asyncio.ensure_future(self._pump(app_id, stream, pipe, launch))
+            for stream, pipe in (('stdout', process.stdout), ('stderr', process.stderr))
+        ]
+        probe = asyncio.ensure_future(self._probe(app_id, process, launch)) if probed else None
+        exit_code = await process.wait()
+        launch.finish(exit_code)
+        if probe is not None:
+            probe.cancel()
+        stopped = process in self._stopping
+        
+        if os.name != 'nt' and not stopped:
+            # Don't leave orphans behind (e.g. workers of a crashed 'conda run')
+            try:
+                os.killpg(process.pid, signal.SIGTERM)
+                logger.warning(f"{name} exited but left processes behind, terminating its process group")
+            except (ProcessLookupError, PermissionError):
+                pass
+        
+        # Let the readers pick up whatever is still buffered in the pipes
+        done, pending = await asyncio.wait(readers, timeout=5)
+        for reader in pending:
+            reader.cancel()
+        
+        if stopped:
+            # Killed by stop/restart, a non-zero code is expected
+            logger.info(f"{name} process stopped (exit code {exit_code})")
+        else:
+            logger.info(f"{name} process exited with code: {exit_code}")
+        if exit_code and not stopped:
+            # Surface the end of stderr for debugging; the full output is in the log files
+            stderr = [entry[3] for entry in self.log_store.get(app_id).tail(20, 'stderr')]
+            if stderr:
+                logger.error(f"{name} stderr (last {len(stderr)} lines):\n"
+                             + b'\n'.join(stderr).decode('utf-8', 'replace'))
+        
+        self._clear_process(app_id, process)
+        self._stopping.discard(process)
+    
+    async def _pump(self, app_id, stream, pipe, launch):
+        """Move one pipe's output into the log store as it arrives"""
+        pending = b''
+        try:
+            while True:
+                chunk = await pipe.read(LOG_READ_CHUNK)
+                if not chunk:
+                    break
+                launch.mark('time_to_first_output')
+                pending = self.log_store.feed(app_id, stream, pending, chunk)
+        except (OSError, ValueError) as e:
+            logger.debug(f"Stopped reading {stream} of {app_id}: {e}")
+        finally:
+            self.log_store.finish(app_id, stream, pending)
+    
+    async def _probe(self, app_id, process, launch):
+        """Probe an app's port until it answers, then keep checking its health.
+        
+        While the app is starting the probe interval backs off from
+        PROBE_INITIAL_DELAY to PROBE_MAX_DELAY, and starts over when the port
+        opens since the HTTP side usually follows shortly. Once ready the app
+        is only checked with a TCP connect (no requests in its access log)
+        every PROBE_READY_INTERVAL and marked unhealthy after
+        PROBE_FAILURE_THRESHOLD failures in a row.
+        """
+        config = app_configs.get(app_id, {})
+        name = config.get('name', app_id)
+        port = config.get('port')
+        if not port:
+            return
+        port = int(port)
+        mode = config.get('probe', 'http')
+        path = config.get('probe_path')
+        delay = PROBE_INITIAL_DELAY
+        failures = 0
+        
+        while process.returncode is None:
+            port_was_open = launch.timings['time_to_port_open'] is not None
+            was_ready = launch.timings['time_to_ready'] is not None
+            ok = await self._check_port(port, 'tcp' if was_ready else mode, path, launch)
+            readiness = self.readiness.get(app_id)
+            if ok:
+                failures = 0
+                if launch.mark('time_to_ready'):
+                    timings = ', '.join(f"{key[8:]} {value:.1f}s" for key, value in launch.timings.items()
+                                        if value is not None and key != 'time_to_ready')
+                    logger.info(f"{name} ready after {launch.timings['time_to_ready']:.1f}s ({timings})")
+                if readiness != 'ready':
+                    self._set_readiness(app_id, process, 'ready', launch)
+                delay = PROBE_READY_INTERVAL
+            elif readiness == 'starting':
+                if launch.elapsed() > PROBE_STARTUP_TIMEOUT:
+                    logger.warning(f"{name} is not answering on port {port} after {PROBE_STARTUP_TIMEOUT:.0f}s")
+                    self._set_readiness(app_id, process, 'unhealthy', launch)
+                if not port_was_open and launch.timings['time_to_port_open'] is not None:
+                    delay = PROBE_INITIAL_DELAY
+                else:
+                    delay = min(delay * PROBE_BACKOFF_FACTOR, PROBE_MAX_DELAY)
+            else:
+                failures += 1
+                if failures >= PROBE_FAILURE_THRESHOLD and readiness == 'ready':
+                    logger.warning(f"{name} failed {failures} health checks on port {port}")
+                    self._set_readiness(app_id, process, 'unhealthy', launch)
+                # Confirm a failure quickly, then settle at the slowest rate
+                delay = PROBE_INITIAL_DELAY if failures < PROBE_FAILURE_THRESHOLD else PROBE_MAX_DELAY
+            await asyncio.sleep(delay)
+    
+    @staticmethod
+    async def _check_port(port, mode, path, launch):
+        """One probe: a TCP connect and, in 'http' mode, a GET of path.
+        
+        Any HTTP response counts as ready (apps may well answer / with a
+        404); with a configured probe_path it has to be 2xx/3xx. Either way
+        time_to_http_ok is only recorded for a 2xx/3xx response.
+        """
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(PROBE_HOST, port), PROBE_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        try:
+            launch.mark('time_to_port_open')
+            if mode == 'tcp':
+                return True
+            writer.write(f"GET {path or '/'} HTTP/1.0\r\nHost: {PROBE_HOST}:{port}\r\n"
+                         "User-Agent: app-manager-probe\r\nConnection: close\r\n\r\n".encode('ascii'))
+            status_line = await asyncio.wait_for(reader.readline(), PROBE_TIMEOUT)
+            parts = status_line.split(None, 2)
+            if len(parts) < 2 or not parts[0].startswith(b'HTTP/') or not parts[1].isdigit():
+                return False
+            # Read the rest of the (small) response so the app does not see a broken pipe
+            remaining = PROBE_MAX_RESPONSE
+            while remaining > 0:
+                data = await asyncio.wait_for(reader.read(min(remaining, 65536)), PROBE_TIMEOUT)
+                if not data:
+                    break
+                remaining -= len(data)
+            ok = 200 <= int(parts[1]) < 400
+            if ok:
+                # Only a successful status counts for the startup timing
+                launch.mark('time_to_http_ok')
+            return ok or path is None
+        except (OSError, ValueError, asyncio.TimeoutError):
+            return False
+        finally:
+            writer.close()
+
+class OperationRegistry:
+    """Long-running operations (e.g. restarts) started by API requests.
+    
+    Each operation gets an id the client can poll via /api/operations/<id>;
+    every change is also passed to listeners so it can be pushed over
+    /api/stream. Only the most recent max_operations are kept.
+    """
+    
+    def __init__(self, max_operations=OPERATIONS_MAX):
+        self.max_operations = max_operations
+        self._operations = {}  # insertion ordered, oldest first
+        self._lock = threading.Lock()
+        self._listeners = []
+    
+    def add_listener(self, func):
+        """Call func(operation) after every change of an operation"""
+        self._listeners.append(func)
+    
+    def create(self, kind, app_id=None):
+        now = datetime.now().isoformat()
+        operation = {
+            'id': uuid.uuid4().hex,
+            'type': kind,
+            'app_id': app_id,
+            'status': 'pending',
+            'step': None,
+            'steps': [],
+            'created_at': now,
+            'updated_at': now,
+            'finished_at': None,
+            'result': None,
+            'error': None
+        }
+        with self._lock:
+            self._operations[operation['id']] = operation
+            # Forget the oldest finished operations
+            excess = len(self._operations) - self.max_operations
+            for operation_id in [op_id for op_id, op in self._operations.items() if op['finished_at']][:max(excess, 0)]:
+                del self._operations[operation_id]
+        self._notify(operation)
+        return copy.deepcopy(operation)
+    
+    def update(self, operation_id, **changes):
+        with self._lock:
+            operation = self._operations.get(operation_id)
+            if operation is None:
+                return
+            now = datetime.now().isoformat()
+            if changes.get('step'):
+                operation['steps'].append({'step': changes['step'], 'at': now})
+            if changes.get('status') in ('succeeded', 'failed'):
+                operation['finished_at'] = now
+            operation.update(changes, updated_at=now)
+        self._notify(operation)
+    
+    def _notify(self, operation):
+        with self._lock:
+            snapshot = copy.deepcopy(operation)
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.warning(f"Operation listener failed for {snapshot['id']}: {e}")
+    
+    def get(self, operation_id):
+        with self._lock:
+            operation = self._operations.get(operation_id)
+            return copy.deepcopy(operation) if operation else None
+    
+    def list(self, app_id=None):
+        with self._lock:
+            return [copy.deepcopy(op) for op in self._operations.values() if app_id is None or op['app_id'] == app_id]
+    
+    async def execute(self, operation_id, func):
+        """Run func(report) as the given operation; func returns an API result dict"""
+        self.update(operation_id, status='running')
+        try:
+            result = await func(lambda step: self.update(operation_id, step=step))
+        except Exception as e:
+            logger.error(f"Operation {operation_id} failed: {e}")
+            self.update(operation_id, status='failed', error=str(e))
+            return
+        if result.get('success'):
+            self.update(operation_id, status='succeeded', result=result)
+        else:
+            self.update(operation_id, status='failed', result=result, error=result.get('error'))
+
+
+class MetricsSampler:
+    """Background sampler that owns all host sampling.
+    
+    Each sampling job runs on its own fixed interval in a single daemon thread.
+    After every tick a new metrics snapshot is built and published; request
+    handlers only ever read the latest published snapshot, so their latency
+    does not depend on how many clients are polling.
+    """
+    
+    def __init__(self, system_monitor):
+        self.system_monitor = system_monitor
+        self._jobs = []
+        self._samples = {}
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._listeners = []
+        
+        self.add_job('cpu', CPU_SAMPLE_INTERVAL, system_monitor.sample_cpu)
+        self.add_job('memory', MEMORY_SAMPLE_INTERVAL, system_monitor.sample_memory)
+        self.add_job('disk', DISK_SAMPLE_INTERVAL, system_monitor.sample_disk)
+        self.add_job('processes', PROCESS_COUNT_SAMPLE_INTERVAL, system_monitor.sample_process_count)
+        self.add_job('gpu', GPU_SAMPLE_INTERVAL, system_monitor.sample_gpu)
+    
+    def add_job(self, name, interval, func):
+        """Register a sampling job; its latest result is stored under name"""
+        with self._lock:
+            self._jobs.append({'name': name, 'interval': interval, 'func': func, 'next_run': 0.0})
+    
+    def add_listener(self, func):
+        """Call func(snapshot) in the sampler thread after every publish"""
+        self._listeners.append(func)
+    
+    def start(self):
+        """Start the sampler thread (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        # Prime psutil's CPU counters so the first non-blocking read is meaningful
+        psutil.cpu_percent(interval=None)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='metrics-sampler')
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def stop(self):
+        """Stop the sampler thread"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+    
+    def get_snapshot(self, timeout=5.0):
+        """Return the latest published snapshot (never mutate the result)"""
+        if not self._ready.is_set():
+            self._ready.wait(timeout)
+        return self._snapshot
+    
+    def _run(self):
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            with self._lock:
+                due = [job for job in self._jobs if job['next_run'] <= now]
+            
+            for job in due:
+                try:
+                    self._samples[job['name']] = job['func']()
+                except Exception as e:
+                    logger.warning(f"Sampling job '{job['name']}' failed: {e}")
+                job['next_run'] = now + job['interval']
+            
+            if due:
+                self._publish()
+            
+            with self._lock:
+                next_run = min(job['next_run'] for job in self._jobs)
+            self._stop_event.wait(max(0.05, next_run - time.monotonic()))
+    
+    def _publish(self):
+        try:
+            snapshot = self.system_monitor.build_metrics(self._samples)
+        except Exception as e:
+            logger.error(f"Failed to build metrics snapshot: {e}")
+            snapshot = {
+                'error': str(e),
+                'timestamp': datetime.now().isoformat()
+            }
+        # Swap in the new snapshot; published snapshots are never modified
+        self._snapshot = snapshot
+        
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.warning(f"Metrics listener {getattr(listener, '__name__', listener)} failed: {e}")
+        
+        # Readers waiting for the first snapshot also see the listeners' derived state
+        self._ready.set()
+
+
+def parse_duration(value, default=None):
+    """Parse a duration such as '300', '90s', '5m', '1h' or '2d' into seconds"""
+    if value is None or value == '':
+        return default
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    value = str(value).strip().lower()
+    multiplier = units.get(value[-1])
+    if multiplier:
+        value = value[:-1]
+    seconds = float(value) * (multiplier or 1)
+    if not math.isfinite(seconds) or seconds <= 0:
+        raise ValueError('Duration must be a positive number')
+    return seconds
+
+
+def collect_series(snapshot, app_resources, app_launches=None):
+    """Flatten a metrics snapshot, per-app resources and startup timings into {series: value}"""
+    series = {}
+    if 'cpu' in snapshot:
+        series['host.cpu.percent'] = snapshot['cpu']['percent']
+    if 'memory' in snapshot:
+        series['host.memory.percent'] = snapshot['memory']['percent']
+        series['host.memory.used'] = snapshot['memory']['used']
+    if 'disk' in snapshot:
+        series['host.disk.percent'] = snapshot['disk']['percent']
+    if 'processes' in snapshot:
+        series['host.processes.total'] = snapshot['processes']['total']
+    for gpu in snapshot.get('gpus', []):
+        prefix = f"gpu.{gpu['index']}."
+        for field in ('utilization', 'memory_used', 'memory_percent', 'temperature', 'power_draw'):
+            if gpu[field] is not None:
+                series[prefix + field] = gpu[field]
+    for app_id, resources in app_resources.items():
+        prefix = f"app.{app_id}."
+        for field in ('cpu_percent', 'memory_mb', 'gpu_memory_mb', 'gpu_percent'):
+            if resources.get(field) is not None:
+                series[prefix + field] = resources[field]
+    # Timings of the current launch, so startup regressions show up in the history
+    for app_id, timings in (app_launches or {}).items():
+        for field, value in timings.items():
+            if value is not None:
+                series[f"app.{app_id}.{field}"] = value
+    return series
+
+
+def changed_timings(app_launches, seen):
+    """The launch timings (app_id -> {field: value}) not already in seen, updating seen.
+    
+    Timings change a few times per launch, so recorders only write a value
+    when it is new instead of repeating it in every sample.
+    """
+    changed = {}
+    for app_id, timings in (app_launches or {}).items():
+        previous = seen.get(app_id, {})
+        fields = {field: value for field, value in timings.items() if previous.get(field) != value}
+        if fields:
+            changed[app_id] = fields
+            seen[app_id] = dict(timings)
+    # Apps that are no longer running start from scratch on their next launch
+    for app_id in [app_id for app_id in seen if app_id not in (app_launches or {})]:
+        del seen[app_id]
+    return changed
+
+
+class MetricsHistory:
+    """Fixed-memory ring buffer holding recent history of every sampled series.
+    
+    Storage is columnar: one shared float64 timestamp column plus one float32
+    value column per series, all preallocated to the same capacity. Missing
+    values are NaN. Memory is bounded by capacity x (series + 1) regardless of
+    uptime, and since timestamps are monotonic, window lookups are binary
+    searches followed by C-level array slices.
+    """
+    
+    def __init__(self, capacity=HISTORY_CAPACITY, max_series=HISTORY_MAX_SERIES, interval=HISTORY_INTERVAL):
+        self.capacity = capacity
+        self.max_series = max_series
+        self.interval = interval
+        self._last_record = 0.0
+        self._seen_timings = {}
+        self._times = array('d', [0.0]) * capacity
+        self._columns = {}
+        self._series_limit_logged = False
+        self._start = 0
+        self._count = 0
+        self._lock = threading.Lock()
+    
+    def record_snapshot(self, snapshot, app_resources, app_launches=None):
+        """Sampler listener: record a row at most every interval seconds"""
+        now = time.time()
+        if now - self._last_record < self.interval:
+            return
+        self._last_record = now
+        app_launches = changed_timings(app_launches, self._seen_timings)
+        self.record(now, collect_series(snapshot, app_resources, app_launches))
+    
+    def default_step(self, window):
+        return max(window / HISTORY_DEFAULT_POINTS, self.interval)
+    
+    def effective_step(self, window, step=None):
+        """Bucket size actually used for a query: at least one sampling
+        interval, and coarse enough that window needs at most capacity buckets"""
+        step = max(step or self.default_step(window), self.interval)
+        return max(step, window / self.capacity)
+    
+    def record(self, timestamp, values):
+        """Append one row; series not present in values get NaN"""
+        with self._lock:
+            if self._count < self.capacity:
+                slot = (self._start + self._count) % self.capacity
+                self._count += 1
+            else:
+                # Overwrite the oldest row
+                slot = self._start
+                self._start = (self._start + 1) % self.capacity
+            
+            self._times[slot] = timestamp
+            for column in self._columns.values():
+                column[slot] = NAN
+            for name, value in values.items():
+                column = self._columns.get(name)
+                if column is None:
+                    if len(self._columns) >= self.max_series:
+                        if not self._series_limit_logged:
+                            logger.warning(f"Metrics history is limited to {self.max_series} series, "
+                                           f"not recording {name} and any further new series")
+                            self._series_limit_logged = True
+                        continue
+                    column = array('f', [NAN]) * self.capacity
+                    self._columns[name] = column
+                column[slot] = value
+    
+    def series_names(self):
+        with self._lock:
+            return sorted(self._columns)
+    
+    def drop_series(self, prefix):
+        """Free the columns of every series starting with prefix, e.g. of a deleted app"""
+        with self._lock:
+            names = [name for name in self._columns if name.startswith(prefix)]
+            for name in names:
+                del self._columns[name]
+            if names:
+                self._series_limit_logged = False
+        return len(names)
+    
+    def oldest_timestamp(self):
+        """Timestamp of the oldest retained row, or None when empty"""
+        with self._lock:
+            return self._times[self._start] if self._count else None
+    
+    def _time_at(self, i):
+        return self._times[(self._start + i) % self.capacity]
+    
+    def _bisect(self, timestamp):
+        """First logical index whose timestamp is >= timestamp"""
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._time_at(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+    
+    def _slice(self, column, lo, hi):
+        """Logical [lo, hi) of a ring column as a flat array"""
+        start = (self._start + lo) % self.capacity
+        end = start + (hi - lo)
+        if end <= self.capacity:
+            return column[start:end]
+        return column[start:] + column[:end - self.capacity]
+    
+    def query(self, names, window, step=None, now=None):
+        """Downsample the last window seconds of each series into step-sized buckets.
+        
+        Returns {name: [[bucket_start, avg, min, max], ...]}; buckets without
+        samples are omitted.
+        """
+        now = time.time() if now is None else now
+        start = now - window
+        step = self.effective_step(window, step)
+        buckets = int(math.ceil(window / step))
+        
+        # Copy out just the rows of the window; bucketing runs without the
+        # lock so a large query never holds up record()
+        with self._lock:
+            first, last = self._bisect(start), self._bisect(now + step)
+            times = self._slice(self._times, first, last)
+            columns = {name: self._slice(self._columns[name], first, last)
+                       for name in names if name in self._columns}
+        
+        bounds = [bisect.bisect_left(times, start + i * step) for i in range(buckets + 1)]
+        result = {}
+        for name in names:
+            column = columns.get(name)
+            points = []
+            if column is not None:
+                for i in range(buckets):
+                    lo, hi = bounds[i], bounds[i + 1]
+                    if lo == hi:
+                        continue
+                    values = column[lo:hi]
+                    total = sum(values)
+                    if total != total:
+                        # Slow path only for buckets containing gaps (NaN)
+                        values = [v for v in values if v == v]
+                        total = sum(values)
+                    if values:
+                        points.append([
+                            round(start + i * step, 3),
+                            round(total / len(values), 3),
+                            round(min(values), 3),
+                            round(max(values), 3)
+                        ])
+            result[name] = points
+        return result
+
+
+class MetricsStore(QueuedWriter):
+    """Durable, segment-based on-disk store for sampled metrics.
+    
+    Every tier (see STORE_TIERS) keeps one directory per series holding
+    append-only segment files named after their first timestamp. A segment
+    is preallocated for a fixed number of rows and laid out as four binary
+    columns: timestamp (float64), avg, min and max (float32). Unused rows have
+    a zero timestamp. Reads memory-map the segments and binary-search the
+    timestamp column.
+    
+    The sampler only enqueues rows; a single writer thread batches them to
+    disk every flush interval, maintains the 1 min / 1 h rollups and applies
+    per-tier retention, so request threads never wait on disk I/O.
+    """
+    
+    COLUMNS = (('d', 8), ('f', 4), ('f', 4), ('f', 4))  # timestamp, avg, min, max
+    thread_name = 'metrics-store'
+    description = 'metrics'
+    
+    def __init__(self, directory=METRICS_STORE_DIR, tiers=STORE_TIERS, flush_interval=STORE_FLUSH_INTERVAL):
+        super().__init__(directory, STORE_QUEUE_SIZE, flush_interval)
+        self.tiers = {
+            name: {'resolution': resolution, 'rows': rows, 'retention': retention}
+            for name, resolution, rows, retention in tiers
+        }
+        self.base_tier = tiers[0][0]
+        self._segments = {}  # (tier, series) -> [segment_start, row_count]
+        self._rollups = {}   # (tier, series) -> [bucket_start, sum, count, min, max]
+        self._dropped = {}   # series prefix -> time it was dropped at
+        self._lock = threading.Lock()  # guards the state above against drop_series()
+        self._last_record = 0.0
+        self._seen_timings = {}
+        self._next_sweep = 0.0
+    
+    def record_snapshot(self, snapshot, app_resources, app_launches=None):
+        """Sampler listener: enqueue a row at most once per base-tier resolution"""
+        now = time.time()
+        if now - self._last_record < self.tiers[self.base_tier]['resolution']:
+            return
+        self._last_record = now
+        app_launches = changed_timings(app_launches, self._seen_timings)
+        self._enqueue((now, collect_series(snapshot, app_resources, app_launches)))
+    
+    # Writer thread
+    
+    def _idle(self):
+        if time.monotonic() >= self._next_sweep:
+            self._sweep_retention()
+            self._next_sweep = time.monotonic() + STORE_SWEEP_INTERVAL
+    
+    def drop_series(self, prefix):
+        """Forget the writer state of every series starting with prefix, e.g. of a deleted app.
+        
+        Pending rollup buckets are discarded, and rows for these series that
+        are still queued are not written. Existing segments on disk are left
+        to the retention sweep.
+        """
+        with self._lock:
+            self._dropped[prefix] = time.time()
+            for state in (self._segments, self._rollups):
+                for key in [key for key in state if key[1].startswith(prefix)]:
+                    del state[key]
+    
+    def _write_batch(self, batch, final=False):
+        with self._lock:
+            rows = {}
+            for timestamp, values in batch:
+                for series, value in values.items():
+                    if any(series.startswith(prefix) and timestamp <= dropped_at
+                           for prefix, dropped_at in self._dropped.items()):
+                        continue
+                    rows.setdefault((self.base_tier, series), []).append((timestamp, value, value, value))
+                    for tier in self.tiers:
+                        if tier != self.base_tier:
+                            self._rollup(tier, series, timestamp, value, rows)
+            
+            if final:
+                # Shutting down: also write the partially filled rollup buckets
+                for (tier, series), acc in self._rollups.items():
+                    rows.setdefault((tier, series), []).append((acc[0], acc[1] / acc[2], acc[3], acc[4]))
+                self._rollups = {}
+            
+            for (tier, series), tier_rows in rows.items():
+                self._append(tier, series, tier_rows)
+    
+    def _rollup(self, tier, series, timestamp, value, rows):
+        resolution = self.tiers[tier]['resolution']
+        bucket = timestamp - timestamp % resolution
+        key = (tier, series)
+        acc = self._rollups.get(key)
+        if acc is not None and acc[0] != bucket:
+            # Bucket closed: emit its aggregate row
+            rows.setdefault(key, []).append((acc[0], acc[1] / acc[2], acc[3], acc[4]))
+            acc = None
+        if acc is None:
+            acc = self._rollups[key] = [bucket, 0.0, 0, value, value]
+        acc[1] += value
+        acc[2] += 1
+        acc[3] = min(acc[3], value)
+        acc[4] = max(acc[4], value)
+    
+    def _series_dir(self, tier, series):
+        # Series names embed app ids, keep them filesystem-safe
+        return os.path.join(self.directory, tier, safe_filename(series))
+    
+    def _segment_path(self, tier, series, start):
+        return os.path.join(self._series_dir(tier, series), f"{start:.3f}.seg")
+    
+    def _list_segments(self, tier, series):
+        """Sorted segment start timestamps of a series"""
+        try:
+            names = os.listdir(self._series_dir(tier, series))
+        except FileNotFoundError:
+            return []
+        starts = []
+        for name in names:
+            if name.endswith('.seg'):
+                try:
+                    starts.append(float(name[:-4]))
+                except ValueError:
+                    continue
+        return sorted(starts)
+    
+    def _append(self, tier, series, rows):
+        capacity = self.tiers[tier]['rows']
+        key = (tier, series)
+        state = self._segments.get(key)
+        if state is None:
+            segments = self._list_segments(tier, series)
+            if segments:
+                path = self._segment_path(tier, series, segments[-1])
+                state = [segments[-1], self._row_count(path, capacity)]
+            self._segments[key] = state
+        
+        while rows:
+            if state is None or state[1] >= capacity:
+                state = self._segments[key] = [rows[0][0], 0]
+            chunk = rows[:capacity - state[1]]
+            rows = rows[len(chunk):]
+            self._write_rows(self._segment_path(tier, series, state[0]), capacity, state[1], chunk)
+            state[1] += len(chunk)
+    
+    def _write_rows(self, path, capacity, first_row, chunk):
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                # Preallocate all columns; zero timestamps mark unused rows
+                f.truncate(capacity * sum(size for _, size in self.COLUMNS))
+        
+        with open(path, 'r+b') as f:
+            # Values first, timestamps last, so a row only becomes visible once complete
+            for column in (1, 2, 3, 0):
+                code, size = self.COLUMNS[column]
+                column_offset = sum(s for _, s in self.COLUMNS[:column]) * capacity
+                f.seek(column_offset + first_row * size)
+                f.write(array(code, [row[column] for row in chunk]).tobytes())
+            f.flush()
+    
+    def _row_count(self, path, capacity):
+        with open(path, 'rb') as f:
+            times = array('d')
+            times.frombytes(f.read(capacity * 8))
+        lo, hi = 0, capacity
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if times[mid] > 0:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+    
+    def _sweep_retention(self):
+        now = time.time()
+        for tier, spec in self.tiers.items():
+            tier_dir = os.path.join(self.directory, tier)
+            if not os.path.isdir(tier_dir):
+                continue
+            cutoff = now - spec['retention']
+            for series in os.listdir(tier_dir):
+                segments = self._list_segments(tier, series)
+                # A segment ends where the next one starts; the newest is never dropped
+                for start, next_start in zip(segments, segments[1:]):
+                    if next_start < cutoff:
+                        try:
+                            os.remove(self._segment_path(tier, series, start))
+                        except OSError as e:
+                            logger.warning(f"Could not remove expired metrics segment: {e}")
+    
+    # Queries
+    
+    def choose_tier(self, window):
+        """Finest tier that covers window without returning too many rows"""
+        for name, spec in self.tiers.items():
+            if window <= spec['retention'] and window / spec['resolution'] <= STORE_MAX_QUERY_ROWS:
+                return name
+        return list(self.tiers)[-1]
+    
+    def series_names(self, tier=None):
+        tier_dir = os.path.join(self.directory, tier or self.base_tier)
+        try:
+            return sorted(os.listdir(tier_dir))
+        except FileNotFoundError:
+            return []
+    
+    def _read_range(self, path, capacity, start, end):
+        """Rows of one segment with start <= timestamp < end, via mmap"""
+        with open(path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+                try:
+                    times = view[:capacity * 8].cast('d')
+                    
+                    def bisect(value):
+                        lo, hi = 0, capacity
+                        while lo < hi:
+                            mid = (lo + hi) // 2
+                            t = times[mid]
+                            if 0 < t < value:
+                                lo = mid + 1
+                            else:
+                                hi = mid
+                        return lo
+                    
+                    lo, hi = bisect(start), bisect(end)
+                    columns = [array('d', times[lo:hi])]
+                    offset = capacity * 8
+                    for code, size in self.COLUMNS[1:]:
+                        values = view[offset:offset + capacity * size].cast(code)
+                        columns.append(array(code, values[lo:hi]))
+                        values.release()
+                        offset += capacity * size
+                    times.release()
+                finally:
+                    view.release()
+        return columns
+    
+    def query(self, names, window, step=None, tier=None, now=None):
+        """Read the last window seconds from disk, bucketed like MetricsHistory.query"""
+        now = time.time() if now is None else now
+        start = now - window
+        tier = tier or self.choose_tier(window)
+        capacity = self.tiers[tier]['rows']
+        step = max(step or window / HISTORY_DEFAULT_POINTS, self.tiers[tier]['resolution'])
+        
+        result = {}
+        for name in names:
+            segments = self._list_segments(tier, name)
+            buckets = {}
+            for i, segment_start in enumerate(segments):
+                segment_end = segments[i + 1] if i + 1 < len(segments) else float('inf')
+                if segment_end <= start or segment_start > now:
+                    continue
+                try:
+                    times, avgs, mins, maxs = self._read_range(
+                        self._segment_path(tier, name, segment_start), capacity, start, now + 1)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Could not read metrics segment {segment_start} of {name}: {e}")
+                    continue
+                for t, avg, low, high in zip(times, avgs, mins, maxs):
+                    acc = buckets.get(int((t - start) // step))
+                    if acc is None:
+                        buckets[int((t - start) // step)] = [avg, 1, low, high]
+                    else:
+                        acc[0] += avg
+                        acc[1] += 1
+                        acc[2] = min(acc[2], low)
+                        acc[3] = max(acc[3], high)
+            result[name] = [
+                [round(start + index * step, 3), round(acc[0] / acc[1], 3), round(acc[2], 3), round(acc[3], 3)]
+                for index, acc in sorted(buckets.items())
+            ]
+        return result, tier, step
+
+
+class StreamSubscriber:
+    """One /api/stream client: topic filter, rate cap and a bounded frame queue"""
+    
+    def __init__(self, topics, min_interval):
+        self.topics = topics
+        self.min_interval = min_interval
+        self.queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+        self._last_sent = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+    
+    def wants(self, topic):
+        return self.topics is None or topic in self.topics
+    
+    def offer(self, topic, frame, coalesce):
+        """Queue a frame; snapshots of coalescing topics are rate capped.
+        
+        A snapshot arriving before min_interval has passed replaces the
+        pending one instead of being queued, so a slow or capped client only
+        ever receives the newest state.
+        """
+        with self._lock:
+            if coalesce and time.monotonic() - self._last_sent.get(topic, 0.0) < self.min_interval:
+                self._pending[topic] = frame
+                return
+            self._pending.pop(topic, None)
+            self._last_sent[topic] = time.monotonic()
+        self._put(frame)
+    
+    def _put(self, frame):
+        try:
+            self.queue.put_nowait(frame)
+        except queue.Full:
+            # Drop the oldest frame rather than block the publisher
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.queue.put_nowait(frame)
+    
+    def release_due(self):
+        """Queue pending snapshots whose rate cap has expired; returns seconds until the next one"""
+        now = time.monotonic()
+        wait = None
+        with self._lock:
+            for topic in list(self._pending):
+                remaining = self.min_interval - (now - self._last_sent.get(topic, 0.0))
+                if remaining <= 0:
+                    self._last_sent[topic] = now
+                    self._put(self._pending.pop(topic))
                 else:
-                    # For base environment, just use python directly
-                    cmd = [python_cmd, config['path']]
-                    
-            else:
-                # Default: direct python execution
-                cmd = ['python', config['path']]
+                    wait = remaining if wait is None else min(wait, remaining)
+        return wait
+
+
+class EventBroadcaster:
+    """Fans out server-sent events to all /api/stream subscribers.
+    
+    Each event is serialized exactly once into an SSE frame and the same
+    bytes are queued for every matching subscriber, so the cost of a tick
+    does not grow with the number of connected dashboards. The last frame
+    of each snapshot topic is kept so new subscribers get current state
+    immediately.
+    """
+    
+    def __init__(self):
+        self._subscribers = set()
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._versions = {}
+    
+    def has_subscribers(self):
+        return bool(self._subscribers)
+    
+    def subscribe(self, topics=None, min_interval=0.0):
+        subscriber = StreamSubscriber(topics, min_interval)
+        with self._lock:
+            if len(self._subscribers) >= STREAM_MAX_CLIENTS:
+                return None
+            self._subscribers.add(subscriber)
+            latest = [(topic, frame) for topic, frame in self._latest.items() if subscriber.wants(topic)]
+        for topic, frame in latest:
+            subscriber.offer(topic, frame, coalesce=True)
+        return subscriber
+    
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+    
+    def publish_if_changed(self, topic, version, build_payload):
+        """Publish build_payload() only if version differs from the last one sent"""
+        if self._versions.get(topic) == version:
+            return
+        self._versions[topic] = version
+        self.publish(topic, build_payload())
+    
+    def publish(self, topic, payload, snapshot=True):
+        """Serialize payload once and queue it for every subscriber of topic.
+        
+        Snapshot topics replace previous state (and are rate capped per
+        client); non-snapshot topics are discrete events that are always
+        delivered.
+        """
+        with self._lock:
+            self._sequence += 1
+            frame = f"id: {self._sequence}\nevent: {topic}\ndata: {json.dumps(payload)}\n\n".encode('utf-8')
+            if snapshot:
+                self._latest[topic] = frame
+            subscribers = [s for s in self._subscribers if s.wants(topic)]
+        for subscriber in subscribers:
+            subscriber.offer(topic, frame, coalesce=snapshot)
+
+
+class VersionedCollection:
+    """Keyed collection of JSON documents with per-field change versions.
+    
+    update() compares the current documents with the previous ones and bumps
+    the version only when something actually changed, so the version token
+    identifies the content and can be used as a strong ETag. For every field
+    the version of its last change is kept, which lets delta() return only
+    the documents and fields that changed after a given token.
+    
+    Tokens look like '<epoch>.<n>'; the random epoch makes tokens from an
+    earlier server run fall back to a full response.
+    """
+    
+    def __init__(self, max_removed=VERSIONED_MAX_REMOVED):
+        self.epoch = os.urandom(4).hex()
+        self.max_removed = max_removed
+        self._version = 0
+        self._horizon = 0
+        self._docs = {}
+        self._field_versions = {}
+        self._removed = {}
+        self._lock = threading.Lock()
+    
+    def token(self):
+        return f"{self.epoch}.{self._version}"
+    
+    def update(self, docs):
+        """Record the current documents ({key: dict}); returns the version token"""
+        with self._lock:
+            version = self._version + 1
+            changed = False
             
-            logger.info(f"Starting {config['name']} in directory: {working_dir}")
-            logger.info(f"Command: {' '.join(cmd)}")
+            for key, doc in docs.items():
+                old = self._docs.get(key)
+                field_versions = self._field_versions.setdefault(key, {})
+                if old is None:
+                    field_versions.update((field, version) for field in doc)
+                    self._removed.pop(key, None)
+                    changed = True
+                    continue
+                for field, value in doc.items():
+                    if field not in old or old[field] != value:
+                        field_versions[field] = version
+                        changed = True
+                for field in old:
+                    if field not in doc:
+                        field_versions[field] = version
+                        changed = True
             
-            # Start the process
-            process = subprocess.Popen(
-                cmd,
-                cwd=working_dir,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == 'nt' else 0,
-                text=True,  # Enable text mode for easier logging
-                bufsize=1   # Line buffered
-            )
+            for key in set(self._docs) - set(docs):
+                self._removed[key] = version
+                self._field_versions.pop(key, None)
+                changed = True
             
-            self.processes[app_id] = process
-            self.app_status[app_id] = 'running'
-            self.start_times[app_id] = datetime.now()
+            if changed:
+                self._version = version
+                # Keep private copies; config dicts are mutated in place elsewhere
+                self._docs = copy.deepcopy(docs)
+                if len(self._removed) > self.max_removed:
+                    oldest = sorted(self._removed, key=self._removed.get)[:len(self._removed) - self.max_removed]
+                    for key in oldest:
+                        self._horizon = max(self._horizon, self._removed.pop(key))
             
-            logger.info(f"Started {config['name']} (PID: {process.pid})")
+            return self.token()
+    
+    def delta(self, since):
+        """Changes after the since token, or None when only a full response will do"""
+        epoch, _, number = str(since).partition('.')
+        with self._lock:
+            try:
+                since_version = int(number)
+            except ValueError:
+                return None
+            if epoch != self.epoch or since_version < self._horizon or since_version > self._version:
+                return None
             
-            # Start a thread to monitor the process
-            monitor_thread = threading.Thread(target=self._monitor_process, args=(app_id,))
-            monitor_thread.daemon = True
-            monitor_thread.start()
+            changed = []
+            for key, field_versions in self._field_versions.items():
+                fields = [field for field, version in field_versions.items() if version > since_version]
+                if fields:
+                    doc = self._docs[key]
+                    entry = {field: copy.deepcopy(doc.get(field)) for field in fields}
+                    entry['id'] = key
+                    changed.append(entry)
             
             return {
-                'success': True, 
-                'pid': process.pid,
-                'started_at': self.start_times[app_id].isoformat(),
-                'command': ' '.join(cmd)
+                'version': self.token(),
+                'since': since,
+                'full': False,
+                'changed': changed,
+                'removed': [key for key, version in self._removed.items() if version > since_version]
             }
-            
-        except Exception as e:
-            logger.error(f"Failed to start {config['name']}: {str(e)}")
-            return {'success': False, 'error': str(e)}
-    
-    def stop_app(self, app_id):
-        """Stop a running Python application"""
-        if app_id not in self.processes:
-            return {'success': False, 'error': 'App is not running'}
-            
+
+
+def request_etag_matches(etag):
+    """Whether the request's If-None-Match covers etag"""
+    return request.if_none_match.contains(etag)
+
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
+def json_with_etag(payload, etag):
+    response = jsonify(payload)
+    response.set_etag(etag)
+    return response
+
+
+_server_info_cache = {'expires': 0.0, 'info': None}
+
+def get_server_info():
+    """Host identity reported by health checks, cached for SERVER_INFO_TTL seconds"""
+    now = time.monotonic()
+    if _server_info_cache['info'] is None or now >= _server_info_cache['expires']:
         try:
-            process = self.processes[app_id]
-            
-            if os.name == 'nt':  # Windows
-                # Use taskkill to terminate the process tree
-                subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)], 
-                             check=False, capture_output=True)
-            else:  # Unix-like systems
-                # Send SIGTERM first, then SIGKILL if needed
-                try:
-                    process.terminate()
-                    process.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    process.kill()
-                    process.wait()
-            
-            # Clean up
-            del self.processes[app_id]
-            self.app_status[app_id] = 'stopped'
-            if app_id in self.start_times:
-                del self.start_times[app_id]
-                
-            config = app_configs[app_id]
-            logger.info(f"Stopped {config['name']}")
-            
-            return {'success': True}
-            
-        except Exception as e:
-            logger.error(f"Failed to stop {app_id}: {str(e)}")
-            return {'success': False, 'error': str(e)}
-    
-    def get_app_status(self, app_id):
-        """Get the current status of an application"""
-        if app_id not in app_configs:
-            return {'error': 'App not found'}
-            
-        config = app_configs[app_id]
-        is_running = self.is_process_running(app_id)
+            hostname = socket.gethostname()
+            local_ip = socket.gethostbyname(hostname)
+        except Exception:
+            hostname = platform.node()
+            local_ip = '127.0.0.1'
         
-        status = {
-            'id': app_id,
-            'name': config['name'],
-            'status': 'running' if is_running else 'stopped',
-            'environment': config['environment'],
-            'path': config['path'],
-            'port': config['port'],
-            'description': config['description'],
-            'output_folder': config.get('output_folder')  # Add output folder if present
+        _server_info_cache['info'] = {
+            'server': local_ip,
+            'hostname': hostname,
+            'platform': platform.system(),
+            'platform_version': platform.version(),
+            'python_version': platform.python_version(),
+            'architecture': platform.architecture()[0]
         }
-        
-        if is_running and app_id in self.start_times:
-            uptime = (datetime.now() - self.start_times[app_id]).total_seconds()
-            status['uptime'] = int(uptime)
-            status['started_at'] = self.start_times[app_id].isoformat()
-            status['pid'] = self.processes[app_id].pid
-            
-            # Get process-specific resource usage
-            try:
-                process = self.processes[app_id]
-                proc = psutil.Process(process.pid)
-                
-                # Get memory usage
-                memory_info = proc.memory_info()
-                memory_percent = proc.memory_percent()
-                
-                # Get CPU usage (averaged over short interval)
-                cpu_percent = proc.cpu_percent(interval=0.1)
-                
-                status['resources'] = {
-                    'cpu_percent': round(cpu_percent, 1),
-                    'memory_mb': round(memory_info.rss / (1024 * 1024), 1),
-                    'memory_percent': round(memory_percent, 1)
-                }
-                
-                # Try to get GPU usage if process is using GPU
-                gpu_usage = system_monitor.get_process_gpu_usage(process.pid)
-                if gpu_usage:
-                    status['resources']['gpu_memory_mb'] = round(gpu_usage['memory_mb'], 1)
-                    status['resources']['gpu_percent'] = gpu_usage['utilization_percent']
-                else:
-                    status['resources']['gpu_memory_mb'] = None
-                    status['resources']['gpu_percent'] = None
-                
-            except (psutil.NoSuchProcess, psutil.AccessDenied, Exception) as e:
-                logger.warning(f"Could not get resource usage for {app_id}: {e}")
-                status['resources'] = {
-                    'cpu_percent': 0,
-                    'memory_mb': 0,
-                    'memory_percent': 0,
-                    'gpu_percent': None,
-                    'gpu_memory_mb': None
-                }
-            
-        return status
+        _server_info_cache['expires'] = now + SERVER_INFO_TTL
+    return _server_info_cache['info']
+
+
+def parse_fields(spec):
+    """Parse 'a,b.c,b.d' into a projection tree {'a': None, 'b': {'c': None, 'd': None}}"""
+    tree = {}
+    for path in spec.split(','):
+        path = path.strip()
+        if not path:
+            continue
+        node = tree
+        parts = path.split('.')
+        for part in parts[:-1]:
+            child = node.get(part, {})
+            if child is None:
+                # A parent was already selected whole
+                break
+            node = node.setdefault(part, child)
+        else:
+            node[parts[-1]] = None
+    return tree
+
+
+def project(value, tree):
+    """Apply a parse_fields() tree to a document; lists are projected per item"""
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: project(value[key], subtree) for key, subtree in tree.items() if key in value}
+    return value
+
+
+class ServerSnapshot:
+    """Coherent view of health, apps and metrics assembled once per sampler tick.
     
-    def get_all_apps_status(self):
-        """Get status of all configured applications"""
-        return [self.get_app_status(app_id) for app_id in app_configs.keys()]
+    Built in the sampler thread right after the metrics snapshot is published,
+    so all three parts describe the same moment. Published snapshots are never
+    modified.
+    """
     
-    def is_process_running(self, app_id):
-        """Check if a process is still running"""
-        if app_id not in self.processes:
-            return False
-            
-        process = self.processes[app_id]
-        return process.poll() is None
+    def __init__(self, app_manager):
+        self.app_manager = app_manager
+        self.latest = None
+        self._tick = 0
     
-    def _monitor_process(self, app_id):
-        """Monitor a process and update status when it exits"""
-        process = self.processes[app_id]
-        config = app_configs[app_id]
-        
-        # Wait for process to exit and capture output
-        stdout, stderr = process.communicate()
+    def update(self, metrics):
+        """Sampler listener: assemble the snapshot for this tick"""
+        self._tick += 1
+        server_info = get_server_info()
         
-        # Log the output for debugging (already strings due to text=True)
-        if stdout:
-            logger.info(f"{config['name']} stdout: {stdout}")
-        if stderr:
-            logger.error(f"{config['name']} stderr: {stderr}")
+        if 'processes' in metrics:
+            metrics = dict(metrics)
+            metrics['processes'] = dict(metrics['processes'], running_apps=self.app_manager.running_count())
         
-        # Process has exited, clean up
-        exit_code = process.returncode
-        logger.info(f"{config['name']} process exited with code: {exit_code}")
+        apps_status = self.app_manager.get_all_apps_status()
+        for app_status in apps_status:
+            # Apps always show the current server hostname - they belong to this server
+            app_status['server_hostname'] = server_info['hostname']
         
-        if app_id in self.processes:
-            del self.processes[app_id]
-        self.app_status[app_id] = 'stopped'
-        if app_id in self.start_times:
-            del self.start_times[app_id]
+        timestamp = metrics.get('timestamp') or datetime.now().isoformat()
+        self.latest = {
+            'tick': self._tick,
+            'timestamp': timestamp,
+            'health': dict(server_info, status='healthy', timestamp=timestamp),
+            'apps': apps_status,
+            'metrics': metrics
+        }
+
 
 # Initialize the app manager and system monitor
-app_manager = AppManager()
+log_store = LogStore()
+log_store.start()
+process_supervisor = ProcessSupervisor()
+process_supervisor.start()
+environment_resolver = EnvironmentResolver()
+app_manager = AppManager(log_store, process_supervisor, environment_resolver)
 system_monitor = SystemMonitor()
+metrics_sampler = MetricsSampler(system_monitor)
+metrics_sampler.add_job('apps', APP_RESOURCES_SAMPLE_INTERVAL, app_manager.sample_resources)
+metrics_history = MetricsHistory()
+metrics_sampler.add_listener(
+    lambda snapshot: metrics_history.record_snapshot(snapshot, app_manager.resource_cache, app_manager.launch_timings()))
+metrics_store = MetricsStore()
+metrics_sampler.add_listener(
+    lambda snapshot: metrics_store.record_snapshot(snapshot, app_manager.resource_cache, app_manager.launch_timings()))
+metrics_store.start()
+
+event_broadcaster = EventBroadcaster()
+
+# Versioned views backing ETag / ?since= handling of /api/apps and /api/apps/config
+# (app fields in VOLATILE_APP_FIELDS are served but not versioned)
+VOLATILE_APP_FIELDS = ('uptime', 'resources')
+apps_versions = VersionedCollection()
+config_versions = VersionedCollection()
+
+server_snapshot = ServerSnapshot(app_manager)
+metrics_sampler.add_listener(server_snapshot.update)
+
+def stream_snapshot(snapshot):
+    """Sampler listener pushing metrics and, when changed, app status to /api/stream"""
+    if not event_broadcaster.has_subscribers():
+        return
+    combined = server_snapshot.latest
+    event_broadcaster.publish('metrics', combined['metrics'])
+    event_broadcaster.publish_if_changed('apps', app_manager.version, lambda: combined['apps'])
+
+def stream_app_state(app_id, state):
+    """Push lifecycle transitions to /api/stream as they happen"""
+    event_broadcaster.publish('app_state', {
+        'id': app_id,
+        'status': state,
+        'readiness': app_manager.readiness.get(app_id),
+        'timestamp': datetime.now().isoformat()
+    }, snapshot=False)
+
+def stream_app_readiness(app_id, readiness, launch):
+    """Push probe results (starting/ready/unhealthy) to /api/stream"""
+    event_broadcaster.publish('app_state', {
+        'id': app_id,
+        'status': 'running',
+        'readiness': readiness,
+        'launch': launch,
+        'timestamp': datetime.now().isoformat()
+    }, snapshot=False)
+
+operations = OperationRegistry()
+operations.add_listener(lambda operation: event_broadcaster.publish('operations', operation, snapshot=False))
+
+def apply_config_change(configs):
+    """Config store listener applying edits of apps_config.json made outside the manager.
+    
+    Removed apps are stopped like with DELETE /api/apps/config/<id>; running
+    apps whose configuration changed keep running and pick up the new one
+    on their next start.
+    """
+    drop_invalid_dependencies(configs)
+    current = app_configs
+    removed = [app_id for app_id in current if app_id not in configs]
+    added = [app_id for app_id in configs if app_id not in current]
+    changed = [app_id for app_id in configs if app_id in current and current[app_id] != configs[app_id]]
+    
+    for app_id in removed:
+        if app_manager.is_process_running(app_id):
+            result = app_manager.stop_app(app_id)
+            if not result['success']:
+                logger.warning(f"Error stopping removed app {app_id}: {result.get('error')}")
+    update_app_configs({app_id: configs[app_id] for app_id in added + changed}, removed)
+    for app_id in removed:
+        app_manager.forget_app(app_id)
+        metrics_history.drop_series(f"app.{app_id}.")
+        metrics_store.drop_series(f"app.{app_id}.")
+    for app_id in changed:
+        if app_manager.is_process_running(app_id):
+            logger.info(f"Configuration of running app {app_id} changed, it applies from its next start")
+    
+    logger.info(f"Reloaded {CONFIG_FILE}: {len(added)} added, {len(changed)} changed, {len(removed)} removed")
+
+config_store.add_listener(apply_config_change)
+config_store.start()
+
+metrics_sampler.add_listener(stream_snapshot)
+app_manager.add_state_listener(stream_app_state)
+app_manager.add_readiness_listener(stream_app_readiness)
+metrics_sampler.start()
 
 # API Routes
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    try:
-        hostname = socket.gethostname()
-        local_ip = socket.gethostbyname(hostname)
-    except Exception:
-        hostname = platform.node()
-        local_ip = '127.0.0.1'
+    return jsonify(dict(
+        get_server_info(),
+        status='healthy',
+        timestamp=datetime.now().isoformat(),
+        # Log lines and metric rows dropped because the disk could not keep up
+        dropped={'log_lines': log_store.dropped, 'metric_rows': metrics_store.dropped}
+    ))
+
+@app.route('/api/snapshot', methods=['GET'])
+def get_snapshot():
+    """Health, apps and metrics from the same sampler tick in one response.
     
-    return jsonify({
-        'status': 'healthy',
-        'timestamp': datetime.now().isoformat(),
-        'server': local_ip,
-        'hostname': hostname,
-        'platform': platform.system(),
-        'platform_version': platform.version(),
-        'python_version': platform.python_version(),
-        'architecture': platform.architecture()[0]
-    })
+    ?fields= selects what to return using dotted paths, e.g.
+    ?fields=health.hostname,apps.id,apps.status,metrics.cpu
+    """
+    snapshot = server_snapshot.latest
+    if snapshot is None:
+        metrics_sampler.get_snapshot()
+        snapshot = server_snapshot.latest
+    if snapshot is None:
+        return jsonify({'error': 'Snapshot not yet available', 'timestamp': datetime.now().isoformat()}), 503
+    
+    snapshot = dict(snapshot)
+    server_ip = request.host.split(':')[0]  # Current request IP
+    snapshot['apps'] = [dict(app, server_ip=server_ip) for app in snapshot['apps']]
+    
+    fields = request.args.get('fields')
+    if fields:
+        tree = parse_fields(fields)
+        # Always keep what identifies the snapshot
+        tree.setdefault('tick', None)
+        tree.setdefault('timestamp', None)
+        snapshot = project(snapshot, tree)
+    
+    return jsonify(snapshot)
 
 @app.route('/api/system/metrics', methods=['GET'])
 def get_system_metrics():
-    """Get real-time system metrics"""
-    metrics = system_monitor.get_system_metrics()
+    """Get real-time system metrics from the latest sampler snapshot"""
+    snapshot = metrics_sampler.get_snapshot()
+    if snapshot is None:
+        return jsonify({'error': 'Metrics not yet available', 'timestamp': datetime.now().isoformat()}), 503
     
-    # Add running apps count
-    running_apps = len([app for app in app_manager.get_all_apps_status() if app['status'] == 'running'])
-    metrics['processes']['running_apps'] = running_apps
+    # Copy the parts we extend so the shared snapshot stays untouched
+    metrics = dict(snapshot)
+    
+    if 'processes' in metrics:
+        # Add running apps count from the lifecycle state index
+        metrics['processes'] = dict(metrics['processes'], running_apps=app_manager.running_count())
     
     return jsonify(metrics)
 
+@app.route('/api/system/metrics/history', methods=['GET'])
+def get_metrics_history():
+    """Get downsampled metrics history, e.g. ?series=host.cpu.percent&window=1h&step=1m
+    
+    Served from memory when the window is covered by the in-memory buffer,
+    otherwise (or with ?source=disk) from the on-disk store's rollup tiers.
+    """
+    source = request.args.get('source')
+    if source not in (None, 'memory', 'disk'):
+        return jsonify({'error': "source must be 'memory' or 'disk'"}), 400
+    tier = request.args.get('tier')
+    if tier is not None and tier not in metrics_store.tiers:
+        return jsonify({'error': f"tier must be one of {', '.join(metrics_store.tiers)}"}), 400
+    
+    series = [name for name in request.args.get('series', '').split(',') if name]
+    if not series:
+        # Without a selection, list what can be queried
+        if source == 'disk':
+            return jsonify({'series': metrics_store.series_names(tier)})
+        return jsonify({'series': metrics_history.series_names()})
+    
+    try:
+        window = parse_duration(request.args.get('window'), 3600)
+        step = parse_duration(request.args.get('step'))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid window or step: {e}'}), 400
+    
+    if source is None:
+        oldest = metrics_history.oldest_timestamp()
+        in_memory = oldest is not None and oldest <= time.time() - window
+        source = 'memory' if in_memory and tier is None else 'disk'
+    
+    if source == 'disk':
+        data, tier, step = metrics_store.query(series, window, step, tier)
+    else:
+        data = metrics_history.query(series, window, step)
+        step = metrics_history.effective_step(window, step)
+    
+    return jsonify({
+        'source': source,
+        'tier': tier if source == 'disk' else None,
+        'window': window,
+        'step': step,
+        'columns': ['timestamp', 'avg', 'min', 'max'],
+        'series': data
+    })
+
+@app.route('/api/stream', methods=['GET'])
+def stream_events():
+    """Server-sent event stream of metrics snapshots and app state changes.
+    
+    Query options: ?topics=metrics,apps,app_state (default: all) and
+    ?min_interval=<seconds> to cap how often snapshots are delivered.
+    """
+    topics = None
+    if request.args.get('topics'):
+        topics = set(request.args['topics'].split(','))
+        unknown = topics - set(STREAM_TOPICS)
+        if unknown:
+            return jsonify({'error': f"Unknown topics: {', '.join(sorted(unknown))}"}), 400
+    try:
+        min_interval = parse_duration(request.args.get('min_interval'), 0.0)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid min_interval: {e}'}), 400
+    
+    subscriber = event_broadcaster.subscribe(topics, min_interval)
+    if subscriber is None:
+        return jsonify({'error': 'Too many stream clients'}), 503
+    
+    def generate():
+        try:
+            # Tell EventSource how long to wait before reconnecting
+            yield b'retry: 3000\n\n'
+            while True:
+                wait = subscriber.release_due()
+                timeout = STREAM_HEARTBEAT_INTERVAL if wait is None else min(wait, STREAM_HEARTBEAT_INTERVAL)
+                try:
+                    yield subscriber.queue.get(timeout=timeout)
+                except queue.Empty:
+                    if wait is None:
+                        # Comment line keeps proxies and idle connections open
+                        yield b': keep-alive\n\n'
+        finally:
+            event_broadcaster.unsubscribe(subscriber)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/api/apps', methods=['GET'])
 def get_all_apps():
-    """Get status of all applications"""
-    apps_status = app_manager.get_all_apps_status()
+    """Get status of all applications.
     
-    # Add server info to each app
-    try:
-        current_hostname = socket.gethostname()
-    except Exception:
-        current_hostname = platform.node()
+    Responses carry a strong ETag and honour If-None-Match. With
+    ?since=<version> only the apps and fields changed after that version
+    are returned (or the full list with 'full': true if it is too old).
+    The version and ETag only cover the stable fields: uptime and resources
+    change all the time, so they are returned but not versioned, and left
+    out of ?since deltas.
+    
+    Lean queries: ?fields=id,name,status (dotted paths allowed),
+    ?status=running|stopped and ?resources=false are pushed down into the
+    app manager so unrequested data is never computed.
+    """
+    fields = parse_fields(request.args['fields']) if request.args.get('fields') else None
+    status_filter = request.args.get('status')
+    if status_filter not in (None, 'running', 'stopped'):
+        return jsonify({'error': "status must be 'running' or 'stopped'"}), 400
+    include_resources = request.args.get('resources', 'true').lower() not in ('false', '0', 'no')
+    lean = fields is not None or status_filter is not None or not include_resources
+    since = request.args.get('since')
+    if lean and since is not None:
+        return jsonify({'error': 'since cannot be combined with fields, status or resources'}), 400
+    
+    apps_status = app_manager.get_all_apps_status(fields, status_filter, include_resources)
+    server_ip = request.host.split(':')[0]  # Current request IP
+    
+    if lean:
+        # Only add server info if it was asked for
+        if fields is None or 'server_hostname' in fields or 'server_ip' in fields:
+            server_info = get_server_info()
+            for app in apps_status:
+                if fields is None or 'server_hostname' in fields:
+                    app['server_hostname'] = server_info['hostname']
+                if fields is None or 'server_ip' in fields:
+                    app['server_ip'] = server_ip
+        body = json.dumps(apps_status, sort_keys=True)
+        etag = f"apps-lean-{hashlib.sha1(body.encode()).hexdigest()[:20]}"
+        if request_etag_matches(etag):
+            return not_modified(etag)
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        return response
     
     for app in apps_status:
         # Apps always show the current server hostname - they belong to this server
-        app['server_hostname'] = current_hostname
-        app['server_ip'] = request.host.split(':')[0]  # Current request IP
+        app['server_hostname'] = get_server_info()['hostname']
     
-    return jsonify(apps_status)
+    # Volatile fields would bump the version (and ETag) on every request
+    stable = [{field: value for field, value in app.items() if field not in VOLATILE_APP_FIELDS}
+              for app in apps_status]
+    version = apps_versions.update({app['id']: app for app in stable})
+    # server_ip depends on the request, so it is part of the representation
+    etag = f"apps-{version}-{since or 'full'}-{zlib.crc32(server_ip.encode()):08x}"
+    if request_etag_matches(etag):
+        return not_modified(etag)
+    
+    if since is not None:
+        delta = apps_versions.delta(since)
+        if delta is None:
+            delta = {'version': version, 'since': since, 'full': True, 'changed': stable, 'removed': []}
+        for app in delta['changed']:
+            app['server_ip'] = server_ip
+        return json_with_etag(delta, etag)
+    
+    for app in apps_status:
+        app['server_ip'] = server_ip
+    response = json_with_etag(apps_status, etag)
+    response.headers['X-State-Version'] = version
+    return response
 
 @app.route('/api/apps/<app_id>', methods=['GET'])
 def get_app_status(app_id):
@@ -691,6 +4466,278 @@ def get_app_status(app_id):
         return jsonify(status), 404
     return jsonify(status)
 
+@app.route('/api/apps/<app_id>/launches', methods=['GET'])
+def get_app_launches(app_id):
+    """Startup timings (first output, port open, HTTP ok, ready) of an app's recent launches"""
+    if app_id not in app_configs:
+        return jsonify({'success': False, 'error': 'App not found'}), 404
+    return jsonify({
+        'app_id': app_id,
+        'readiness': app_manager.readiness.get(app_id),
+        'launches': app_manager.launch_history(app_id)
+    })
+
+def format_log_page(app_id, page):
+    """JSON representation of a LogStore.read() page"""
+    return {
+        'app_id': app_id,
+        'offset': page['offset'],
+        'next_offset': page['next_offset'],
+        'skipped': page['skipped'],
+        'start_offset': page['start_offset'],
+        'end_offset': page['end_offset'],
+        'lines': [
+            {
+                'offset': offset,
+                'stream': stream,
+                'timestamp': datetime.fromtimestamp(timestamp).isoformat() if timestamp else None,
+                'text': data.decode('utf-8', 'replace')
+            }
+            for offset, stream, timestamp, data in page['lines']
+        ]
+    }
+
+def parse_log_position(value, name):
+    if value is None or value == '':
+        return None
+    position = int(value)
+    if position < 0:
+        raise ValueError(f'{name} must not be negative')
+    return position
+
+@app.route('/api/apps/<app_id>/logs', methods=['GET'])
+def get_app_logs(app_id):
+    """Read an app's captured output by byte offset.
+    
+    ?offset=<n> returns whole lines starting at that logical offset (default:
+    the tail of the log), ?limit=<bytes> caps the page size. Use next_offset
+    of a page as the offset of the next request.
+    """
+    if app_id not in app_configs:
+        return jsonify({'error': 'App not found'}), 404
+    try:
+        offset = parse_log_position(request.args.get('offset'), 'offset')
+        limit = parse_log_position(request.args.get('limit'), 'limit') or LOG_DEFAULT_READ_BYTES
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    page = app_manager.log_store.read(app_id, offset, min(limit, LOG_MAX_READ_BYTES))
+    return jsonify(format_log_page(app_id, page))
+
+@app.route('/api/apps/<app_id>/logs/stream', methods=['GET'])
+def stream_app_logs(app_id):
+    """Follow an app's output as server-sent events.
+    
+    Starts at ?offset=<n>, the Last-Event-ID sent by a reconnecting
+    EventSource, or the tail of the log. Each 'log' event carries a page of
+    lines and uses its next_offset as the event id, so clients resume
+    exactly where they left off.
+    """
+    if app_id not in app_configs:
+        return jsonify({'error': 'App not found'}), 404
+    try:
+        offset = parse_log_position(request.headers.get('Last-Event-ID'), 'Last-Event-ID')
+        if offset is None:
+            offset = parse_log_position(request.args.get('offset'), 'offset')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    log_store = app_manager.log_store
+    if not log_store.acquire_follower():
+        return jsonify({'error': 'Too many log followers'}), 503
+    log = log_store.get(app_id)
+    
+    def generate():
+        position = offset
+        try:
+            yield b'retry: 3000\n\n'
+            while True:
+                page = log_store.read(app_id, position, LOG_DEFAULT_READ_BYTES)
+                if page['lines'] or page['skipped']:
+                    position = page['next_offset']
+                    payload = json.dumps(format_log_page(app_id, page))
+                    yield f"id: {position}\nevent: log\ndata: {payload}\n\n".encode()
+                    continue
+                position = page['next_offset']
+                if not log.wait(position, STREAM_HEARTBEAT_INTERVAL):
+                    yield b': keep-alive\n\n'
+        finally:
+            log_store.release_follower()
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def parse_time_bound(value):
+    """Epoch seconds, an ISO timestamp or a duration before now such as '30m'"""
+    if value is None or value == '':
+        return None
+    try:
+        number = float(value)
+        if number >= 1e9:
+            return number
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return time.time() - parse_duration(value)
+
+@app.route('/api/logs/search', methods=['GET'])
+def search_logs():
+    """Search the captured output of all apps.
+    
+    ?q= is a set of words that must all appear in a line (case-insensitive;
+    a query without any word of two or more letters, digits or underscores
+    is matched as a substring) or, with ?regex=true, a regular expression. Optional filters: ?app=a,b,
+    ?from= and ?to= (epoch seconds, ISO time or a duration ago such as 2h)
+    and ?level=warning. Matches stream back as NDJSON, at most ?limit= per
+    page, followed by a summary line whose next_cursor continues the search
+    via ?cursor=.
+    """
+    query = request.args.get('q', '')
+    use_regex = request.args.get('regex', 'false').lower() in ('true', '1', 'yes')
+    try:
+        since = parse_time_bound(request.args.get('from'))
+        until = parse_time_bound(request.args.get('to'))
+        limit = min(int(request.args.get('limit', LOG_SEARCH_DEFAULT_LIMIT)), LOG_SEARCH_MAX_LIMIT)
+        level = request.args.get('level')
+        levels = {name: number for number, name in LOG_LEVEL_NAMES.items()}
+        min_level = 0 if not level else levels[level.lower()] if level.lower() in levels else int(level)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {e}'}), 400
+    if limit <= 0:
+        return jsonify({'error': 'limit must be positive'}), 400
+    
+    try:
+        matches, tokens = compile_log_query(query, use_regex)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if request.args.get('app'):
+        app_ids = sorted(set(request.args['app'].split(',')))
+        unknown = [app_id for app_id in app_ids if app_id not in app_configs]
+        if unknown:
+            return jsonify({'error': f"Unknown apps: {', '.join(unknown)}"}), 404
+    else:
+        app_ids = sorted(app_configs.keys())
+    
+    cursor_app, cursor_offset = None, 0
+    if request.args.get('cursor'):
+        try:
+            cursor_app, cursor_offset = request.args['cursor'].rsplit(':', 1)
+            cursor_offset = int(cursor_offset)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        app_ids = [app_id for app_id in app_ids if app_id >= cursor_app]
+    
+    log_store = app_manager.log_store
+    
+    def generate():
+        stats = {}
+        found = 0
+        next_cursor = None
+        for app_id in app_ids:
+            offset = cursor_offset if app_id == cursor_app else 0
+            for position, hit in log_store.search(app_id, matches, tokens, since, until, min_level, offset, stats):
+                if hit is not None:
+                    line_offset, stream, timestamp, line_level, data = hit
+                    found += 1
+                    yield json.dumps({
+                        'app_id': app_id,
+                        'offset': line_offset,
+                        'timestamp': datetime.fromtimestamp(timestamp).isoformat() if timestamp else None,
+                        'level': LOG_LEVEL_NAMES.get(line_level),
+                        'stream': stream,
+                        'text': data.decode('utf-8', 'replace')
+                    }) + '\n'
+                if found >= limit or stats['bytes_scanned'] >= LOG_SEARCH_MAX_SCAN_BYTES:
+                    next_cursor = f"{app_id}:{position}"
+                    break
+            if next_cursor:
+                break
+        yield json.dumps(dict(stats, matches=found, done=next_cursor is None, next_cursor=next_cursor)) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/apps/batch', methods=['POST'])
+def batch_apps():
+    """Start, stop or restart many apps concurrently.
+    
+    The body is {action, app_ids, max_parallel}; app_ids defaults to every
+    configured app. Each app's result is streamed back as an NDJSON line as
+    soon as it is done, followed by a summary line, which has success false
+    and an error if the batch itself failed.
+    """
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    if action not in ('start', 'stop', 'restart'):
+        return jsonify({'success': False, 'error': 'action must be start, stop or restart'}), 400
+    
+    app_ids = data.get('app_ids')
+    if app_ids is None:
+        app_ids = list(app_configs.keys())
+    if not isinstance(app_ids, list) or not all(isinstance(app_id, str) for app_id in app_ids):
+        return jsonify({'success': False, 'error': 'app_ids must be a list of app ids'}), 400
+    app_ids = list(dict.fromkeys(app_ids))
+    unknown = [app_id for app_id in app_ids if app_id not in app_configs]
+    if unknown:
+        return jsonify({'success': False, 'error': f"Unknown apps: {', '.join(unknown)}"}), 404
+    
+    try:
+        max_parallel = int(data.get('max_parallel', BATCH_DEFAULT_PARALLEL))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'max_parallel must be an integer'}), 400
+    if max_parallel <= 0:
+        return jsonify({'success': False, 'error': 'max_parallel must be positive'}), 400
+    max_parallel = min(max_parallel, BATCH_MAX_PARALLEL)
+    
+    try:
+        dependency_levels(app_configs, app_ids, include_dependencies=action == 'start')
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    
+    results = queue.Queue()
+    started = time.monotonic()
+    errors = []
+    
+    def finished(future):
+        if future.cancelled():
+            errors.append('Batch was cancelled')
+        elif future.exception() is not None:
+            logger.error(f"Batch {action} failed: {future.exception()}")
+            errors.append(str(future.exception()) or type(future.exception()).__name__)
+        results.put(None)
+    
+    batch = app_manager.supervisor.submit(app_manager.batch_async(action, app_ids, max_parallel, results.put))
+    batch.add_done_callback(finished)
+    
+    def generate():
+        succeeded = failed = 0
+        while True:
+            result = results.get()
+            if result is None:
+                break
+            if result['success']:
+                succeeded += 1
+            else:
+                failed += 1
+            yield json.dumps(result) + '\n'
+        summary = {
+            'done': True,
+            'success': not failed and not errors,
+            'action': action,
+            'succeeded': succeeded,
+            'failed': failed,
+            'elapsed': round(time.monotonic() - started, 3)
+        }
+        if errors:
+            summary['error'] = errors[0]
+        yield json.dumps(summary) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/api/apps/<app_id>/start', methods=['POST'])
 def start_app(app_id):
     """Start an application"""
@@ -707,19 +4754,37 @@ def stop_app(app_id):
 
 @app.route('/api/apps/<app_id>/restart', methods=['POST'])
 def restart_app(app_id):
-    """Restart an application"""
-    # Stop first
-    stop_result = app_manager.stop_app(app_id)
-    if not stop_result['success'] and 'not running' not in stop_result.get('error', ''):
-        return jsonify(stop_result), 400
+    """Restart an application asynchronously.
+    
+    Returns 202 with an operation id right away. The restart stops the app,
+    waits for its whole process tree to exit and its port to be released,
+    then starts it; follow it via /api/operations/<id> or the 'operations'
+    topic of /api/stream.
+    """
+    if app_id not in app_configs:
+        return jsonify({'success': False, 'error': 'App not found'}), 404
     
-    # Wait a moment for cleanup
-    time.sleep(2)
+    operation = operations.create('restart', app_id)
+    app_manager.supervisor.submit(operations.execute(
+        operation['id'], lambda report: app_manager.restart_app_async(app_id, report)))
     
-    # Start again
-    start_result = app_manager.start_app(app_id)
-    status_code = 200 if start_result['success'] else 400
-    return jsonify(start_result), status_code
+    response = jsonify({'success': True, 'operation_id': operation['id'], 'operation': operation})
+    response.status_code = 202
+    response.headers['Location'] = f"/api/operations/{operation['id']}"
+    return response
+
+@app.route('/api/operations', methods=['GET'])
+def list_operations():
+    """Recent asynchronous operations, optionally filtered by ?app=<id>"""
+    return jsonify(operations.list(request.args.get('app')))
+
+@app.route('/api/operations/<operation_id>', methods=['GET'])
+def get_operation(operation_id):
+    """Status of an asynchronous operation"""
+    operation = operations.get(operation_id)
+    if operation is None:
+        return jsonify({'error': 'Operation not found'}), 404
+    return jsonify(operation)
 
 @app.route('/api/apps/<app_id>/test', methods=['GET'])
 def test_app_config(app_id):
@@ -734,20 +4799,11 @@ def test_app_config(app_id):
     try:
         if config.get('type') == 'executable':
             cmd = [config['path']] + config.get('args', [])
-        elif config.get('type') == 'conda' or config.get('environment'):
-            if os.name == 'nt':
-                conda_cmd = 'conda.exe'
-                python_cmd = 'python.exe'
-            else:
-                conda_cmd = 'conda'
-                python_cmd = 'python'
-            
-            if config['environment'] and config['environment'] != 'base':
-                cmd = [conda_cmd, 'run', '-n', config['environment'], python_cmd, config['path']]
-            else:
-                cmd = [python_cmd, config['path']]
+        elif config.get('type') in ('conda', 'venv') or config.get('environment'):
+            cmd = app_manager._python_command(config, working_dir)[0]
         else:
-            cmd = ['python', config['path']]
+            venv = environment_resolver.resolve(None, working_dir)
+            cmd = [venv['python'] if venv else 'python', config['path']]
         
         # Check if working directory exists
         working_dir_exists = os.path.exists(working_dir)
@@ -773,11 +4829,24 @@ def signal_handler(sig, frame):
     """Handle shutdown signals gracefully"""
     logger.info('Shutting down server...')
     
-    # Stop all running applications
-    for app_id in list(app_manager.processes.keys()):
-        logger.info(f'Stopping {app_id}...')
-        app_manager.stop_app(app_id)
+    # Stop watching the config file and write any pending changes
+    config_store.stop()
     
+    # Stop all running applications concurrently, bounded by one deadline
+    try:
+        results = app_manager.stop_all(SHUTDOWN_TIMEOUT)
+        for app_id, result in results.items():
+            if not result['success']:
+                logger.warning(f"Could not stop {app_id}: {result.get('error')}")
+    except Exception as e:
+        # Still flush the stores below, whatever happened to the apps
+        logger.error(f"Failed to stop all apps within {SHUTDOWN_TIMEOUT}s: {e!r}")
+    finally:
+        process_supervisor.stop()
+        metrics_sampler.stop()
+        metrics_store.stop()
+        log_store.stop()
+        system_monitor.gpu_collector.shutdown()
     sys.exit(0)
 
 # Register signal handlers for graceful shutdown
@@ -786,8 +4855,28 @@ signal.signal(signal.SIGTERM, signal_handler)
 
 @app.route('/api/apps/config', methods=['GET'])
 def get_app_configs():
-    """Get all app configurations"""
-    return jsonify(app_configs)
+    """Get all app configurations (supports If-None-Match and ?since=<version>)"""
+    version = config_versions.update(app_configs)
+    since = request.args.get('since')
+    etag = f"config-{version}-{since or 'full'}"
+    if request_etag_matches(etag):
+        return not_modified(etag)
+    
+    if since is not None:
+        delta = config_versions.delta(since)
+        if delta is None:
+            delta = {
+                'version': version,
+                'since': since,
+                'full': True,
+                'changed': [dict(config, id=app_id) for app_id, config in app_configs.items()],
+                'removed': []
+            }
+        return json_with_etag(delta, etag)
+    
+    response = json_with_etag(app_configs, etag)
+    response.headers['X-State-Version'] = version
+    return response
 
 @app.route('/api/apps/config', methods=['POST'])
 def add_app_config():
@@ -809,13 +4898,17 @@ def add_app_config():
             if field not in config:
                 return jsonify({'success': False, 'error': f'Missing required field: {field}'}), 400
         
+        error = dependency_error(dict(app_configs, **{app_id: config}))
+        if error is not None:
+            return jsonify({'success': False, 'error': error[1]}), 400
+        
         # Automatically set the server where this app was created
         try:
             config['created_on_server'] = socket.gethostname()
         except Exception:
             config['created_on_server'] = platform.node()
         
-        app_configs[app_id] = config
+        update_app_configs({app_id: config})
         
         # Save configurations to file
         save_app_configs()
@@ -835,12 +4928,20 @@ def remove_app_config(app_id):
         if app_id not in app_configs:
             return jsonify({'success': False, 'error': 'App not found'}), 404
         
+        dependents = [other for other, config in app_configs.items()
+                      if other != app_id and app_id in app_dependencies(config)]
+        if dependents:
+            return jsonify({'success': False, 'error': f"App is a dependency of: {', '.join(dependents)}"}), 409
+        
         # Stop the app if it's running
-        if app_id in running_processes:
-            stop_app(app_id)
+        if app_manager.is_process_running(app_id):
+            app_manager.stop_app(app_id)
         
         app_name = app_configs[app_id]['name']
-        del app_configs[app_id]
+        update_app_configs(removed=[app_id])
+        app_manager.forget_app(app_id)
+        metrics_history.drop_series(f"app.{app_id}.")
+        metrics_store.drop_series(f"app.{app_id}.")
         
         # Save configurations to file
         save_app_configs()
@@ -853,74 +4954,97 @@ def remove_app_config(app_id):
         logger.error(f"Error removing app config: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+APP_TEMPLATES = {
+    'generic': {
+        'name': 'Generic Application',
+        'description': 'Custom application with configurable settings',
+        'type': 'conda',
+        'port': 7860,
+        'defaultPath': 'app.py',
+        'defaultArgs': [],
+        'outputFolder': 'outputs',
+        'environment': ''
+    },
+    'comfyui': {
+        'name': 'ComfyUI',
+        'description': 'UI for Stable Diffusion - Portable Windows Version',
+        'type': 'executable',
+        'port': 8188,
+        'defaultPath': 'python_embeded/python.exe',
+        'defaultArgs': ['ComfyUI/main.py', '--windows-standalone-build', '--fast', '--listen', '--enable-cors-header'],
+        'outputFolder': 'ComfyUI/output',
+        'environment': None,
+        'autoConfigurable': True,
+        'setupInstructions': 'Only specify the ComfyUI_windows_portable folder path. All other settings will be configured automatically.'
+    },
+    'chatterbox': {
+        'name': 'Chatterbox',
+        'description': 'AI Chatbot Application',
+        'type': 'conda',
+        'port': 5000,
+        'defaultPath': 'comprehensive_rebuild.py',
+        'defaultArgs': [],
+        'outputFolder': 'outputs',
+        'environment': 'chatterbox-cuda'
+    },
+    'swarmui': {
+        'name': 'SwarmUI',
+        'description': 'Swarm UI for Stable Diffusion',
+        'type': 'executable',
+        'port': 7801,
+        'defaultPath': 'launch-windows.bat',
+        'defaultArgs': [],
+        'outputFolder': 'Output',
+        'environment': None
+    },
+    'automatic1111': {
+        'name': 'Automatic1111',
+        'description': 'Web UI for Stable Diffusion',
+        'type': 'executable',
+        'port': 7860,
+        'defaultPath': 'webui-user.bat',
+        'defaultArgs': [],
+        'outputFolder': 'outputs',
+        'environment': None
+    },
+    'invokeai': {
+        'name': 'InvokeAI',
+        'description': 'InvokeAI Stable Diffusion Toolkit',
+        'type': 'conda',
+        'port': 9090,
+        'defaultPath': 'scripts/invokeai-web.py',
+        'defaultArgs': [],
+        'outputFolder': 'outputs',
+        'environment': 'invokeai'
+    }
+}
+
+# Templates never change at runtime, so their ETag is computed once
+APP_TEMPLATES_ETAG = f"templates-{zlib.crc32(json.dumps(APP_TEMPLATES, sort_keys=True).encode()):08x}"
+
 @app.route('/api/apps/templates', methods=['GET'])
 def get_app_templates():
     """Get popular app templates"""
-    templates = {
-        'generic': {
-            'name': 'Generic Application',
-            'description': 'Custom application with configurable settings',
-            'type': 'conda',
-            'port': 7860,
-            'defaultPath': 'app.py',
-            'defaultArgs': [],
-            'outputFolder': 'outputs',
-            'environment': ''
-        },
-        'comfyui': {
-            'name': 'ComfyUI',
-            'description': 'UI for Stable Diffusion - Portable Windows Version',
-            'type': 'executable',
-            'port': 8188,
-            'defaultPath': 'python_embeded/python.exe',
-            'defaultArgs': ['ComfyUI/main.py', '--windows-standalone-build', '--fast', '--listen', '--enable-cors-header'],
-            'outputFolder': 'ComfyUI/output',
-            'environment': None,
-            'autoConfigurable': True,
-            'setupInstructions': 'Only specify the ComfyUI_windows_portable folder path. All other settings will be configured automatically.'
-        },
-        'chatterbox': {
-            'name': 'Chatterbox',
-            'description': 'AI Chatbot Application',
-            'type': 'conda',
-            'port': 5000,
-            'defaultPath': 'comprehensive_rebuild.py',
-            'defaultArgs': [],
-            'outputFolder': 'outputs',
-            'environment': 'chatterbox-cuda'
-        },
-        'swarmui': {
-            'name': 'SwarmUI',
-            'description': 'Swarm UI for Stable Diffusion',
-            'type': 'executable',
-            'port': 7801,
-            'defaultPath': 'launch-windows.bat',
-            'defaultArgs': [],
-            'outputFolder': 'Output',
-            'environment': None
-        },
-        'automatic1111': {
-            'name': 'Automatic1111',
-            'description': 'Web UI for Stable Diffusion',
-            'type': 'executable',
-            'port': 7860,
-            'defaultPath': 'webui-user.bat',
-            'defaultArgs': [],
-            'outputFolder': 'outputs',
-            'environment': None
-        },
-        'invokeai': {
-            'name': 'InvokeAI',
-            'description': 'InvokeAI Stable Diffusion Toolkit',
-            'type': 'conda',
-            'port': 9090,
-            'defaultPath': 'scripts/invokeai-web.py',
-            'defaultArgs': [],
-            'outputFolder': 'outputs',
-            'environment': 'invokeai'
-        }
-    }
-    return jsonify(templates)
+    if request_etag_matches(APP_TEMPLATES_ETAG):
+        return not_modified(APP_TEMPLATES_ETAG)
+    return json_with_etag(APP_TEMPLATES, APP_TEMPLATES_ETAG)
+
+@app.route('/api/environments', methods=['GET'])
+def list_environments():
+    """Python environments apps can run in: conda environments plus the venvs of configured apps"""
+    environments = environment_resolver.conda_environments()
+    seen = {env['prefix'] for env in environments}
+    for config in list(app_configs.values()):
+        working_dir = config.get('working_dir') or os.path.dirname(config.get('path', ''))
+        env = environment_resolver.resolve(config.get('environment'), working_dir)
+        if env is not None and env['prefix'] not in seen:
+            seen.add(env['prefix'])
+            environments.append(env)
+    
+    etag = f"envs-{zlib.crc32(json.dumps(environments, sort_keys=True).encode()):08x}"
+    if request_etag_matches(etag):
+        return not_modified(etag)
+    return json_with_etag(environments, etag)
 
 @app.route('/api/apps/<app_id>/config', methods=['GET'])
 def get_app_config(app_id):
@@ -955,19 +5079,20 @@ def update_app_config(app_id):
             if field not in config:
                 return jsonify({'success': False, 'error': f'Missing required field: {field}'}), 400
         
+        error = dependency_error(dict(app_configs, **{app_id: dict(app_configs[app_id], **config)}))
+        if error is not None:
+            return jsonify({'success': False, 'error': error[1]}), 400
+        
         # Update the configuration
-        app_configs[app_id].update(config)
+        update_app_configs({app_id: dict(app_configs[app_id], **config)})
         
         # If app is running, stop it since config changed
-        if app_id in running_processes:
-            try:
-                process = running_processes[app_id]
-                if process.poll() is None:  # Process is still running
-                    process.terminate()
-                    del running_processes[app_id]
-                    logger.info(f"Stopped {app_id} due to config update")
-            except Exception as e:
-                logger.warning(f"Error stopping {app_id} after config update: {e}")
+        if app_manager.is_process_running(app_id):
+            result = app_manager.stop_app(app_id)
+            if result['success']:
+                logger.info(f"Stopped {app_id} due to config update")
+            else:
+                logger.warning(f"Error stopping {app_id} after config update: {result.get('error')}")
         
         # Save configurations to file
         save_app_configs()
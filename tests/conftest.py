@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# app_manager keeps apps_config.json, logs/ and metrics_store/ in the working
+# directory and sets them up on import, so the tests run in a scratch directory
+os.chdir(tempfile.mkdtemp(prefix='app_manager_tests_'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
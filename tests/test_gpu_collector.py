@@ -0,0 +1,196 @@
+"""GpuCollector against a stubbed pynvml module"""
+import sys
+import types
+from types import SimpleNamespace
+
+import pytest
+
+import app_manager
+
+
+class NVMLError(Exception):
+    def __init__(self, value):
+        super().__init__(f"NVML error {value}")
+        self.value = value
+
+
+class FakeNvml(types.ModuleType):
+    """Just enough of pynvml for GpuCollector, recording how it is called"""
+    
+    NVML_TEMPERATURE_GPU = 0
+    NVML_CLOCK_GRAPHICS = 0
+    NVML_CLOCK_SM = 1
+    NVML_CLOCK_MEM = 2
+    NVML_ERROR_NOT_FOUND = 6
+    NVML_ERROR_GPU_IS_LOST = 15
+    
+    def __init__(self, devices):
+        super().__init__('pynvml')
+        # Per device: compute/graphics as [(pid, bytes)], samples as [(pid, timestamp, sm)]
+        self.devices = devices
+        self.failing = False
+        self.init_calls = 0
+        self.shutdown_calls = 0
+        self.process_calls = []
+        self.utilization_calls = []
+    
+    def nvmlInit(self):
+        self.init_calls += 1
+    
+    def nvmlShutdown(self):
+        self.shutdown_calls += 1
+    
+    def nvmlDeviceGetCount(self):
+        return len(self.devices)
+    
+    def nvmlDeviceGetHandleByIndex(self, index):
+        return (self.init_calls, index)
+    
+    def _device(self, handle):
+        session, index = handle
+        if self.failing or session != self.init_calls:
+            raise NVMLError(self.NVML_ERROR_GPU_IS_LOST)
+        return index, self.devices[index]
+    
+    def nvmlDeviceGetName(self, handle):
+        return f"Fake GPU {self._device(handle)[0]}".encode()
+    
+    def nvmlDeviceGetUUID(self, handle):
+        return f"GPU-{self._device(handle)[0]}"
+    
+    def nvmlDeviceGetUtilizationRates(self, handle):
+        self._device(handle)
+        return SimpleNamespace(gpu=50, memory=20)
+    
+    def nvmlDeviceGetMemoryInfo(self, handle):
+        self._device(handle)
+        return SimpleNamespace(used=4 << 30, total=16 << 30)
+    
+    def nvmlDeviceGetPowerUsage(self, handle):
+        return 100000
+    
+    def nvmlDeviceGetEnforcedPowerManagementLimit(self, handle):
+        return 300000
+    
+    def nvmlDeviceGetTemperature(self, handle, sensor):
+        return 60
+    
+    def nvmlDeviceGetClockInfo(self, handle, clock):
+        return 1500
+    
+    def _processes(self, handle, kind):
+        index, device = self._device(handle)
+        self.process_calls.append((index, kind))
+        return [SimpleNamespace(pid=pid, usedGpuMemory=memory) for pid, memory in device.get(kind, [])]
+    
+    def nvmlDeviceGetComputeRunningProcesses(self, handle):
+        return self._processes(handle, 'compute')
+    
+    def nvmlDeviceGetGraphicsRunningProcesses(self, handle):
+        return self._processes(handle, 'graphics')
+    
+    def nvmlDeviceGetProcessUtilization(self, handle, cursor):
+        index, device = self._device(handle)
+        self.utilization_calls.append((index, cursor))
+        samples = [SimpleNamespace(pid=pid, timeStamp=timestamp, smUtil=sm, memUtil=0, encUtil=0, decUtil=0)
+                   for pid, timestamp, sm in device.get('samples', []) if timestamp > cursor]
+        if not samples:
+            raise NVMLError(self.NVML_ERROR_NOT_FOUND)
+        return samples
+
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def fake_nvml(monkeypatch):
+    nvml = FakeNvml([
+        {
+            'compute': [(100, 512 * MB), (300, 256 * MB)],
+            'graphics': [(100, 512 * MB)],
+            'samples': [(100, 10, 40), (100, 20, 60)]
+        },
+        {
+            'compute': [(300, 768 * MB)],
+            'graphics': [(200, 1024 * MB)]
+        }
+    ])
+    monkeypatch.setitem(sys.modules, 'pynvml', nvml)
+    return nvml
+
+
+@pytest.fixture
+def collector(fake_nvml):
+    collector = app_manager.GpuCollector(streaming=False)
+    yield collector
+    collector.shutdown()
+
+
+def test_nvml_initialized_once_across_ticks(fake_nvml, collector):
+    assert collector.backend == 'pynvml'
+    for _ in range(3):
+        assert len(collector.collect()) == 2
+    assert fake_nvml.init_calls == 1
+
+
+def test_one_process_pass_builds_pid_map(fake_nvml, collector):
+    collector.collect()
+    
+    # Each list is read exactly once per device and tick
+    assert sorted(fake_nvml.process_calls) == [
+        (0, 'compute'), (0, 'graphics'), (1, 'compute'), (1, 'graphics')
+    ]
+    # A process on both lists of a device is counted once
+    assert collector.get_process_usage(100)['device'] == 0
+    assert collector.get_process_usage(100)['memory_mb'] == 512
+    assert collector.get_process_usage(200)['device'] == 1
+    assert collector.get_process_usage(200)['memory_mb'] == 1024
+    # A process spanning devices is attributed to the one it uses most
+    assert collector.get_process_usage(300)['device'] == 1
+    assert collector.get_process_usage(300)['memory_mb'] == 1024
+    assert collector.get_process_usage(999) is None
+
+
+def test_utilization_cursors_advance_per_device(fake_nvml, collector):
+    collector.collect()
+    assert collector.get_process_usage(100)['utilization_source'] == 'process'
+    assert collector.get_process_usage(100)['utilization_percent'] == 50
+    
+    fake_nvml.devices[0]['samples'].append((100, 30, 90))
+    collector.collect()
+    # Only the sample newer than the cursor is averaged on the second tick
+    assert collector.get_process_usage(100)['utilization_percent'] == 90
+    
+    collector.collect()
+    assert [call for call in fake_nvml.utilization_calls if call[0] == 0] == [(0, 0), (0, 20), (0, 30)]
+    # No new samples: the process was idle since the last tick
+    assert collector.get_process_usage(100)['utilization_percent'] == 0.0
+
+
+def test_reinit_after_nvml_errors(fake_nvml, collector, monkeypatch):
+    assert len(collector.collect()) == 2
+    
+    fake_nvml.failing = True
+    assert collector.collect() == []
+    assert fake_nvml.init_calls == 1
+    
+    # The session is restarted on the next tick and fresh handles are used
+    monkeypatch.setattr(app_manager, 'NVML_REINIT_INTERVAL', 0.0)
+    fake_nvml.failing = False
+    assert len(collector.collect()) == 2
+    assert fake_nvml.init_calls == 2
+    assert fake_nvml.shutdown_calls == 1
+    # Cursors of the old session are dropped
+    assert fake_nvml.utilization_calls[-2] == (0, 0)
+    
+    collector.collect()
+    assert fake_nvml.init_calls == 2
+
+
+def test_reinit_is_rate_limited(fake_nvml, collector, monkeypatch):
+    monkeypatch.setattr(app_manager, 'NVML_REINIT_INTERVAL', 3600.0)
+    fake_nvml.failing = True
+    collector.collect()
+    fake_nvml.failing = False
+    collector.collect()
+    assert fake_nvml.init_calls == 1
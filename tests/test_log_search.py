@@ -0,0 +1,151 @@
+"""LogStore search over the segment index, compared against a full scan"""
+import os
+
+import pytest
+
+import app_manager
+
+
+APP = 'web'
+WORDS = ['alpha', 'beta', 'gamma', 'delta', 'request', 'handled', 'cache', 'miss']
+
+
+def sample_lines():
+    lines = []
+    for i in range(400):
+        words = ' '.join(WORDS[(i * 7 + j) % len(WORDS)] for j in range(3))
+        level = ['INFO', 'DEBUG', 'WARNING', 'ERROR'][i % 4] if i % 5 else ''
+        lines.append(('stderr' if i % 3 == 0 else 'stdout', f"{level} {words} #{i}"))
+    lines[57] = ('stdout', 'INFO connecting foo_bar to upstream')
+    lines[211] = ('stderr', 'ERROR compiling with C++ failed')
+    lines[305] = ('stdout', 'x')
+    lines[333] = ('stdout', 'WARNING rare needle here')
+    return lines
+
+
+def write_lines(store, lines, start=1000.0):
+    """Write lines with timestamps start, start+1, ... the way the writer thread does"""
+    batch = []
+    offset = 0
+    for i, (stream, text) in enumerate(lines):
+        data = text.encode()
+        batch.append((APP, (offset, stream, start + i, data)))
+        offset += len(data) + 1
+    store._write_batch(batch)
+    store._close()
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    # Many blocks per segment, so pruning actually has something to skip
+    monkeypatch.setattr(app_manager, 'LOG_INDEX_BLOCK_BYTES', 512)
+
+
+@pytest.fixture
+def indexed(tmp_path):
+    store = app_manager.LogStore(str(tmp_path / 'indexed'))
+    write_lines(store, sample_lines())
+    return store
+
+
+@pytest.fixture
+def unindexed(tmp_path):
+    store = app_manager.LogStore(str(tmp_path / 'unindexed'))
+    write_lines(store, sample_lines())
+    app_dir = store._app_dir(APP)
+    for name in os.listdir(app_dir):
+        if not name.endswith('.log'):
+            os.remove(os.path.join(app_dir, name))
+    return store
+
+
+def search(store, query, regex=False, prune=True, since=None, until=None, min_level=0, offset=0, stats=None):
+    matches, tokens = app_manager.compile_log_query(query, regex)
+    return [hit for position, hit in store.search(APP, matches, tokens if prune else (), since, until,
+                                                  min_level, offset, stats)
+            if hit is not None]
+
+
+def texts(hits):
+    return [hit[4].decode() for hit in hits]
+
+
+@pytest.mark.parametrize('query, regex', [
+    ('alpha beta', False),
+    ('Request', False),
+    ('foo_bar', False),
+    ('needle', False),
+    ('x', False),
+    ('C++', False),
+    (r'\bfoo\_bar\b', True),
+    (r'\bcache miss\b', True),
+    (r'^error\b', True),
+    (r'#1\d\b', True),
+])
+def test_index_returns_the_same_hits_as_a_full_scan(indexed, unindexed, query, regex):
+    expected = search(unindexed, query, regex)
+    assert expected
+    assert texts(search(indexed, query, regex)) == texts(expected)
+    assert texts(search(indexed, query, regex, prune=False)) == texts(expected)
+
+
+def test_bloom_filters_skip_blocks_without_the_tokens(indexed):
+    stats = {}
+    assert texts(search(indexed, 'rare needle', stats=stats)) == ['WARNING rare needle here']
+    assert stats['blocks_skipped'] > 0
+    assert stats['blocks_scanned'] < stats['blocks_skipped']
+
+
+def test_segment_index_blooms_contain_every_line_token(indexed):
+    path = indexed._segment_path(APP, 0)
+    with open(path[:-len('.log')] + '.blocks', 'rb') as f:
+        blocks = f.read()
+    record_size = app_manager.LogSegmentIndex.RECORD_SIZE
+    with open(path, 'rb') as f:
+        segment = f.read()
+    for record in range(len(blocks) // record_size):
+        fields = app_manager.LogSegmentIndex.BLOCK.unpack_from(blocks, record * record_size)
+        start, end = fields[2], fields[3]
+        bloom = record * record_size + app_manager.LogSegmentIndex.BLOCK.size
+        for line in segment[start:end].splitlines():
+            assert indexed._bloom_contains(blocks, bloom, app_manager.log_tokens(line))
+
+
+@pytest.mark.parametrize('pattern, tokens', [
+    (r'\bfoo\_bar\b', {b'foo_bar'}),
+    (r'\bfoo\-bar\b', {b'foo', b'bar'}),
+    (r'error: \w+ failed$', {b'failed'}),
+    (r'\bconnect\d+\b', set()),
+    (r'foo|bar', set()),
+])
+def test_regex_required_tokens(pattern, tokens):
+    assert app_manager.regex_required_tokens(pattern) == tokens
+
+
+def test_empty_term_query_is_rejected():
+    with pytest.raises(ValueError):
+        app_manager.compile_log_query('  ')
+
+
+def test_time_and_level_filters(indexed):
+    lines = sample_lines()
+    hits = search(indexed, 'alpha', since=1100, until=1199.5, min_level=30)
+    expected = [text for i, (stream, text) in enumerate(lines)
+                if 100 <= i <= 199 and 'alpha' in text.split()
+                and app_manager.detect_log_level(text.encode()) >= 30]
+    assert expected
+    assert texts(hits) == expected
+    assert all(1100 <= hit[2] <= 1199.5 and hit[3] >= 30 for hit in hits)
+
+
+def test_cursor_resumes_after_the_last_hit(indexed):
+    everything = search(indexed, 'gamma')
+    matches, tokens = app_manager.compile_log_query('gamma')
+    first_page = []
+    for position, hit in indexed.search(APP, matches, tokens):
+        if hit is not None:
+            first_page.append(hit)
+            if len(first_page) == 10:
+                break
+    rest = search(indexed, 'gamma', offset=position)
+    assert texts(first_page + rest) == texts(everything)
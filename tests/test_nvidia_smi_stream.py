@@ -0,0 +1,156 @@
+"""NvidiaSmiStream and the nvidia-smi collector mode against a fake nvidia-smi on PATH"""
+import os
+import sys
+import time
+
+import pytest
+
+import app_manager
+
+FAKE_NVIDIA_SMI = '''#!{python}
+import datetime, os, sys, time
+args = sys.argv[1:]
+with open(os.environ['FAKE_SMI_LOG'], 'a') as log:
+    log.write(' '.join(args) + '\\n')
+query = next((arg for arg in args if arg.startswith('--query')), None)
+if query is None:
+    print('fake nvidia-smi')
+    sys.exit(0)
+loop_ms = next((int(arg.split('=')[1]) for arg in args if arg.startswith('--loop-ms=')), None)
+loops = int(os.environ.get('FAKE_SMI_LOOPS', '0'))
+
+def emit(loop):
+    stamp = datetime.datetime.now().strftime('%Y/%m/%d %H:%M:%S.%f') + ', ' if 'timestamp' in query else ''
+    if query.startswith('--query-gpu'):
+        for i in range(2):
+            print(f"{{stamp}}{{i}}, Fake {{loop}}, GPU-{{i}}, 50, 5, 1000, 8000, 60, 120.5, 300.0, 1500, 1500, 7000", flush=True)
+    else:
+        print(f"{{stamp}}4242, 700, GPU-1", flush=True)
+
+if loop_ms is None:
+    emit(0)
+    sys.exit(0)
+loop = 0
+while not loops or loop < loops:
+    emit(loop)
+    loop += 1
+    time.sleep(loop_ms / 1000)
+'''
+
+
+@pytest.fixture
+def fake_smi(tmp_path, monkeypatch):
+    """Put a fake nvidia-smi first on PATH; returns a function reading its invocations"""
+    script = tmp_path / 'nvidia-smi'
+    script.write_text(FAKE_NVIDIA_SMI.format(python=sys.executable))
+    script.chmod(0o755)
+    log = tmp_path / 'calls.log'
+    monkeypatch.setenv('PATH', f"{tmp_path}{os.pathsep}{os.environ.get('PATH', '')}")
+    monkeypatch.setenv('FAKE_SMI_LOG', str(log))
+    return lambda: log.read_text().splitlines() if log.exists() else []
+
+
+def wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        value = predicate()
+        if value:
+            return value
+        time.sleep(0.02)
+    raise AssertionError('condition not reached')
+
+
+def gpu_stream(loop_ms):
+    return app_manager.NvidiaSmiStream('query-gpu', app_manager.GpuCollector.SMI_GPU_FIELDS, loop_ms)
+
+
+def test_rows_are_grouped_into_batches_by_timestamp(fake_smi):
+    stream = gpu_stream(100)
+    try:
+        assert stream.start()
+        rows = wait_for(stream.rows)
+        # Both devices of one loop, timestamp stripped
+        assert [row.split(',')[0].strip() for row in rows] == ['0', '1']
+        assert len({row.split(',')[1] for row in rows}) == 1
+        
+        for _ in range(10):
+            rows = stream.rows()
+            assert len(rows) == 2 and len({row.split(',')[1] for row in rows}) == 1
+            time.sleep(0.03)
+    finally:
+        stream.stop()
+
+
+def test_rows_none_until_first_batch_is_complete(fake_smi):
+    stream = gpu_stream(2000)
+    try:
+        stream.start()
+        wait_for(lambda: stream._last_line_at)
+        # The first loop's rows are in but the batch is not known to be complete yet
+        assert stream.rows() is None
+        assert len(wait_for(stream.rows)) == 2
+    finally:
+        stream.stop()
+
+
+def test_stream_restarts_after_child_exits(fake_smi, monkeypatch):
+    monkeypatch.setenv('FAKE_SMI_LOOPS', '3')
+    stream = gpu_stream(100)
+    stream.RESTART_BACKOFF = 0.0
+    try:
+        stream.start()
+        first = stream._process
+        wait_for(stream.rows)
+        wait_for(lambda: first.poll() is not None)
+        assert stream.rows() is None
+        
+        assert stream.start()
+        assert stream._process is not first
+        # A restarted stream reports nothing until its own first batch is complete
+        assert stream.rows() is None
+        assert len(wait_for(stream.rows)) == 2
+    finally:
+        stream.stop()
+
+
+def test_collector_falls_back_to_one_shot_query_while_stream_restarts(fake_smi, monkeypatch):
+    monkeypatch.setenv('FAKE_SMI_LOOPS', '3')
+    monkeypatch.setattr(app_manager.NvidiaSmiStream, 'RESTART_BACKOFF', 0.0)
+    monkeypatch.delitem(sys.modules, 'pynvml', raising=False)
+    monkeypatch.setattr('builtins.__import__', _without_pynvml(__import__))
+    collector = app_manager.GpuCollector(streaming=True, loop_ms=100)
+    try:
+        assert collector.backend == 'nvidia-smi'
+        
+        # Right after startup the stream has no complete batch; the one-shot
+        # query fills in, so GPU processes never show up without memory
+        devices = collector.collect()
+        assert [device['index'] for device in devices] == [0, 1]
+        assert collector.get_process_usage(4242)['memory_mb'] == 700
+        assert collector.get_process_usage(4242)['device'] == 1
+        one_shot = [call for call in fake_smi() if '--loop-ms' not in call and '--query' in call]
+        assert len(one_shot) == 2
+        
+        first = collector._device_stream._process
+        wait_for(lambda: first.poll() is not None)
+        monkeypatch.setenv('FAKE_SMI_LOOPS', '0')  # restarted streams keep running
+        assert len(collector.collect()) == 2
+        assert collector._device_stream._process is not first
+        assert collector.get_process_usage(4242)['memory_mb'] == 700
+        
+        # Once the restarted streams have a batch no more processes are spawned
+        wait_for(lambda: collector._device_stream.rows() and collector._process_stream.rows())
+        calls = len(fake_smi())
+        for _ in range(3):
+            assert len(collector.collect()) == 2
+        assert len(fake_smi()) == calls
+    finally:
+        collector.shutdown()
+
+
+def _without_pynvml(real_import):
+    def guarded_import(name, *args, **kwargs):
+        if name == 'pynvml':
+            raise ImportError('pynvml hidden for this test')
+        return real_import(name, *args, **kwargs)
+    return guarded_import